@@ -2,42 +2,123 @@
 # encoding: utf-8
 
 import argparse
+import json
+import logging
 import requests
 import time
 
+from collections import OrderedDict
 from contextlib import contextmanager
 
 from requests import ConnectionError, ConnectTimeout
 from subprocess import run, PIPE, CalledProcessError
 
-try:
-    IP = run('docker-machine ip', shell=True, stdout=PIPE, check=True).stdout.strip().decode()
-except CalledProcessError:
-    print('Failed to get docker-machine IP address. Canceling simulation.')
-    exit(1)
+from simulation import scenario_matrix
+from simulation.load_generator import CLOSED_LOOP, OPEN_LOOP, LoadGenerator, run_load_test, summarize
 
-SETTINGS_URL = f"http://{IP}/settings"
-HOME_URL = f"http://{IP}"
 HEADERS = {
     'Authorization': 'Token 0x123'
 }
 
 
 parser = argparse.ArgumentParser(description='Run an outage simulation')
-parser.add_argument('simulation_type', choices=['ideal', 'performance', 'outage'],
-                    help='The type of simulation to run')
+parser.add_argument('simulation_type', choices=list(scenario_matrix.SCENARIOS) + ['matrix'],
+                    help='The type of simulation to run, or "matrix" to run every type with each '
+                         'set of resilience settings in turn')
 parser.add_argument('--retries', action='store_true', default=False,
                     help='Retry connection failures using "full-jitter" exponential backoff')
+parser.add_argument('--retry-budget', action='store', default=None,
+                    help='Only retry while retries stay under the specified fraction of successful '
+                         'requests (requires --retries)')
+parser.add_argument('--hedged-requests', action='store_true', default=False,
+                    help='Send a second request to the recommendations service when the first is '
+                         'slower than the 95th percentile')
+parser.add_argument('--response-cache', action='store_true', default=False,
+                    help='Cache upstream responses, and serve stale ones while revalidating them')
+parser.add_argument('--bulkheads', action='store', default=None,
+                    help='Fail fast instead of making more than the specified number of concurrent '
+                         'requests to each upstream service')
 parser.add_argument('--timeout', action='store', default=60,  # 60s is like having no timeout
                     help='Timeout connections after the specified number of seconds')
 parser.add_argument('--circuit-breakers', action='store_true', default=False,
                     help='Wrap connections in a circuit breaker')
-parser.add_argument('--home-url', default=HOME_URL,
-                    help='The URL to use when requesting the home page service')
-parser.add_argument('--settings-url', default=SETTINGS_URL,
-                    help='The URL of the settings API')
-parser.add_argument('--duration', default=10,
+parser.add_argument('--shared-circuit-breakers', action='store_true', default=False,
+                    help='Share circuit breaker state between all service processes '
+                         '(requires --circuit-breakers)')
+parser.add_argument('--circuit-breaker-mode', choices=['consecutive_failures', 'failure_rate'],
+                    default='consecutive_failures',
+                    help='Open circuit breakers after five consecutive failures, or when the rate '
+                         'of failed or slow calls gets too high (requires --circuit-breakers)')
+parser.add_argument('--slow-call-duration', action='store', default=None,
+                    help='Count calls slower than the specified number of seconds toward the slow '
+                         'call rate (requires --circuit-breaker-mode failure_rate)')
+parser.add_argument('--fan-out', action='store_true', default=False,
+                    help='Request upstream services concurrently from the homepage service')
+parser.add_argument('--deadline', action='store', default=None,
+                    help='Stop waiting for upstream services after the specified number of seconds, '
+                         'and pass the deadline on to them')
+parser.add_argument('--concurrency-limit', action='store_true', default=False,
+                    help='Reject requests with a 503 when more are in progress than the service '
+                         'can handle, adapting the limit to latency')
+parser.add_argument('--latency-injection', choices=['blocking', 'non_blocking'],
+                    default='blocking',
+                    help='Delay slow responses in the slow service, holding one of its workers '
+                         'for each, or in the services that call it, as if the responses were '
+                         'slow to arrive')
+parser.add_argument('--fault-profiles', type=argparse.FileType('r'), default=None,
+                    help='Simulate the faults in the specified JSON file, which maps paths to '
+                         'fault profiles, instead of those of the simulation type (not with matrix)')
+parser.add_argument('--local', action='store_true', default=False,
+                    help='Run the services in this process instead of in Docker')
+parser.add_argument('--home-url', default=None,
+                    help='The URL to use when requesting the home page service '
+                         '(defaults to the Docker machine\'s)')
+parser.add_argument('--settings-url', default=None,
+                    help='The URL of the settings API (defaults to the Docker machine\'s)')
+parser.add_argument('--duration', type=float, default=10,
                     help='The duration in seconds of each simulation')
+parser.add_argument('--warmup', type=float, default=0,
+                    help='Send requests for the specified number of seconds before recording them')
+parser.add_argument('--load-mode', choices=[CLOSED_LOOP, OPEN_LOOP], default=CLOSED_LOOP,
+                    help='Send each request as soon as an earlier one finishes, or at a constant '
+                         'rate however slowly the homepage service responds')
+parser.add_argument('--rate', type=float, default=None,
+                    help='The requests per second to send (requires --load-mode open)')
+parser.add_argument('--concurrency', type=int, default=10,
+                    help='The number of concurrent clients, or the most connections in an open loop')
+parser.add_argument('--users', type=int, default=None,
+                    help='Send each request as a random one of the specified number of users, '
+                         'whose recommendations can be loaded with simulation.recommendation_store')
+parser.add_argument('--output', default=None,
+                    help='Write the simulation results as JSON to the specified file')
+parser.add_argument('--scenarios', default=','.join(scenario_matrix.SCENARIOS),
+                    help='The comma-separated simulation types to run (requires matrix)')
+parser.add_argument('--resilience', default=','.join(scenario_matrix.RESILIENCE),
+                    help='The comma-separated resilience settings to run each simulation type '
+                         'with, from: {} (requires matrix)'.format(', '.join(scenario_matrix.RESILIENCE)))
+parser.add_argument('--baseline', default=None,
+                    help='Compare the results with those saved by an earlier matrix run with '
+                         '--output, and fail if any regressed (requires matrix)')
+parser.add_argument('--max-p99-regression', type=float, default=scenario_matrix.MAX_P99_REGRESSION,
+                    help='Fail if p99 latency rises by more than the specified fraction of the '
+                         'baseline (requires --baseline)')
+parser.add_argument('--max-error-rate-regression', type=float,
+                    default=scenario_matrix.MAX_ERROR_RATE_REGRESSION,
+                    help='Fail if the error rate rises by more than the specified fraction of '
+                         'requests (requires --baseline)')
+
+# The options that control how load is sent, which a matrix run uses for
+# every cell.
+LOAD_OPTIONS = ('home_url', 'settings_url', 'duration', 'warmup', 'load_mode', 'rate', 'concurrency',
+                'users')
+
+
+def docker_machine_ip():
+    try:
+        return run('docker-machine ip', shell=True, stdout=PIPE, check=True).stdout.strip().decode()
+    except CalledProcessError:
+        print('Failed to get docker-machine IP address. Canceling simulation.')
+        exit(1)
 
 
 def docker(cmd, failure):
@@ -52,10 +133,23 @@ def docker(cmd, failure):
 def setup(flags):
     settings = {
         'circuit_breakers': flags.circuit_breakers,
+        'shared_circuit_breakers': flags.shared_circuit_breakers,
+        'circuit_breaker_mode': flags.circuit_breaker_mode,
+        'slow_call_duration': flags.slow_call_duration,
         'timeout': flags.timeout,
         'retries': flags.retries,
+        'retry_budget': flags.retry_budget,
+        'hedged_requests': flags.hedged_requests,
+        'response_cache': flags.response_cache,
+        'bulkheads': flags.bulkheads is not None,
+        'bulkhead_max_concurrent': flags.bulkheads or 10,
+        'fan_out': flags.fan_out,
+        'deadline': flags.deadline,
+        'concurrency_limit': flags.concurrency_limit,
+        'latency_injection': flags.latency_injection,
         'outages': [],
-        'performance_problems': []
+        'performance_problems': [],
+        'fault_profiles': scenario_matrix.FAULT_PROFILES.get(flags.simulation_type, {})
     }
 
     if flags.simulation_type == 'outage':
@@ -63,6 +157,9 @@ def setup(flags):
     elif flags.simulation_type == 'performance':
         settings['performance_problems'] = ['/recommendations']
 
+    if flags.fault_profiles is not None:
+        settings['fault_profiles'] = flags.fault_profiles
+
     response = requests.put(flags.settings_url, headers=HEADERS, json=settings)
 
     if response.status_code != 200:
@@ -70,28 +167,7 @@ def setup(flags):
         exit(1)
 
 
-def run_wrk(flags):
-    print("Running simulation")
-    print(run(f'wrk -d {flags.duration} {flags.home_url} -H "Authorization: 0x123"',
-              shell=True, stdout=PIPE).stdout.strip().decode())
-    print("Finished")
-
-
-def simulate():
-    flags = parser.parse_args()
-
-    docker('up -d', failure='Failed to start settings service. Canceling simulation.')
-    time.sleep(1)
-
-    # Adjust settings for the simulation -- requires that Python services restart.
-    setup(flags)
-
-    # Stopping and starting services seems to be more reliable. Just 'restart'
-    # sometimes results in Docker errors about non-running containers.
-    RESTART_ERROR = 'Failed to restart services. Canceling simulation.'
-    docker('stop', failure=RESTART_ERROR)
-    docker('up -d', failure=RESTART_ERROR)
-
+def wait_for_homepage(flags):
     # Wait a max of five seconds for the homepage service to become available.
     for _ in range(5):
         try:
@@ -105,7 +181,112 @@ def simulate():
         print("Homepage service is unavailable. Debug with `docker-compose logs home`.")
         exit(1)
 
-    run_wrk(flags)
+
+def run_load(flags):
+    print("Running simulation")
+    generator = LoadGenerator(flags.home_url, headers=HEADERS, mode=flags.load_mode,
+                              concurrency=flags.concurrency, rate=flags.rate,
+                              duration=flags.duration, warmup=flags.warmup, users=flags.users)
+    results = run_load_test(generator)
+    results['simulation_type'] = flags.simulation_type
+    print(summarize(results))
+    print("Finished")
+    return results
+
+
+def cell_flags(flags, scenario, options):
+    """Return the flags for a matrix cell: the defaults, with the cell's
+    ``scenario`` and resilience ``options``, and the load options of ``flags``.
+    """
+    cell = vars(parser.parse_args([scenario]))
+    cell.update({option: getattr(flags, option) for option in LOAD_OPTIONS})
+    cell.update(options)
+    return argparse.Namespace(**cell)
+
+
+def run_matrix(flags):
+    try:
+        cells = list(scenario_matrix.cells(flags.scenarios.split(','), flags.resilience.split(',')))
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = OrderedDict()
+
+    for name, scenario, options in cells:
+        print(f"Running {name}")
+        cell = cell_flags(flags, scenario, options)
+        # Putting the cell's settings starts a new simulation, so the services
+        # forget what they learned during the last cell.
+        setup(cell)
+        wait_for_homepage(cell)
+        results[name] = scenario_matrix.summarize_cell(run_load(cell))
+
+    print(scenario_matrix.format_table(results))
+
+    if flags.output:
+        parameters = {option: getattr(flags, option) for option in LOAD_OPTIONS}
+        scenario_matrix.save_results(flags.output, results, parameters)
+
+    if flags.baseline:
+        regressions = scenario_matrix.compare(
+            results, scenario_matrix.load_results(flags.baseline),
+            max_p99_regression=flags.max_p99_regression,
+            max_error_rate_regression=flags.max_error_rate_regression)
+
+        if regressions:
+            print("Regressions against the baseline:")
+            print('\n'.join(regressions))
+            exit(1)
+
+        print("No regressions against the baseline")
+
+
+def simulate():
+    flags = parser.parse_args()
+
+    if flags.load_mode == OPEN_LOOP and not flags.rate:
+        parser.error('--load-mode open requires --rate')
+
+    if flags.fault_profiles is not None:
+        flags.fault_profiles = json.load(flags.fault_profiles)
+
+    if flags.local:
+        # Imported here because it switches the services to testing mode.
+        from simulation.harness import Harness
+
+        # The services log each request, which slows them down when they
+        # share a process with the load generator.
+        logging.getLogger().setLevel(logging.WARNING)
+
+        with Harness() as harness:
+            flags.home_url = flags.home_url or harness.home_url
+            flags.settings_url = flags.settings_url or harness.settings_url
+            run_simulation(flags)
+        return
+
+    ip = docker_machine_ip()
+    flags.home_url = flags.home_url or f"http://{ip}"
+    flags.settings_url = flags.settings_url or f"http://{ip}/settings"
+
+    docker('up -d', failure='Failed to start settings service. Canceling simulation.')
+    time.sleep(1)
+    run_simulation(flags)
+
+
+def run_simulation(flags):
+    if flags.simulation_type == 'matrix':
+        run_matrix(flags)
+        return
+
+    # Adjust settings for the simulation. Running services pick up the
+    # changes without restarting.
+    setup(flags)
+    wait_for_homepage(flags)
+    results = run_load(flags)
+
+    if flags.output:
+        with open(flags.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
 
 
 if __name__ == '__main__':
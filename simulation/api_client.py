@@ -1,94 +1,430 @@
 #!/usr/bin/env python
 # encoding: utf-8
 import logging
+import time
+
 import pybreaker
 import requests
 import statsd
 
-from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import ConnectionError, Timeout
+from requests.packages.urllib3.exceptions import MaxRetryError, ReadTimeoutError
 from urllib.parse import urlparse
 
-from .jittery_retry import RetryWithFullJitter
+from .bulkheads import Bulkhead
+from .circuit_breakers import CircuitBreaker, RateCircuitBreaker, SharedCircuitBreaker
+from .connection_pools import PooledAdapter
+from .deadlines import DEADLINE_HEADER, deadline_header
+from .faults import NON_BLOCKING, injected_delay
+from .jittery_retry import RetryWithFullJitter, reset_retry_count, retry_budget, retry_count
 from .metrics_helpers import metrics_client
-from .redis_helpers import redis_client
-from .settings import OUTAGES_KEY
-from .settings_helpers import get_client_settings
+from .response_cache import FRESH, STALE, mark_stale, max_age
+from .settings_helpers import get_client_settings, parse_settings
+from .settings_snapshot import settings_snapshot
+
 
+# The most stale responses a worker process will revalidate at once.
+REVALIDATION_POOL_SIZE = 5
 
 log = logging.getLogger(__name__)
 metrics = metrics_client()
-redis = redis_client()
+snapshot = settings_snapshot()
+executor = ThreadPoolExecutor(max_workers=REVALIDATION_POOL_SIZE)
 
 
-class ApiClient(requests.Session):
-    """A base class for API clients.
-    
-    Following the API Gateway pattern, this class collects common error-
-    handling code useful to API clients, and guards connections with a 
-    circuit breaker that will open after five failures.
+class ApiClientMixin:
+    """The parts of `ApiClient` and `AsyncApiClient` that don't depend on
+    how requests are made: settings, circuit breakers, the bulkhead,
+    simulated connection resets and the response cache's bookkeeping.
 
-    For the purposes of an outage simulation, this class also provides
-    a way for the Settings API to change the operation of all sub-classes
-    at run-time.
+    Sub-classes define how to make requests, and `_start_revalidation()`.
     """
+    hedger = None
+    pool_maxsize = None
+    response_cache = None
+
     def __init__(self, settings=None, timeout=1, max_retries=3):
         super().__init__()
 
-        if not settings:
-            settings = get_client_settings()
-
-        self.settings = settings
         self.timeout = timeout
+        self.max_retries = max_retries
 
         if not getattr(self, 'circuit_breaker', None):
-            self.circuit_breaker = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=30)
+            self.circuit_breaker = CircuitBreaker(fail_max=5, reset_timeout=30)
+
+        if not getattr(self, 'rate_circuit_breaker', None):
+            self.rate_circuit_breaker = RateCircuitBreaker()
 
-        if self.settings['retries']:
-            if max_retries:
-                adapter = HTTPAdapter(max_retries=RetryWithFullJitter(total=max_retries))
-                self.mount(self.url, adapter)
+        if not getattr(self, 'bulkhead', None):
+            self.bulkhead = Bulkhead()
 
-        if self.settings['timeout']:
-            self.settings['timeout'] = float(self.settings['timeout'])
+        if settings:
+            self.apply_settings(settings)
+        else:
+            self.apply_settings(get_client_settings())
+            snapshot.watch(self._settings_changed)
+            snapshot.watch_reset(self.reset)
 
     @property
     def url(self):
         raise NotImplementedError
 
-    def _request(self, method, url, *args, **kwargs):
-        use_circuit_breakers = self.settings['circuit_breakers']
+    def apply_settings(self, settings):
+        """Change the settings this client uses for new requests.
+
+        Every value is parsed before any is used, so settings with an
+        invalid value raise ValueError without changing the client.
+        """
+        settings = parse_settings(settings)
+
+        if isinstance(self.circuit_breaker, SharedCircuitBreaker):
+            self.circuit_breaker.shared = settings['shared_circuit_breakers']
+
+        self.rate_circuit_breaker.apply_settings(settings)
+        self.bulkhead.max_concurrent = int(settings['bulkhead_max_concurrent'])
+
+        self.settings = settings
+
+    def _settings_changed(self, settings):
+        log.info('Applying new settings to %s', self.__class__.__name__)
+        self.apply_settings(settings)
+        # A new simulation starts with closed circuit breakers.
+        self.circuit_breaker.close()
+        self.rate_circuit_breaker.close()
+
+    def reset(self):
+        """Forget what this client learned during the last simulation.
+
+        Closes the circuit breakers, empties the response cache, and refills
+        the retry and hedge budgets, so that a new simulation starts afresh.
+        """
+        log.info('Resetting %s for a new simulation', self.__class__.__name__)
+        self.circuit_breaker.close()
+        self.rate_circuit_breaker.close()
+        retry_budget().reset()
+
+        if self.response_cache is not None:
+            self.response_cache.clear()
+
+        if self.hedger is not None:
+            self.hedger.reset()
+
+    def _circuit_breaker(self):
+        """Return the circuit breaker that the settings call for."""
+        if self.settings['circuit_breaker_mode'] == 'failure_rate':
+            return self.rate_circuit_breaker
+        return self.circuit_breaker
+
+    def _simulate_reset(self, path):
+        """Return True if this request should fail as if the connection was
+        reset, as the ``reset_rate`` of the path's fault profile says."""
+        profile = snapshot.fault_profile(path)
+        return profile is not None and profile.should_reset()
+
+    def _cached_response(self, key, headers):
+        """Return the response cached under ``key``, or None if there is none.
+
+        Stale responses are returned marked by `mark_stale()`, and
+        revalidated by `_start_revalidation()` unless they already are.
+        """
+        path = urlparse(self.url).path
+        response, state = self.response_cache.lookup(key)
+
+        if state == FRESH:
+            metrics.incr('{}.cache_hit'.format(path))
+            return response
+
+        if state == STALE:
+            metrics.incr('{}.cache_stale'.format(path))
+
+            if self.response_cache.start_revalidation(key):
+                self._start_revalidation(key, response, headers)
+
+            return mark_stale(response)
+
+        metrics.incr('{}.cache_miss'.format(path))
+        return None
+
+    def _start_revalidation(self, key, cached, headers):
+        """Revalidate the ``cached`` response in the background."""
+        raise NotImplementedError
+
+    def _conditional(self, cached, kwargs):
+        """Return request ``kwargs`` that revalidate ``cached``, if it has an ETag."""
+        etag = cached.headers.get('ETag') if cached is not None else None
+
+        if etag:
+            kwargs['headers'] = dict(kwargs.get('headers') or {})
+            kwargs['headers']['If-None-Match'] = etag
+
+        return kwargs
+
+    def _store(self, key, cached, response):
+        """Cache ``response`` under ``key`` and return the response to use.
+
+        A 304 response to the revalidation of ``cached`` keeps ``cached``.
+        """
+        if response is None:
+            return None
+
+        if response.status_code == 304 and cached is not None:
+            self.response_cache.store(key, cached, max_age(response))
+            return cached
+
+        if response.status_code == 200:
+            self.response_cache.store(key, response, max_age(response))
+
+        return response
+
+
+class ApiClient(ApiClientMixin, requests.Session):
+    """A base class for API clients.
+    
+    Following the API Gateway pattern, this class collects common error-
+    handling code useful to API clients, and guards connections with a 
+    circuit breaker that will open after five failures. If the class's
+    breaker is a `SharedCircuitBreaker`, the ``shared_circuit_breakers``
+    setting decides whether its state is shared by every process.
+
+    When the ``circuit_breaker_mode`` setting is ``failure_rate``, the
+    class's ``rate_circuit_breaker`` is used instead. It opens when the
+    rate of failed or slow calls gets too high (see `RateCircuitBreaker`).
+
+    For the purposes of an outage simulation, this class also provides
+    a way for the Settings API to change the operation of all sub-classes
+    at run-time. Clients created without explicit settings follow changes
+    made through the Settings API while they are running. Requests to a
+    path in an outage fail with a connection error, as do the
+    ``reset_rate`` fraction of requests to a path with a `FaultProfile`.
+    When the ``latency_injection`` setting is NON_BLOCKING, each attempt at
+    a request, retries and hedges included, also waits out a latency
+    injected for its path before it is made, instead of the service holding
+    a worker for it.
+
+    Requests can be given a ``deadline``, as a `time.monotonic()` time.
+    The time left is sent to the service in the DEADLINE_HEADER header,
+    the request times out at the deadline if not before, and no request is
+    made at all once the deadline has passed.
+
+    If the ``retries`` setting is on, failed requests are retried, but only
+    while retries stay under the ``retry_budget`` fraction of successful
+    requests (see `RetryBudget`), and not if the request's deadline would
+    pass while backing off.
+
+    Sub-classes can set ``hedger`` to a `Hedger` to let the
+    ``hedged_requests`` setting hedge their slow requests with a second
+    attempt.
+
+    Sub-classes can set ``response_cache`` to a `ResponseCache` to let the
+    ``response_cache`` setting cache successful GET responses. Fresh ones
+    are returned without making a request. Stale ones are returned marked
+    by `mark_stale()` while they are revalidated in the background, so
+    the last good response is served during an outage. Responses stay
+    fresh for their Cache-Control max-age if they have one, and are
+    revalidated with If-None-Match if they have an ETag. Lookups are counted
+    as ``<path>.cache_hit``, ``<path>.cache_stale`` or ``<path>.cache_miss``.
+
+    If the ``bulkheads`` setting is on, each class's ``bulkhead`` caps its
+    requests in progress at ``bulkhead_max_concurrent``. Requests beyond
+    the cap are not made, and are counted as ``<path>.bulkhead_full``, so a
+    slow service cannot tie up every thread that calls the others.
+
+    Connections are pooled per host and shared by all clients (see
+    `PooledAdapter`). Sub-classes can set ``pool_maxsize`` to give their
+    host a different pool size than the ``pool_maxsize`` setting.
+    """
+    def apply_settings(self, settings):
+        super().apply_settings(settings)
+        settings = self.settings
+
+        if settings['retries'] and self.max_retries:
+            budget = retry_budget(settings['retry_budget']) if settings['retry_budget'] else None
+            max_retries = RetryWithFullJitter(total=self.max_retries, budget=budget)
+        else:
+            max_retries = 0
+
+        if self.hedger is not None:
+            self.hedger.apply_settings(settings)
+
+        # The new adapter shares connection pools with the old one unless
+        # the pool settings changed.
+        self.mount(self.url, PooledAdapter(
+            maxsize=self.pool_maxsize or int(settings['pool_maxsize']),
+            block=settings['pool_block'],
+            idle_timeout=float(settings['pool_idle_timeout'] or 0),
+            keep_alive=settings['keep_alive'],
+            max_retries=max_retries))
+
+    def _hedged(self, method, path, deadline):
+        """Return a version of ``method`` whose slow calls are hedged."""
+        def hedged_method(*args, **kwargs):
+            def attempt():
+                # Attempts run in other threads, which need the deadline.
+                reset_retry_count(deadline=deadline)
+                return method(*args, **kwargs)
+
+            return self.hedger.call(attempt, path)
+
+        return hedged_method
+
+    def _delayed(self, method, url, deadline):
+        """Return a version of ``method`` that first waits out the latency
+        injected for ``url``, as if the response were slow to arrive.
+
+        The latency is drawn afresh for each call, so each hedged attempt
+        gets its own. A call whose latency reaches its timeout times out, and
+        is retried with a fresh latency if the adapter's Retry would retry a
+        read timeout, as it would in BLOCKING mode.
+        """
         path = urlparse(url).path
-        simulate_outage = path in redis.smembers(OUTAGES_KEY)
+        http_method = getattr(method, '__name__', 'GET').upper()
+
+        def delayed_method(*args, **kwargs):
+            retry = self.get_adapter(url).max_retries
+
+            while True:
+                delay = injected_delay(snapshot, path) or 0
+
+                if deadline is not None:
+                    kwargs['timeout'] = min(kwargs['timeout'], deadline - time.monotonic())
+
+                if delay < kwargs['timeout']:
+                    break
+
+                time.sleep(max(kwargs['timeout'], 0))
+                error = ReadTimeoutError(None, url, 'Read timed out.')
+
+                try:
+                    retry = retry.increment(http_method, url, error=error)
+                except (MaxRetryError, ReadTimeoutError):
+                    raise Timeout
+
+                time.sleep(retry.get_backoff_time())
+
+            if delay:
+                time.sleep(delay)
+
+            if deadline is not None:
+                kwargs['headers'] = dict(kwargs['headers'])
+                kwargs['headers'][DEADLINE_HEADER] = deadline_header(deadline)
+
+            return method(*args, **kwargs)
+
+        return delayed_method
+
+    def _request(self, method, url, *args, deadline=None, **kwargs):
+        path = urlparse(url).path
+        # Checking the snapshot first picks up any settings changes.
+        simulate_outage = snapshot.is_outage(path) or self._simulate_reset(path)
+        use_circuit_breakers = self.settings['circuit_breakers']
         kwargs['timeout'] = self.settings['timeout'] or kwargs.get('timeout') or self.timeout
         result = None
+        outcome = 'success'
+
+        if deadline is not None:
+            time_left = deadline - time.monotonic()
+
+            if time_left <= 0:
+                log.error('Deadline exceeded before connecting to %s', self.url)
+                metrics.incr('{}.deadline_exceeded'.format(path))
+                return None
+
+            kwargs['timeout'] = min(kwargs['timeout'], time_left)
+            kwargs['headers'] = dict(kwargs.get('headers') or {})
+            kwargs['headers'][DEADLINE_HEADER] = deadline_header(deadline)
+
+        if self.settings['latency_injection'] == NON_BLOCKING:
+            method = self._delayed(method, url, deadline)
 
         if simulate_outage:
             def erroring_method(*args, **kwargs):
                 raise ConnectionError
             method = erroring_method
 
+        hedged = self.hedger is not None and self.settings['hedged_requests']
+
+        if hedged:
+            method = self._hedged(method, path, deadline)
+
+        reset_retry_count(deadline=deadline)
+        bulkhead = self.bulkhead if self.settings['bulkheads'] else None
+
+        if bulkhead is not None and not bulkhead.acquire():
+            log.error('Bulkhead full, not connecting to %s', self.url)
+            metrics.incr('{}.bulkhead_full'.format(path))
+            return None
+
+        # The bulkhead is released in the finally block below, so nothing
+        # that can raise may come between the two.
+        start = time.perf_counter()
+
         try:
             if use_circuit_breakers:
-                result = self.circuit_breaker.call(method, url, *args, **kwargs)
+                result = self._circuit_breaker().call(method, url, *args, **kwargs)
             else:
                 result = method(url, *args, **kwargs)
         except ConnectionError:
             log.error('Connection error connecting to %s', self.url)
             metrics.incr('{}.connection_error'.format(path))
+            outcome = 'connection_error'
         except Timeout:
             log.error('Timeout connecting to %s', self.url)
             metrics.incr('{}.timeout'.format(path))
+            outcome = 'timeout'
         except pybreaker.CircuitBreakerError as e:
             log.error('Circuit breaker error: %s', e)
             metrics.incr('circuitbreaker.{}_breaker_open'.format(path))
+            outcome = 'breaker_open'
         except Exception:
             log.exception('Unexpected error connecting to: %s', self.url)
             metrics.incr('{}.error'.format(path))
+            outcome = 'error'
+        else:
+            retry_budget().deposit()
+
+            if self.hedger is not None and not hedged:
+                self.hedger.record(time.perf_counter() - start)
+        finally:
+            if bulkhead is not None:
+                bulkhead.release()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        metrics.histogram('api_latency', elapsed, tags={
+            'path': path,
+            'outcome': outcome,
+            'retries': retry_count()
+        })
 
         return result
 
+    def _cached_get(self, **kwargs):
+        key = self.response_cache.key(self.url, kwargs.get('headers'))
+        response = self._cached_response(key, kwargs.get('headers'))
+
+        if response is None:
+            response = self._get_and_store(key, **kwargs)
+
+        return response
+
+    def _get_and_store(self, key, cached=None, **kwargs):
+        kwargs = self._conditional(cached, kwargs)
+        return self._store(key, cached, self._request(super().get, self.url, **kwargs))
+
+    def _start_revalidation(self, key, cached, headers):
+        executor.submit(self._revalidate, key, cached, headers)
+
+    def _revalidate(self, key, cached, headers):
+        try:
+            # Nobody waits for the response, so the request's deadline
+            # does not apply.
+            self._get_and_store(key, cached, headers=headers)
+        finally:
+            self.response_cache.finish_revalidation(key)
+
     def get(self, **kwargs):
+        if self.response_cache is not None and self.settings['response_cache']:
+            return self._cached_get(**kwargs)
         return self._request(super().get, self.url, **kwargs)
 
     def post(self, data=None, json=None, **kwargs):
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+
+import falcon
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncRequest:
+    """The parts of a `falcon.Request` that the simulation's resources use."""
+    def __init__(self, scope, body=b''):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.body = body
+        self.context = {}
+        self._headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                         for name, value in scope.get('headers', [])}
+
+    def get_header(self, name, default=None):
+        return self._headers.get(name.lower(), default)
+
+
+class AsyncResponse:
+    """The parts of a `falcon.Response` that the simulation's resources use."""
+    def __init__(self):
+        self.status = falcon.HTTP_200
+        self.body = None
+        self.data = None
+        self.stream = None
+        self.stream_len = None
+        self.headers = {}
+
+    def set_header(self, name, value):
+        self.headers[name] = value
+
+
+class AsyncApp:
+    """A minimal ASGI application that routes requests like `falcon.API`.
+
+    Resources define coroutines named after HTTP methods, e.g. ``on_get``,
+    and middleware defines a ``process_request`` coroutine. Both receive an
+    `AsyncRequest` and an `AsyncResponse`, and can raise falcon's HTTP
+    errors. As in falcon, middleware can also define a ``process_response``
+    coroutine, which is called in reverse order, even after an error, for
+    each middleware whose ``process_request`` finished. Any other exception
+    is logged and becomes a 500 response. Run it with an ASGI server, e.g.:
+
+        $ uvicorn simulation.homepage:asgi_api --port 8001
+    """
+    def __init__(self, middleware=None):
+        self._middleware = list(middleware or [])
+        self._routes = {}
+
+    def add_route(self, path, resource):
+        self._routes[path] = resource
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        body = b''
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        req = AsyncRequest(scope, body)
+        resp = AsyncResponse()
+        processed = []
+
+        try:
+            await self._handle(req, resp, processed)
+        except Exception as e:
+            if not isinstance(e, falcon.HTTPError):
+                log.exception('Unhandled error serving %s %s', req.method, req.path)
+                e = falcon.HTTPInternalServerError('Internal Server Error', None)
+
+            resp.status = e.status
+            resp.body = e.to_json() if e.has_representation else None
+            resp.headers.update(e.headers or {})
+        finally:
+            for middleware in reversed(processed):
+                process_response = getattr(middleware, 'process_response', None)
+
+                if process_response is not None:
+                    await process_response(req, resp, None)
+
+        await self._respond(resp, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle(self, req, resp, processed):
+        for middleware in self._middleware:
+            await middleware.process_request(req, resp)
+            processed.append(middleware)
+
+        resource = self._routes.get(req.path)
+
+        if resource is None:
+            raise falcon.HTTPNotFound()
+
+        responder = getattr(resource, 'on_{}'.format(req.method.lower()), None)
+
+        if responder is None:
+            raise falcon.HTTPMethodNotAllowed(
+                [name[3:].upper() for name in dir(resource) if name.startswith('on_')])
+
+        await responder(req, resp)
+
+    async def _respond(self, resp, send):
+        if resp.stream is not None:
+            await self._respond_with_stream(resp, send)
+            return
+
+        if resp.data is not None:
+            body = resp.data
+        elif resp.body is not None:
+            body = resp.body.encode('utf-8')
+        else:
+            body = b''
+
+        await self._start_response(resp, send, len(body))
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _respond_with_stream(self, resp, send):
+        """Send the body of ``resp`` from its ``stream``, an async iterable
+        of bytes, a chunk at a time."""
+        await self._start_response(resp, send, resp.stream_len)
+
+        async for chunk in resp.stream:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _start_response(self, resp, send, content_length=None):
+        headers = {'content-type': falcon.DEFAULT_MEDIA_TYPE}
+        headers.update({name.lower(): str(value) for name, value in resp.headers.items()})
+
+        if content_length is not None:
+            headers['content-length'] = str(content_length)
+
+        await send({
+            'type': 'http.response.start',
+            'status': int(resp.status.split(' ', 1)[0]),
+            'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers.items()]
+        })
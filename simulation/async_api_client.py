@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import json
+import logging
+import time
+
+from urllib.parse import urlparse
+
+import aiohttp
+import pybreaker
+
+from requests.packages.urllib3.exceptions import MaxRetryError, NewConnectionError, ReadTimeoutError
+
+from .api_client import ApiClientMixin
+from .deadlines import DEADLINE_HEADER, deadline_header
+from .faults import NON_BLOCKING, injected_delay
+from .jittery_retry import RetryWithFullJitter, retry_budget
+from .metrics_helpers import metrics_client
+from .settings_snapshot import settings_snapshot
+
+
+log = logging.getLogger(__name__)
+metrics = metrics_client()
+snapshot = settings_snapshot()
+
+
+class AsyncResponse:
+    """The parts of a `requests.Response` that API client callers use."""
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __bool__(self):
+        return self.ok
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class AsyncApiClient(ApiClientMixin):
+    """An asyncio version of `ApiClient`.
+
+    Requests have the same semantics as they do with ApiClient: they are
+    guarded by the class's circuit breaker, time out after the ``timeout``
+    setting, are retried with "full jitter" backoff if the ``retries``
+    setting is on, and fail with a connection error if the Settings API
+    put their path in an outage, or sometimes if their path's fault profile
+    has a ``reset_rate``. Errors are logged and counted, and the request
+    returns None. As with ApiClient, the ``latency_injection`` setting can
+    have requests wait out their path's injected latency, which they do
+    without tying up a thread.
+
+    Requests can be given a ``deadline``, are limited by the class's
+    ``bulkhead``, and GET responses are cached in its ``response_cache``,
+    as they are by ApiClient. Stale responses are revalidated by a task.
+
+    Unlike ApiClient, waiting for a response does not tie up a thread, so
+    one process can wait on thousands of slow requests at once.
+
+    Connections are pooled per client, up to the ``pool_maxsize`` setting
+    (or the class's ``pool_maxsize``) at the time of the first request.
+    """
+    def __init__(self, settings=None, timeout=1, max_retries=3):
+        self._session = None
+        super().__init__(settings, timeout, max_retries)
+
+    def _get_session(self):
+        loop = asyncio.get_event_loop()
+
+        if self._session is None or self._session.closed or self._session.loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.pool_maxsize or int(self.settings['pool_maxsize']),
+                keepalive_timeout=float(self.settings['pool_idle_timeout'] or 0) or None)
+            self._session = aiohttp.ClientSession(connector=connector)
+
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def _send(self, method, url, **kwargs):
+        async with self._get_session().request(method, url, **kwargs) as response:
+            content = await response.read()
+            return AsyncResponse(response.status, response.headers, content)
+
+    async def _send_with_retries(self, method, url, attempts, deadline=None, **kwargs):
+        if self.settings['retries'] and self.max_retries:
+            ratio = self.settings['retry_budget']
+            retry = RetryWithFullJitter(total=self.max_retries,
+                                        budget=retry_budget(ratio) if ratio else None,
+                                        deadline=deadline)
+        else:
+            retry = None
+
+        while True:
+            attempts.append(time.perf_counter())
+
+            try:
+                return await self._send_delayed(method, url, deadline, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if retry is None:
+                    raise
+
+                # Let the same Retry object that ApiClient uses decide
+                # whether to try again, and how long to wait.
+                if isinstance(e, asyncio.TimeoutError):
+                    error = ReadTimeoutError(None, url, 'Read timed out.')
+                else:
+                    error = NewConnectionError(None, str(e))
+
+                try:
+                    retry = retry.increment(method, url, error=error)
+                except MaxRetryError:
+                    raise e
+
+                await asyncio.sleep(retry.get_backoff_time())
+
+    async def _call_with_circuit_breaker(self, coroutine_function, *args, **kwargs):
+        """Call ``coroutine_function`` guarded by the circuit breaker."""
+        breaker = self._circuit_breaker()
+        call_state = breaker.before_call()
+        start = time.perf_counter()
+
+        try:
+            result = await coroutine_function(*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            breaker.record_failure(e, time.perf_counter() - start)
+            raise
+
+        breaker.record_success(time.perf_counter() - start, call_state)
+        return result
+
+    async def _send_delayed(self, method, url, deadline=None, **kwargs):
+        """Send a request, first waiting out the latency injected for ``url``
+        if the ``latency_injection`` setting is NON_BLOCKING, as if the
+        response were slow to arrive.
+
+        The latency is drawn afresh for each attempt, and an attempt whose
+        latency reaches its timeout times out, so it can be retried.
+        """
+        if self.settings['latency_injection'] == NON_BLOCKING:
+            delay = injected_delay(snapshot, urlparse(url).path) or 0
+            timeout = kwargs['timeout'].sock_read
+
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+
+            if delay >= timeout:
+                await asyncio.sleep(max(timeout, 0))
+                raise asyncio.TimeoutError
+
+            if delay:
+                await asyncio.sleep(delay)
+
+            if deadline is not None:
+                kwargs['headers'] = dict(kwargs['headers'])
+                kwargs['headers'][DEADLINE_HEADER] = deadline_header(deadline)
+
+        return await self._send(method, url, **kwargs)
+
+    async def _request(self, method, url, deadline=None, **kwargs):
+        path = urlparse(url).path
+        # Checking the snapshot first picks up any settings changes.
+        simulate_outage = snapshot.is_outage(path) or self._simulate_reset(path)
+        use_circuit_breakers = self.settings['circuit_breakers']
+        timeout = self.settings['timeout'] or kwargs.get('timeout') or self.timeout
+        send = self._send_with_retries
+        attempts = []
+        result = None
+        outcome = 'success'
+
+        if deadline is not None:
+            time_left = deadline - time.monotonic()
+
+            if time_left <= 0:
+                log.error('Deadline exceeded before connecting to %s', self.url)
+                metrics.incr('{}.deadline_exceeded'.format(path))
+                return None
+
+            timeout = min(timeout, time_left)
+            kwargs['headers'] = dict(kwargs.get('headers') or {})
+            kwargs['headers'][DEADLINE_HEADER] = deadline_header(deadline)
+
+        kwargs['timeout'] = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+
+        if simulate_outage:
+            async def erroring_send(*args, **kwargs):
+                raise aiohttp.ClientConnectionError
+            send = erroring_send
+
+        bulkhead = self.bulkhead if self.settings['bulkheads'] else None
+
+        if bulkhead is not None and not bulkhead.acquire():
+            log.error('Bulkhead full, not connecting to %s', self.url)
+            metrics.incr('{}.bulkhead_full'.format(path))
+            return None
+
+        # The bulkhead is released in the finally block below, so nothing
+        # that can raise may come between the two.
+        start = time.perf_counter()
+
+        try:
+            if use_circuit_breakers:
+                result = await self._call_with_circuit_breaker(
+                    send, method, url, attempts, deadline=deadline, **kwargs)
+            else:
+                result = await send(method, url, attempts, deadline=deadline, **kwargs)
+        except asyncio.TimeoutError:
+            log.error('Timeout connecting to %s', self.url)
+            metrics.incr('{}.timeout'.format(path))
+            outcome = 'timeout'
+        except aiohttp.ClientConnectionError:
+            log.error('Connection error connecting to %s', self.url)
+            metrics.incr('{}.connection_error'.format(path))
+            outcome = 'connection_error'
+        except pybreaker.CircuitBreakerError as e:
+            log.error('Circuit breaker error: %s', e)
+            metrics.incr('circuitbreaker.{}_breaker_open'.format(path))
+            outcome = 'breaker_open'
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        except Exception:
+            log.exception('Unexpected error connecting to: %s', self.url)
+            metrics.incr('{}.error'.format(path))
+            outcome = 'error'
+        else:
+            retry_budget().deposit()
+        finally:
+            if bulkhead is not None:
+                bulkhead.release()
+
+            elapsed = (time.perf_counter() - start) * 1000
+            metrics.histogram('api_latency', elapsed, tags={
+                'path': path,
+                'outcome': outcome,
+                'retries': max(len(attempts) - 1, 0)
+            })
+
+        return result
+
+    async def _cached_get(self, **kwargs):
+        key = self.response_cache.key(self.url, kwargs.get('headers'))
+        response = self._cached_response(key, kwargs.get('headers'))
+
+        if response is None:
+            response = await self._get_and_store(key, **kwargs)
+
+        return response
+
+    async def _get_and_store(self, key, cached=None, **kwargs):
+        kwargs = self._conditional(cached, kwargs)
+        return self._store(key, cached, await self._request('GET', self.url, **kwargs))
+
+    def _start_revalidation(self, key, cached, headers):
+        asyncio.ensure_future(self._revalidate(key, cached, headers))
+
+    async def _revalidate(self, key, cached, headers):
+        try:
+            # Nobody waits for the response, so the request's deadline
+            # does not apply.
+            await self._get_and_store(key, cached, headers=headers)
+        finally:
+            self.response_cache.finish_revalidation(key)
+
+    async def get(self, **kwargs):
+        if self.response_cache is not None and self.settings['response_cache']:
+            return await self._cached_get(**kwargs)
+        return await self._request('GET', self.url, **kwargs)
+
+    async def post(self, data=None, json=None, **kwargs):
+        return await self._request('POST', self.url, data=data, json=json, **kwargs)
+
+    async def delete(self, **kwargs):
+        return await self._request('DELETE', self.url, **kwargs)
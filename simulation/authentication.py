@@ -1,11 +1,12 @@
 #!/usr/bin/env python
 # encoding: utf-8
-import json
-import uuid
 import falcon
 import statsd
 
+from .deadlines import DeadlineMiddleware
 from .metrics_helpers import metrics_client
+from .serializers import write_json
+from .users import user_uuid
 
 
 metrics = metrics_client()
@@ -28,10 +29,11 @@ class AuthenticationResource:
         < content-type: application/json; charset=UTF-8
         <
         * Closing connection 0
-        {"permissions": ["can_view_recommendations", "can_view_homepage"], "uuid": "f180f501-2378-4292-b364-d4a0d1b52c51"}
+        {"permissions": ["can_view_recommendations", "can_view_homepage"], "uuid": "c2b3f2fc-684f-5183-8b7d-4d071eb23ec1"}
 
     Note: for the purposes of easier testing, this endpoint considers *all*
-    tokens valid.
+    tokens valid. Each token belongs to the user whose UUID is `user_uuid()`
+    of the token.
     """
     def on_post(self, req, resp):
         """Return authentication details if a valid token was provided."""
@@ -48,12 +50,14 @@ class AuthenticationResource:
                                           href='http://docs.example.com/auth')
 
         user_details = {
-            'uuid': str(uuid.uuid4()),
+            'uuid': user_uuid(token),
             'permissions': ['can_view_recommendations', 'can_view_homepage']
         }
 
-        resp.body = json.dumps(user_details)
+        write_json(resp, user_details)
 
 
-api = falcon.API()
+api = falcon.API(middleware=[
+    DeadlineMiddleware()
+])
 api.add_route('/authenticate', AuthenticationResource())
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import threading
+
+
+class Bulkhead:
+    """Caps how many calls to one dependency can be in progress at once.
+
+    Unlike a semaphore, a bulkhead never waits: `acquire()` fails at once
+    when ``max_concurrent`` calls are in progress, so that callers give up
+    on a dependency that is not keeping up instead of queueing behind it.
+    ``max_concurrent`` can be changed at any time.
+
+    A bulkhead only counts calls, so the same one works for threads and
+    for coroutines.
+    """
+    def __init__(self, max_concurrent=10):
+        self.max_concurrent = max_concurrent
+        self.in_progress = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return True if another call can start, and count it."""
+        with self._lock:
+            if self.in_progress >= self.max_concurrent:
+                return False
+            self.in_progress += 1
+            return True
+
+    def release(self):
+        """Record that a call counted by `acquire()` finished."""
+        with self._lock:
+            self.in_progress -= 1
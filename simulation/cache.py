@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A thread-safe, size-bounded LRU cache whose entries expire.
+
+    Entries expire ``ttl`` seconds after they are stored, unless a different
+    ``ttl`` is given when storing them. When the cache holds ``maxsize``
+    entries, storing another one evicts the least recently used entry.
+
+    ``get_or_load()`` collapses concurrent misses for the same key into a
+    single call to the loader: while one thread loads a key, other threads
+    asking for it wait for that result instead of loading it themselves.
+    """
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        """Return (found, value) for ``key``. Caller must hold the lock."""
+        try:
+            expires_at, value = self._entries[key]
+        except KeyError:
+            return False, None
+
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+        return True, value
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._get(key)
+        return value if found else default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key, loader):
+        """Return a (value, hit) tuple for ``key``.
+
+        On a miss, ``loader`` is called with ``key`` and must return a
+        (value, ttl) tuple. The value is cached for ``ttl`` seconds, or not
+        at all if ``ttl`` is zero. Exceptions raised by ``loader`` are not
+        cached and propagate to the caller that ran it; any callers waiting
+        on that load try again.
+        """
+        while True:
+            with self._lock:
+                found, value = self._get(key)
+
+                if found:
+                    return value, True
+
+                loading = self._loading.get(key)
+
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+
+            loading.wait()
+
+            # The load may not have been cached (a zero TTL or an error), so
+            # only report a value if another thread actually stored one.
+            with self._lock:
+                found, value = self._get(key)
+
+            if found:
+                return value, False
+
+        try:
+            value, ttl = loader(key)
+            self.set(key, value, ttl)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+        return value, False
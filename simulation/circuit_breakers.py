@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import time
+
+from datetime import datetime, timedelta
+
+import pybreaker
+
+from redis.exceptions import RedisError
+
+from .redis_helpers import redis_client
+
+
+# The Redis hash that holds a shared circuit breaker's state.
+CIRCUIT_BREAKER_KEY = 'circuit_breaker:{}'
+
+# The defaults for RateCircuitBreaker: the window's length in seconds, the
+# number of buckets it is divided into, and the number of calls the window
+# must hold before the breaker can open.
+RATE_WINDOW = 10
+RATE_WINDOW_BUCKETS = 10
+RATE_MINIMUM_CALLS = 20
+
+log = logging.getLogger(__name__)
+
+
+class CircuitBreaker(pybreaker.CircuitBreaker):
+    """A pybreaker circuit breaker whose steps can be taken separately.
+
+    pybreaker's ``call()`` holds the breaker's lock for the whole call, so
+    only one thread at a time can make a request through a breaker. This
+    breaker only holds the lock while it checks or changes its state, and
+    exposes those steps as `before_call()`, `record_success()` and
+    `record_failure()`, so that coroutines can be guarded too.
+
+    Once the reset timeout has elapsed, one call is let through as a trial.
+    Other calls fail until it finishes, or until another reset timeout
+    passes without it finishing.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._trial_started_at = None
+
+    def before_call(self):
+        """Raise CircuitBreakerError if a call should not be attempted.
+
+        Otherwise return a value to pass to `record_success()` if the call
+        succeeds.
+        """
+        with self._lock:
+            state = self._state
+            now = datetime.now()
+            reset_timeout = timedelta(seconds=self.reset_timeout)
+
+            if state.name == 'open':
+                if now < state.opened_at + reset_timeout:
+                    raise pybreaker.CircuitBreakerError(
+                        'Timeout not elapsed yet, circuit breaker still open')
+                self.half_open()
+            elif state.name == 'half-open' and self._trial_started_at:
+                if now < self._trial_started_at + reset_timeout:
+                    raise pybreaker.CircuitBreakerError(
+                        'Trial call in progress, circuit breaker half-open')
+
+            if self._state.name == 'half-open':
+                self._trial_started_at = now
+
+    def record_success(self, duration=None, call_state=None):
+        """Record that a call succeeded after ``duration`` seconds.
+
+        ``call_state`` is the value `before_call()` returned for the call.
+        """
+        with self._lock:
+            self._trial_started_at = None
+            self._state._handle_success()
+
+    def record_failure(self, exc, duration=None):
+        """Record that a call failed with ``exc`` after ``duration`` seconds.
+
+        Raises CircuitBreakerError if this failure opened the breaker.
+        """
+        with self._lock:
+            self._trial_started_at = None
+
+            try:
+                self._state._handle_error(exc)
+            except pybreaker.CircuitBreakerError:
+                raise
+            except BaseException:
+                # pybreaker re-raises the call's exception; the caller will.
+                pass
+
+    def call(self, func, *args, **kwargs):
+        call_state = self.before_call()
+        start = time.perf_counter()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self.record_failure(e, time.perf_counter() - start)
+            raise
+
+        self.record_success(time.perf_counter() - start, call_state)
+        return result
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """A circuit breaker whose state can be shared through Redis.
+
+    When ``shared`` is True, every process with a breaker of the same
+    ``name`` uses one state, kept in a Redis hash, so the first ``fail_max``
+    consecutive failures in any process open the breaker everywhere, and
+    only one process at a time makes the trial call after the reset
+    timeout. State changes are made in Redis transactions that fail if
+    another process changed the state first.
+
+    Most calls find the breaker closed with no failures counted, so their
+    successes change nothing and are not written to Redis, unless this
+    breaker recorded a failure while they were in progress. A call then
+    costs one round-trip to Redis, unless it fails or changes the state.
+
+    When ``shared`` is False, or Redis is unavailable, the breaker keeps
+    its state in memory like `CircuitBreaker`.
+    """
+    def __init__(self, name, *args, shared=False, redis=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = name
+        self.key = CIRCUIT_BREAKER_KEY.format(name)
+        self.shared = shared
+        self._redis = redis or redis_client()
+        # The number of failures this breaker has recorded, so that a call
+        # can tell whether any were recorded while it was in progress.
+        self._failures_recorded = 0
+
+    @property
+    def current_state(self):
+        if self.shared:
+            try:
+                return self._redis.hget(self.key, 'state') or 'closed'
+            except RedisError:
+                log.exception('Could not read circuit breaker %s', self.name)
+        return super().current_state
+
+    @property
+    def fail_counter(self):
+        if self.shared:
+            try:
+                return int(self._redis.hget(self.key, 'failures') or 0)
+            except RedisError:
+                log.exception('Could not read circuit breaker %s', self.name)
+        return super().fail_counter
+
+    def _set_state(self, state, **fields):
+        fields.update(state=state, opened_at=time.time())
+        try:
+            self._redis.hmset(self.key, fields)
+        except RedisError:
+            log.exception('Could not change circuit breaker %s', self.name)
+
+    def open(self):
+        super().open()
+        if self.shared:
+            self._set_state('open')
+
+    def half_open(self):
+        super().half_open()
+        if self.shared:
+            self._set_state('half-open')
+
+    def close(self):
+        super().close()
+        if self.shared:
+            self._set_state('closed', failures=0)
+
+    def before_call(self):
+        if not self.shared:
+            return super().before_call()
+
+        failures_recorded = self._failures_recorded
+
+        try:
+            state, failures = self._redis.hmget(self.key, 'state', 'failures')
+            if state in (None, 'closed'):
+                # A success would change nothing unless failures are recorded
+                # before it, so return how many have been recorded so far.
+                return None if int(failures or 0) else failures_recorded
+            self._redis.transaction(self._claim_trial, self.key)
+        except RedisError:
+            log.exception('Could not read circuit breaker %s', self.name)
+            super().before_call()
+
+    def _claim_trial(self, pipe):
+        """Let this call through as the trial call, if the timeout elapsed.
+
+        The open and half-open states both count their timeout from
+        ``opened_at``, which is reset when a trial call is claimed, so a
+        trial call that never finishes does not keep the breaker half-open.
+        """
+        state = pipe.hgetall(self.key)
+
+        if state.get('state', 'closed') == 'closed':
+            return
+
+        if time.time() < float(state.get('opened_at', 0)) + self.reset_timeout:
+            if state['state'] == 'half-open':
+                raise pybreaker.CircuitBreakerError(
+                    'Trial call in progress, circuit breaker half-open')
+            raise pybreaker.CircuitBreakerError(
+                'Timeout not elapsed yet, circuit breaker still open')
+
+        pipe.multi()
+        pipe.hmset(self.key, {'state': 'half-open', 'opened_at': time.time()})
+
+    def record_success(self, duration=None, call_state=None):
+        if not self.shared:
+            return super().record_success(duration, call_state)
+
+        if call_state is not None and call_state == self._failures_recorded:
+            return
+
+        try:
+            self._redis.transaction(self._reset_failures, self.key)
+        except RedisError:
+            log.exception('Could not change circuit breaker %s', self.name)
+            super().record_success(duration)
+
+    def _reset_failures(self, pipe):
+        state = pipe.hgetall(self.key)
+        name = state.get('state', 'closed')
+
+        # Most calls succeed with the breaker closed and nothing to reset.
+        if name == 'closed' and not int(state.get('failures', 0)):
+            return
+
+        pipe.multi()
+        if name == 'half-open':
+            pipe.hmset(self.key, {'state': 'closed', 'failures': 0})
+        else:
+            pipe.hset(self.key, 'failures', 0)
+
+    def record_failure(self, exc, duration=None):
+        if not self.shared:
+            return super().record_failure(exc, duration)
+
+        if not self.is_system_error(exc):
+            return self.record_success(duration)
+
+        with self._lock:
+            self._failures_recorded += 1
+
+        try:
+            error = self._redis.transaction(self._count_failure, self.key,
+                                            value_from_callable=True)
+        except RedisError:
+            log.exception('Could not change circuit breaker %s', self.name)
+            return super().record_failure(exc, duration)
+
+        if error:
+            raise pybreaker.CircuitBreakerError(error)
+
+    def _count_failure(self, pipe):
+        state = pipe.hgetall(self.key)
+        name = state.get('state', 'closed')
+        failures = int(state.get('failures', 0)) + 1
+        fields = {'failures': failures}
+        error = None
+
+        if name == 'half-open':
+            error = 'Trial call failed, circuit breaker opened'
+        elif name == 'closed' and failures >= self.fail_max:
+            error = 'Failures threshold reached, circuit breaker opened'
+
+        if error:
+            fields.update(state='open', opened_at=time.time())
+
+        pipe.multi()
+        pipe.hmset(self.key, fields)
+        return error
+
+
+class RateCircuitBreaker(CircuitBreaker):
+    """A circuit breaker that opens when too many recent calls fail.
+
+    Calls from the last ``window`` seconds are counted in a ring of
+    ``buckets`` buckets, so the breaker uses the same memory no matter how
+    many calls it sees. Once the window holds at least ``minimum_calls``
+    calls, the breaker opens if the fraction that failed reaches
+    ``failure_rate``, or if the fraction that took at least
+    ``slow_call_duration`` seconds reaches ``slow_call_rate``. A
+    ``slow_call_duration`` of None disables the slow call check.
+
+    A slow trial call counts as failed. Closing the breaker empties the
+    window.
+    """
+    def __init__(self, window=RATE_WINDOW, buckets=RATE_WINDOW_BUCKETS,
+                 minimum_calls=RATE_MINIMUM_CALLS, failure_rate=0.5,
+                 slow_call_duration=None, slow_call_rate=1.0,
+                 reset_timeout=30, clock=time.monotonic, **kwargs):
+        self._bucket_width = window / buckets
+        self._clock = clock
+        self._epochs = [None] * buckets
+        self._calls = [0] * buckets
+        self._failures = [0] * buckets
+        self._slow_calls = [0] * buckets
+        self.minimum_calls = minimum_calls
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        super().__init__(reset_timeout=reset_timeout, **kwargs)
+
+    def apply_settings(self, settings):
+        """Use the thresholds from the simulation's ``settings``."""
+        self.failure_rate = float(settings['failure_rate_threshold'])
+        self.slow_call_rate = float(settings['slow_call_rate_threshold'])
+
+        if settings['slow_call_duration']:
+            self.slow_call_duration = float(settings['slow_call_duration'])
+        else:
+            self.slow_call_duration = None
+
+    def _bucket(self, epoch):
+        """Return the index of the bucket for ``epoch``, emptying it if stale."""
+        index = epoch % len(self._epochs)
+
+        if self._epochs[index] != epoch:
+            self._epochs[index] = epoch
+            self._calls[index] = self._failures[index] = self._slow_calls[index] = 0
+
+        return index
+
+    def _is_slow(self, duration):
+        return (self.slow_call_duration is not None and duration is not None and
+                duration >= self.slow_call_duration)
+
+    def _record(self, failed, slow):
+        """Count a call, and return an error message if the breaker should open."""
+        epoch = int(self._clock() // self._bucket_width)
+        index = self._bucket(epoch)
+        self._calls[index] += 1
+        self._failures[index] += failed
+        self._slow_calls[index] += slow
+
+        oldest = epoch - len(self._epochs)
+        calls = failures = slow_calls = 0
+
+        for i, bucket_epoch in enumerate(self._epochs):
+            if bucket_epoch is not None and bucket_epoch > oldest:
+                calls += self._calls[i]
+                failures += self._failures[i]
+                slow_calls += self._slow_calls[i]
+
+        if calls < self.minimum_calls:
+            return None
+        if failures / calls >= self.failure_rate:
+            return 'Failure rate threshold reached, circuit breaker opened'
+        if slow_calls / calls >= self.slow_call_rate:
+            return 'Slow call rate threshold reached, circuit breaker opened'
+
+        return None
+
+    def _finish_call(self, failed, duration):
+        slow = self._is_slow(duration)
+
+        with self._lock:
+            self._trial_started_at = None
+            name = self._state.name
+
+            if name == 'half-open':
+                if failed or slow:
+                    self.open()
+                    return 'Trial call failed, circuit breaker opened'
+                self.close()
+            elif name == 'closed':
+                error = self._record(failed, slow)
+                if error:
+                    self.open()
+                return error
+
+        return None
+
+    def record_success(self, duration=None, call_state=None):
+        error = self._finish_call(False, duration)
+
+        # A slow call still returned a result, so let the caller have it.
+        if error:
+            log.error(error)
+
+    def record_failure(self, exc, duration=None):
+        if not self.is_system_error(exc):
+            return self.record_success(duration)
+
+        error = self._finish_call(True, duration)
+
+        if error:
+            raise pybreaker.CircuitBreakerError(error)
+
+    def close(self):
+        with self._lock:
+            super().close()
+            self._epochs = [None] * len(self._epochs)
@@ -1,3 +1,3 @@
-from .recommendations import RecommendationsClient
-from .popular import PopularItemsClient
-from .authentication import AuthenticationClient
+from .recommendations import AsyncRecommendationsClient, RecommendationsClient
+from .popular import AsyncPopularItemsClient, PopularItemsClient
+from .authentication import AsyncAuthenticationClient, AuthenticationClient
@@ -1,7 +1,17 @@
-import pybreaker
-
 from simulation.api_client import ApiClient
+from simulation.async_api_client import AsyncApiClient
+from simulation.bulkheads import Bulkhead
+from simulation.circuit_breakers import RateCircuitBreaker, SharedCircuitBreaker
 
 class AuthenticationClient(ApiClient):
     url = 'http://authentication:8000/authenticate'
-    circuit_breaker = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=30)
+    circuit_breaker = SharedCircuitBreaker('authentication', fail_max=5, reset_timeout=30)
+    rate_circuit_breaker = RateCircuitBreaker()
+    bulkhead = Bulkhead()
+
+
+class AsyncAuthenticationClient(AsyncApiClient):
+    url = AuthenticationClient.url
+    circuit_breaker = AuthenticationClient.circuit_breaker
+    rate_circuit_breaker = AuthenticationClient.rate_circuit_breaker
+    bulkhead = AuthenticationClient.bulkhead
@@ -1,8 +1,21 @@
-import pybreaker
-
 from simulation.api_client import ApiClient
+from simulation.async_api_client import AsyncApiClient
+from simulation.bulkheads import Bulkhead
+from simulation.circuit_breakers import RateCircuitBreaker, SharedCircuitBreaker
+from simulation.response_cache import ResponseCache
 
 class PopularItemsClient(ApiClient):
     url = 'http://popular:8003/popular_items'
-    circuit_breaker = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=30)
+    circuit_breaker = SharedCircuitBreaker('popular_items', fail_max=5, reset_timeout=30)
+    rate_circuit_breaker = RateCircuitBreaker()
+    bulkhead = Bulkhead()
+    response_cache = ResponseCache(fresh_ttl=60, stale_ttl=3600)
+
+
+class AsyncPopularItemsClient(AsyncApiClient):
+    url = PopularItemsClient.url
+    circuit_breaker = PopularItemsClient.circuit_breaker
+    rate_circuit_breaker = PopularItemsClient.rate_circuit_breaker
+    bulkhead = PopularItemsClient.bulkhead
+    response_cache = PopularItemsClient.response_cache
 
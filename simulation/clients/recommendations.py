@@ -1,8 +1,24 @@
-import pybreaker
-
 from simulation.api_client import ApiClient
+from simulation.async_api_client import AsyncApiClient
+from simulation.bulkheads import Bulkhead
+from simulation.circuit_breakers import RateCircuitBreaker, SharedCircuitBreaker
+from simulation.hedging import Hedger
+from simulation.response_cache import ResponseCache
 
 
 class RecommendationsClient(ApiClient):
     url = 'http://recommendations:8002/recommendations'
-    circuit_breaker = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=30)
+    circuit_breaker = SharedCircuitBreaker('recommendations', fail_max=5, reset_timeout=30)
+    rate_circuit_breaker = RateCircuitBreaker()
+    bulkhead = Bulkhead()
+    response_cache = ResponseCache(fresh_ttl=5, stale_ttl=300, vary=('Authorization',),
+                                   maxsize=10000)
+    hedger = Hedger()
+
+
+class AsyncRecommendationsClient(AsyncApiClient):
+    url = RecommendationsClient.url
+    circuit_breaker = RecommendationsClient.circuit_breaker
+    rate_circuit_breaker = RecommendationsClient.rate_circuit_breaker
+    bulkhead = RecommendationsClient.bulkhead
+    response_cache = RecommendationsClient.response_cache
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import threading
+import time
+import uuid
+
+import falcon
+
+from redis.exceptions import RedisError
+
+from .metrics_helpers import metrics_client
+from .redis_helpers import redis_client
+from .settings_helpers import get_client_settings
+from .settings_snapshot import settings_snapshot
+
+
+# How many seconds clients are asked to wait before retrying a request that
+# was rejected because too many were in flight.
+RETRY_AFTER = 1
+
+# The baseline latency is the lowest seen in the last one or two windows of
+# this many seconds, so that it follows lasting changes in latency.
+BASELINE_WINDOW = 30
+
+# The Redis sorted set of the requests in flight in any of a service's
+# processes, scored by when they started.
+IN_FLIGHT_KEY = 'concurrency_limit:{}'
+
+# Requests still in the set after this many seconds are assumed to belong
+# to a process that died before it could remove them.
+IN_FLIGHT_EXPIRY = 60
+
+log = logging.getLogger(__name__)
+metrics = metrics_client()
+snapshot = settings_snapshot()
+
+
+class AIMDLimiter:
+    """Limits how many requests are in flight, adapting to their latency.
+
+    The limit grows by one each time a full limit's worth of requests
+    finish with normal latency, and only while the limit is at least half
+    used, so an idle server does not build up a limit it never tested.
+    It is multiplied by ``backoff_ratio`` when a request takes longer than
+    ``tolerance`` times the baseline latency, which is the lowest latency
+    seen recently. This is the additive-increase, multiplicative-decrease
+    (AIMD) algorithm that TCP uses for its congestion window. Like TCP, it
+    backs off at most once per round trip: slow requests that started
+    before the last back off finished don't back off again, so a burst of
+    them doesn't drive the limit to ``min_limit``.
+    """
+    def __init__(self, initial_limit=20, min_limit=1, max_limit=200, backoff_ratio=0.9,
+                 tolerance=2.0, window=BASELINE_WINDOW, clock=time.monotonic):
+        self.initial_limit = initial_limit
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.tolerance = tolerance
+        self.window = window
+        self.in_flight = 0
+        self._clock = clock
+        self._baseline = None
+        self._previous_baseline = None
+        self._window_started_at = clock()
+        self._backed_off_at = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return False if another request cannot start.
+
+        Otherwise count the request, and return a value to pass to
+        `release()` when it finishes.
+        """
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, request=None):
+        """Record that a request finished after ``latency`` seconds."""
+        with self._lock:
+            self.in_flight -= 1
+            self._adapt(latency)
+
+    def reset(self):
+        """Go back to the initial limit, and forget the baseline latency."""
+        with self._lock:
+            self.limit = self.initial_limit
+            self._baseline = None
+            self._previous_baseline = None
+            self._window_started_at = self._clock()
+            self._backed_off_at = None
+
+    def _adapt(self, latency):
+        baseline = self._update_baseline(latency)
+
+        if latency > baseline * self.tolerance:
+            now = self._clock()
+
+            if self._backed_off_at is None or now - latency >= self._backed_off_at:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                self._backed_off_at = now
+        elif self.in_flight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _update_baseline(self, latency):
+        now = self._clock()
+
+        if now - self._window_started_at >= self.window:
+            self._previous_baseline, self._baseline = self._baseline, None
+            self._window_started_at = now
+
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+
+        if self._previous_baseline is None:
+            return self._baseline
+        return min(self._baseline, self._previous_baseline)
+
+
+class SharedAIMDLimiter(AIMDLimiter):
+    """An AIMDLimiter that counts the requests in flight in every process.
+
+    gunicorn's sync workers handle one request at a time, so a limit on
+    the requests in flight in one of them could never be reached. This
+    limiter counts the requests in flight in every process of the service
+    ``name`` in a Redis sorted set, and each process adapts its own limit
+    on that count to the latencies it sees. A request costs two round-trips
+    to Redis, one when it starts and one when it finishes.
+
+    If Redis is unavailable, requests are let through uncounted.
+    """
+    def __init__(self, name, *args, redis=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = name
+        self.key = IN_FLIGHT_KEY.format(name)
+        self._redis = redis or redis_client()
+
+    def acquire(self):
+        request = uuid.uuid4().hex
+        now = time.time()
+
+        try:
+            pipe = self._redis.pipeline()
+            pipe.zremrangebyscore(self.key, '-inf', now - IN_FLIGHT_EXPIRY)
+            pipe.zadd(self.key, now, request)
+            pipe.zcard(self.key)
+            in_flight = pipe.execute()[-1]
+
+            if in_flight > int(self.limit):
+                self._redis.zrem(self.key, request)
+                return False
+        except RedisError:
+            log.exception('Could not count requests in flight for %s', self.name)
+            return None
+
+        self.in_flight = in_flight
+        return request
+
+    def release(self, latency, request=None):
+        if request is not None:
+            try:
+                pipe = self._redis.pipeline()
+                pipe.zrem(self.key, request)
+                pipe.zcard(self.key)
+                self.in_flight = pipe.execute()[-1]
+            except RedisError:
+                log.exception('Could not count requests in flight for %s', self.name)
+
+        with self._lock:
+            self._adapt(latency)
+
+
+class ConcurrencyLimitMiddleware:
+    """Middleware that sheds requests beyond an adaptive concurrency limit.
+
+    When the ``concurrency_limit`` setting is on, requests beyond the
+    `AIMDLimiter`'s limit are rejected at once with a 503 and a
+    Retry-After header, rather than waiting behind requests the process
+    cannot finish in good time. Rejections are counted as
+    ``concurrency_limit.rejected`` and the limit is reported as the
+    ``concurrency_limit.limit`` gauge.
+
+    The limit applies to the requests the ``limiter`` counts: those in
+    flight in one process for an `AIMDLimiter`, which only has an effect
+    when a process serves requests concurrently, as the ASGI apps do, or
+    those in flight in all of a service's processes for a
+    `SharedAIMDLimiter`, as gunicorn's sync workers need.
+    """
+    def __init__(self, limiter=None, settings=None):
+        self.limiter = limiter or AIMDLimiter()
+
+        if settings:
+            self.apply_settings(settings)
+        else:
+            self.apply_settings(get_client_settings())
+            snapshot.watch(self.apply_settings)
+            snapshot.watch_reset(self.limiter.reset)
+
+    def apply_settings(self, settings):
+        """Change the settings used for new requests."""
+        self.enabled = settings['concurrency_limit']
+
+    def process_request(self, req, resp):
+        if not self.enabled:
+            return
+
+        request = self.limiter.acquire()
+
+        if request is False:
+            metrics.incr('concurrency_limit.rejected', tags={'path': req.path})
+            raise falcon.HTTPServiceUnavailable(
+                'Server overloaded', 'Too many requests are in progress.', RETRY_AFTER)
+
+        req.context['concurrency_limit'] = time.perf_counter(), request
+
+    def process_response(self, req, resp, resource):
+        started = req.context.pop('concurrency_limit', None)
+
+        if started is not None:
+            start, request = started
+            self.limiter.release(time.perf_counter() - start, request)
+            metrics.gauge('concurrency_limit.limit', int(self.limiter.limit))
+
+
+class AsyncConcurrencyLimitMiddleware(ConcurrencyLimitMiddleware):
+    """An asyncio version of ConcurrencyLimitMiddleware, for `AsyncApp`."""
+    async def process_request(self, req, resp):
+        super().process_request(req, resp)
+
+    async def process_response(self, req, resp, resource):
+        super().process_response(req, resp, resource)
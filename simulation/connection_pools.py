@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import socket
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from requests.packages.urllib3.poolmanager import PoolManager
+
+from .metrics_helpers import metrics_client
+
+
+# The number of hosts whose connection pools a pool manager keeps.
+POOL_CONNECTIONS = 10
+
+# Ask the OS to probe idle connections so that dead peers are noticed.
+KEEP_ALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+]
+
+log = logging.getLogger(__name__)
+metrics = metrics_client()
+
+_pool_managers = {}
+_lock = threading.Lock()
+
+
+class IdleTrackingPoolMixin:
+    """Records when each connection was put back in the pool, as its
+    ``idle_since`` attribute, so that idle connections can be found."""
+    def _put_conn(self, conn):
+        if conn:
+            conn.idle_since = time.monotonic()
+        super()._put_conn(conn)
+
+
+class IdleTrackingHTTPConnectionPool(IdleTrackingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class IdleTrackingHTTPSConnectionPool(IdleTrackingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+POOL_CLASSES_BY_SCHEME = {
+    'http': IdleTrackingHTTPConnectionPool,
+    'https': IdleTrackingHTTPSConnectionPool
+}
+
+
+def shared_pool_manager(maxsize, block, keep_alive):
+    """Return the process's `PoolManager` for the given pool settings.
+
+    Every adapter with the same pool settings shares one pool manager, so
+    API clients for the same host share one pool of connections.
+    """
+    key = (maxsize, block, keep_alive)
+
+    with _lock:
+        manager = _pool_managers.get(key)
+
+        if manager is None:
+            if keep_alive:
+                socket_options = KEEP_ALIVE_SOCKET_OPTIONS
+            else:
+                socket_options = HTTPConnection.default_socket_options
+            manager = _pool_managers[key] = PoolManager(
+                num_pools=POOL_CONNECTIONS, maxsize=maxsize, block=block,
+                strict=True, socket_options=socket_options)
+            manager.pool_classes_by_scheme = POOL_CLASSES_BY_SCHEME
+
+    return manager
+
+
+class PooledAdapter(HTTPAdapter):
+    """An HTTPAdapter whose connection pools are shared and monitored.
+
+    Each host gets a pool of up to ``maxsize`` connections. If ``block`` is
+    True, requests wait for a connection when all of them are in use;
+    otherwise, they open a new connection that is discarded afterward.
+    Connections that have been idle for ``idle_timeout`` seconds are closed
+    rather than reused, however busy the pool's other connections are. If
+    ``keep_alive`` is True, TCP keep-alive probes are enabled on new
+    connections.
+
+    Adapters with the same pool settings share connection pools (see
+    `shared_pool_manager()`), so replacing an adapter keeps its connections.
+
+    Before each request, the number of connections in use is reported as
+    the ``connection_pool.in_use`` gauge, and requests that find every
+    connection in use count toward ``connection_pool.saturated``.
+    """
+    def __init__(self, maxsize=10, block=False, idle_timeout=60, keep_alive=True, **kwargs):
+        self.idle_timeout = idle_timeout
+        self.keep_alive = keep_alive
+        super().__init__(pool_connections=POOL_CONNECTIONS, pool_maxsize=maxsize,
+                         pool_block=block, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = shared_pool_manager(maxsize, block, self.keep_alive)
+
+    def get_connection(self, url, proxies=None):
+        pool = super().get_connection(url, proxies)
+
+        if self.idle_timeout:
+            self._close_idle_connections(pool)
+
+        self._report_usage(pool)
+
+        return pool
+
+    def _close_idle_connections(self, pool):
+        idle_since = time.monotonic() - self.idle_timeout
+
+        # Closed connections stay in the pool and reconnect when next used.
+        with pool.pool.mutex:
+            for conn in pool.pool.queue:
+                if conn and conn.sock and getattr(conn, 'idle_since', idle_since) < idle_since:
+                    log.debug('Closing idle connection to %s', pool.host)
+                    conn.close()
+
+    def _report_usage(self, pool):
+        tags = {'host': pool.host}
+        # The queue holds idle connections and placeholders for connections
+        # that have not been opened yet; the rest are in use.
+        available = pool.pool.qsize()
+        metrics.gauge('connection_pool.in_use', self._pool_maxsize - available, tags=tags)
+
+        if not available:
+            metrics.incr('connection_pool.saturated', tags=tags)
+
+    def close(self):
+        # The pools are shared with other adapters, so leave them open.
+        pass
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import time
+
+import falcon
+
+from .metrics_helpers import metrics_client
+
+
+# The header that carries a request's deadline from one service to the
+# next, as the number of milliseconds left. A duration rather than a time
+# of day keeps the deadline independent of each host's clock.
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+log = logging.getLogger(__name__)
+metrics = metrics_client()
+
+
+def deadline_from_header(value):
+    """Return the `time.monotonic()` deadline given by a header ``value``.
+
+    Returns None if there is no header or it is not a number.
+    """
+    if value is None:
+        return None
+
+    try:
+        return time.monotonic() + float(value) / 1000
+    except ValueError:
+        log.warning('Ignoring invalid %s header: %r', DEADLINE_HEADER, value)
+        return None
+
+
+def deadline_header(deadline):
+    """Return the header value that passes ``deadline`` to another service."""
+    return str(max(int((deadline - time.monotonic()) * 1000), 0))
+
+
+def remaining(deadline):
+    """Return the seconds left until ``deadline``, or None if there is none."""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def earliest(*deadlines):
+    """Return the earliest of ``deadlines`` that is not None."""
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    return min(deadlines) if deadlines else None
+
+
+def check_deadline(req):
+    """Raise a 504 error if the deadline of ``req`` has passed."""
+    deadline = req.context.get('deadline')
+
+    if deadline is not None and deadline <= time.monotonic():
+        log.info('Shedding request past its deadline: %s', req.path)
+        metrics.incr('deadline_exceeded', tags={'path': req.path})
+        raise falcon.HTTPError(falcon.HTTP_504, 'Deadline exceeded',
+                               'The request was not completed before its deadline.')
+
+
+class DeadlineMiddleware:
+    """Middleware that sheds requests whose deadline has passed.
+
+    The deadline sent in the DEADLINE_HEADER header is put in
+    ``req.context['deadline']`` as a `time.monotonic()` time, or None, for
+    the middleware and resources after this one to pass on to the services
+    they call.
+    """
+    def process_request(self, req, resp):
+        req.context['deadline'] = deadline_from_header(req.get_header(DEADLINE_HEADER))
+        check_deadline(req)
+
+
+class AsyncDeadlineMiddleware(DeadlineMiddleware):
+    """An asyncio version of DeadlineMiddleware, for `AsyncApp`."""
+    async def process_request(self, req, resp):
+        super().process_request(req, resp)
@@ -3,7 +3,27 @@
 
 DEFAULT_SETTINGS = {
     'circuit_breakers': True,
+    'shared_circuit_breakers': False,
+    'circuit_breaker_mode': 'consecutive_failures',
+    'failure_rate_threshold': 0.5,
+    'slow_call_duration': None,
+    'slow_call_rate_threshold': 1.0,
     'timeout': None,
     'retries': False,
+    'retry_budget': None,
+    'hedged_requests': False,
+    'hedge_percentile': 95,
+    'hedge_budget': 0.1,
+    'response_cache': False,
+    'bulkheads': False,
+    'bulkhead_max_concurrent': 10,
+    'fan_out': False,
+    'deadline': None,
+    'concurrency_limit': False,
+    'pool_maxsize': 10,
+    'pool_block': False,
+    'pool_idle_timeout': 60,
+    'keep_alive': True,
+    'latency_injection': 'blocking',
     'outages': []
 }
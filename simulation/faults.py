@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import http.client
+import math
+import random
+import time
+
+
+# How injected latency is simulated. A BLOCKING delay holds a worker of the
+# slow service, as slow work would, so enough slow requests leave the
+# service out of workers. A NON_BLOCKING delay is waited out by the
+# service's callers instead, as if the responses were slow to arrive, so
+# the service itself can keep up with any number of them.
+BLOCKING = 'blocking'
+NON_BLOCKING = 'non_blocking'
+
+# The range of seconds that a performance problem delays responses by.
+PERFORMANCE_PROBLEM_DELAY = (5, 10)
+
+FIXED = 'fixed'
+UNIFORM = 'uniform'
+LOGNORMAL = 'lognormal'
+BIMODAL = 'bimodal'
+
+# The parameters of each latency distribution, all in seconds except
+# ``sigma``, the standard deviation of the latency's natural logarithm,
+# and ``slow_fraction``, the fraction of requests that take ``slow``
+# seconds rather than ``fast``.
+DISTRIBUTIONS = {
+    FIXED: ('seconds',),
+    UNIFORM: ('min', 'max'),
+    LOGNORMAL: ('median', 'sigma'),
+    BIMODAL: ('fast', 'slow', 'slow_fraction')
+}
+
+SLOW_BODY_PARAMETERS = ('chunk_size', 'interval')
+
+
+def _number(spec, name, minimum=0, maximum=None):
+    value = spec.get(name)
+
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('{} must be a number'.format(name))
+
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError('{} must be between {} and {}'.format(
+            name, minimum, 'infinity' if maximum is None else maximum))
+
+    return value
+
+
+def _check_keys(spec, name, allowed):
+    if not isinstance(spec, dict):
+        raise ValueError('{} must be an object'.format(name))
+
+    unknown = set(spec) - set(allowed)
+
+    if unknown:
+        raise ValueError('Unknown {} parameters: {}; valid parameters are: {}'.format(
+            name, ', '.join(sorted(unknown)), ', '.join(allowed)))
+
+
+class FaultProfile:
+    """The faults to simulate in responses from one path.
+
+    Each response is delayed by a latency drawn from ``latency``, a
+    distribution like ``{"distribution": "lognormal", "median": 0.1,
+    "sigma": 1}`` (see DISTRIBUTIONS). Then, with probability
+    ``error_rate``, the response is replaced with an error whose status is
+    picked from ``error_statuses``. Otherwise, if ``slow_body`` is given as
+    ``{"chunk_size": bytes, "interval": seconds}``, the body is sent a
+    chunk at a time with a pause before each chunk.
+
+    Responses are faulted by the service, but connection resets, which
+    happen with probability ``reset_rate``, are simulated by API clients
+    like outages are.
+    """
+    FIELDS = ('latency', 'error_rate', 'error_statuses', 'reset_rate', 'slow_body')
+
+    def __init__(self, latency=None, error_rate=0, error_statuses=(500,), reset_rate=0,
+                 slow_body=None, random=random):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.reset_rate = reset_rate
+        self.slow_body = slow_body
+        self._random = random
+
+    @classmethod
+    def from_dict(cls, profile):
+        """Return the profile described by the dict ``profile``.
+
+        Raises ValueError if ``profile`` is not valid.
+        """
+        _check_keys(profile, 'fault profile', cls.FIELDS)
+        latency = profile.get('latency')
+        slow_body = profile.get('slow_body')
+        error_statuses = profile.get('error_statuses', [500])
+
+        if latency is not None:
+            distribution = latency.get('distribution') if isinstance(latency, dict) else None
+
+            if distribution not in DISTRIBUTIONS:
+                raise ValueError('latency distribution must be one of: {}'.format(
+                    ', '.join(sorted(DISTRIBUTIONS))))
+
+            _check_keys(latency, 'latency', ('distribution',) + DISTRIBUTIONS[distribution])
+
+            for name in DISTRIBUTIONS[distribution]:
+                _number(latency, name, maximum=1 if name == 'slow_fraction' else None)
+
+            if distribution == UNIFORM and latency['min'] > latency['max']:
+                raise ValueError('min must not be more than max')
+
+        if (not isinstance(error_statuses, list) or not error_statuses or
+                not all(status in http.client.responses and status >= 400
+                        for status in error_statuses)):
+            raise ValueError('error_statuses must be a list of HTTP error status codes')
+
+        if slow_body is not None:
+            _check_keys(slow_body, 'slow_body', SLOW_BODY_PARAMETERS)
+            _number(slow_body, 'chunk_size', minimum=1)
+            _number(slow_body, 'interval')
+
+        rates = {name: _number(profile, name, maximum=1)
+                 for name in ('error_rate', 'reset_rate') if name in profile}
+
+        return cls(latency=latency, error_statuses=error_statuses, slow_body=slow_body, **rates)
+
+    def to_dict(self):
+        profile = {
+            'error_rate': self.error_rate,
+            'error_statuses': self.error_statuses,
+            'reset_rate': self.reset_rate
+        }
+
+        if self.latency is not None:
+            profile['latency'] = self.latency
+        if self.slow_body is not None:
+            profile['slow_body'] = self.slow_body
+
+        return profile
+
+    def __eq__(self, other):
+        return isinstance(other, FaultProfile) and self.to_dict() == other.to_dict()
+
+    def delay(self):
+        """Return how many seconds to delay a response by."""
+        latency = self.latency
+
+        if latency is None:
+            return 0
+
+        distribution = latency['distribution']
+
+        if distribution == FIXED:
+            return latency['seconds']
+        if distribution == UNIFORM:
+            return self._random.uniform(latency['min'], latency['max'])
+        if distribution == LOGNORMAL:
+            if latency['median'] == 0:
+                return 0
+            return self._random.lognormvariate(math.log(latency['median']), latency['sigma'])
+
+        if self._random.random() < latency['slow_fraction']:
+            return latency['slow']
+        return latency['fast']
+
+    def error_status(self):
+        """Return the status of an error to respond with, or None."""
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self._random.choice(self.error_statuses)
+        return None
+
+    def should_reset(self):
+        """Return True if a request should fail with a connection reset."""
+        return bool(self.reset_rate) and self._random.random() < self.reset_rate
+
+    def _chunks(self, data):
+        size = int(self.slow_body['chunk_size'])
+        return [data[start:start + size] for start in range(0, len(data), size)]
+
+    def drip(self, data):
+        """Yield ``data`` a chunk at a time, pausing before each chunk."""
+        for chunk in self._chunks(data):
+            time.sleep(self.slow_body['interval'])
+            yield chunk
+
+    async def async_drip(self, data):
+        """An asyncio version of `drip()`."""
+        for chunk in self._chunks(data):
+            await asyncio.sleep(self.slow_body['interval'])
+            yield chunk
+
+
+def injected_delay(snapshot, path):
+    """Return how many seconds to delay responses from ``path`` by.
+
+    The delay is for the performance problems and fault profiles in the
+    settings ``snapshot``. Returns None if ``path`` has no latency to inject.
+    """
+    delay = None
+
+    if snapshot.has_performance_problem(path):
+        delay = random.randint(*PERFORMANCE_PROBLEM_DELAY)
+
+    profile = snapshot.fault_profile(path)
+
+    if profile is not None and profile.latency is not None:
+        delay = (delay or 0) + profile.delay()
+
+    return delay
+
+
+def status_line(status):
+    """Return the falcon status line for the status code ``status``."""
+    return '{} {}'.format(status, http.client.responses[status])
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import logging
+import socketserver
+import threading
+import time
+
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import simulation
+
+# Run the services as they run in tests, sharing an in-memory stand-in for
+# Redis and not sending metrics. This has to happen before the services are
+# imported, since they connect to Redis when they are.
+simulation.TESTING = True
+
+from . import authentication, homepage, popular_items, recommendations, settings  # noqa: E402
+from .clients import (  # noqa: E402
+    AsyncAuthenticationClient,
+    AsyncPopularItemsClient,
+    AsyncRecommendationsClient,
+    AuthenticationClient,
+    PopularItemsClient,
+    RecommendationsClient
+)
+
+
+HOST = '127.0.0.1'
+
+# How often, in seconds, each server checks whether it has been stopped.
+POLL_INTERVAL = 0.05
+
+# How many connections each server lets wait to be accepted. Beyond this,
+# new connections are dropped and only retried a second later, so a small
+# backlog adds one-second outliers to load tests.
+REQUEST_QUEUE_SIZE = 128
+
+# Each service's app, by the hostname other services reach it by in
+# docker-compose.yml.
+SERVICES = OrderedDict([
+    ('authentication', authentication.api),
+    ('home', homepage.api),
+    ('recommendations', recommendations.api),
+    ('popular', popular_items.api),
+    ('settings', settings.api)
+])
+
+# The clients whose URLs point at other services.
+CLIENTS = (
+    AuthenticationClient,
+    AsyncAuthenticationClient,
+    PopularItemsClient,
+    AsyncPopularItemsClient,
+    RecommendationsClient,
+    AsyncRecommendationsClient
+)
+
+log = logging.getLogger(__name__)
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """A WSGI server that handles each request in its own thread, so that
+    slow requests don't hold up the others, like gunicorn's workers."""
+    daemon_threads = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def rewrite_url(url, netloc):
+    """Return ``url`` with its host and port replaced by ``netloc``."""
+    return urlsplit(url)._replace(netloc=netloc).geturl()
+
+
+class Harness:
+    """Serves each service in SERVICES on an ephemeral port on ``host``.
+
+    `start()` also points the CLIENTS at those ports, and `stop()` points
+    them back. Use it as a context manager:
+
+        with Harness() as harness:
+            requests.get(harness.home_url, headers={'Authorization': 'Token 0x123'})
+    """
+    def __init__(self, host=HOST):
+        self.host = host
+        self.servers = OrderedDict()
+        self._threads = []
+        self._client_urls = {}
+
+    def url(self, service, path='/'):
+        """Return the URL of ``path`` on ``service``."""
+        return 'http://{}:{}{}'.format(self.host, self.servers[service].server_port, path)
+
+    @property
+    def home_url(self):
+        return self.url('home')
+
+    @property
+    def settings_url(self):
+        return self.url('settings', '/settings')
+
+    def start(self):
+        for service, app in SERVICES.items():
+            server = make_server(self.host, 0, app, server_class=ThreadingWSGIServer,
+                                 handler_class=QuietRequestHandler)
+            thread = threading.Thread(target=server.serve_forever, name=service,
+                                      kwargs={'poll_interval': POLL_INTERVAL})
+            thread.daemon = True
+            thread.start()
+            self.servers[service] = server
+            self._threads.append(thread)
+            log.info('Serving %s at %s', service, self.url(service))
+
+        for client in CLIENTS:
+            service = urlsplit(client.url).hostname
+            self._client_urls[client] = client.url
+            client.url = rewrite_url(client.url, '{}:{}'.format(
+                self.host, self.servers[service].server_port))
+
+        return self
+
+    def stop(self):
+        for client, url in self._client_urls.items():
+            client.url = url
+
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+        for thread in self._threads:
+            thread.join()
+
+        self._client_urls.clear()
+        self.servers.clear()
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+parser = argparse.ArgumentParser(description='Run the simulation services in this process')
+parser.add_argument('--host', default=HOST, help='The address to serve the services on')
+parser.add_argument('--log-level', default='WARNING',
+                    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                    help='The level of the services\' logs to show')
+
+
+def main(args=None):
+    flags = parser.parse_args(args)
+    logging.getLogger().setLevel(flags.log_level)
+
+    with Harness(flags.host) as harness:
+        print('Homepage: {}'.format(harness.home_url))
+        print('Settings: {}'.format(harness.settings_url))
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
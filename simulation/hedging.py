@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+
+from .histogram import Histogram
+from .jittery_retry import RetryBudget
+from .metrics_helpers import metrics_client
+
+
+# The most attempts a Hedger will have in flight at once. Each hedged
+# request takes one or two.
+HEDGE_POOL_SIZE = 20
+
+# Latencies are collected for this many seconds before a new collection
+# starts, so that the hedging delay follows changes in latency.
+HEDGE_WINDOW = 60
+
+# The fewest latencies needed to choose a hedging delay. Requests are not
+# hedged until this many have been collected.
+HEDGE_MINIMUM_SAMPLES = 20
+
+log = logging.getLogger(__name__)
+metrics = metrics_client()
+
+
+class Hedger:
+    """Hedges slow requests by sending a second attempt.
+
+    `call()` makes a first attempt. If it has not finished after the
+    ``percentile`` latency of recent attempts, a second attempt is made,
+    and whichever finishes first wins. The second attempt is only made
+    while hedges stay under the ``budget`` fraction of requests (see
+    `RetryBudget`). The losing attempt is left to finish in the background.
+
+    Attempts run in the Hedger's own pool of ``pool_size`` threads. They
+    never queue for a thread, since they would then wait behind losing
+    attempts: when every thread is busy, the first attempt is made in the
+    calling thread instead, without a hedge, and a hedge is not made.
+    Both are counted as ``<name>.hedge_pool_full``.
+
+    Latencies are kept in a histogram that is replaced every ``window``
+    seconds; until one holds ``minimum_samples`` latencies, the previous
+    one is used.
+    """
+    def __init__(self, percentile=95, budget=0.1, window=HEDGE_WINDOW,
+                 minimum_samples=HEDGE_MINIMUM_SAMPLES, pool_size=HEDGE_POOL_SIZE,
+                 clock=time.monotonic):
+        self.percentile = percentile
+        self.budget = RetryBudget(ratio=budget, min_per_second=0)
+        self.window = window
+        self.minimum_samples = minimum_samples
+        self._clock = clock
+        self._current = Histogram()
+        self._previous = Histogram()
+        self._started_at = clock()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+        # Counts the pool's idle threads, so that attempts never queue.
+        self._idle_threads = threading.BoundedSemaphore(pool_size)
+
+    def apply_settings(self, settings):
+        """Use the percentile and budget from the simulation's ``settings``."""
+        self.percentile = float(settings['hedge_percentile'])
+        self.budget.ratio = float(settings['hedge_budget'])
+
+    def reset(self):
+        """Forget the latencies recorded so far, and refill the budget."""
+        with self._lock:
+            self._current = Histogram()
+            self._previous = Histogram()
+            self._started_at = self._clock()
+
+        self.budget.reset()
+
+    def _rotate(self):
+        now = self._clock()
+
+        if now - self._started_at >= self.window:
+            self._previous, self._current = self._current, Histogram()
+            self._started_at = now
+
+    def record(self, seconds):
+        """Record the latency of a successful attempt."""
+        with self._lock:
+            self._rotate()
+            # Histograms count integers, so keep microsecond precision.
+            self._current.record(seconds * 1000 * 1000)
+
+        self.budget.deposit()
+
+    def delay(self):
+        """Return how long to wait before hedging, or None if unknown."""
+        with self._lock:
+            self._rotate()
+            histogram = self._current
+
+            if histogram.count < self.minimum_samples:
+                histogram = self._previous
+            if histogram.count < self.minimum_samples:
+                return None
+
+            return histogram.percentile(self.percentile) / 1000 / 1000
+
+    def call(self, attempt, name):
+        """Return the result of ``attempt()``, hedging it if it is slow.
+
+        ``name`` identifies the request in the ``<name>.hedged`` and
+        ``<name>.hedge_won`` counters.
+        """
+        if not self._idle_threads.acquire(blocking=False):
+            metrics.incr('{}.hedge_pool_full'.format(name))
+            return self._timed(attempt)
+
+        first = self._executor.submit(self._run, attempt)
+
+        try:
+            return first.result(timeout=self.delay())
+        except TimeoutError:
+            pass
+
+        if not self._idle_threads.acquire(blocking=False):
+            metrics.incr('{}.hedge_pool_full'.format(name))
+            return first.result()
+
+        if not self.budget.withdraw():
+            self._idle_threads.release()
+            metrics.incr('{}.hedge_budget_exhausted'.format(name))
+            return first.result()
+
+        log.info('Hedging slow request: %s', name)
+        metrics.incr('{}.hedged'.format(name))
+        second = self._executor.submit(self._run, attempt)
+        pending = {first, second}
+
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+
+            if succeeded:
+                if second in succeeded:
+                    metrics.incr('{}.hedge_won'.format(name))
+                return succeeded[0].result()
+
+            # A failed attempt only counts if the other failed too.
+            if not pending:
+                return done.pop().result()
+
+    def _run(self, attempt):
+        """Make ``attempt`` on a thread of the pool, then mark it idle."""
+        try:
+            return self._timed(attempt)
+        finally:
+            self._idle_threads.release()
+
+    def _timed(self, attempt):
+        start = time.perf_counter()
+        result = attempt()
+        self.record(time.perf_counter() - start)
+        return result
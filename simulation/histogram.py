@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import math
+
+
+class Histogram:
+    """A fixed-size histogram of non-negative integers, like HdrHistogram.
+
+    Values are counted in buckets whose width grows with the magnitude of
+    the values they hold, so any recorded value can be reported to within
+    ``significant_figures`` decimal digits of precision, using the same
+    amount of memory no matter how many values are recorded.
+
+    Values below ``2 * 10 ** significant_figures`` each get their own
+    bucket. Above that, each power of two is split into the same number of
+    equally wide buckets. Values larger than ``highest_value`` are counted
+    as ``highest_value``.
+
+    See: http://hdrhistogram.org/
+    """
+    def __init__(self, highest_value=3600 * 1000 * 1000, significant_figures=2):
+        self.highest_value = highest_value
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_figures))
+        self._sub_bucket_count = 2 ** self._sub_bucket_bits
+        self._half_count = self._sub_bucket_count // 2
+        self._counts = [0] * (self._index(highest_value) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub_bucket_count:
+            return value
+
+        # Every value in [2 ** (bits + shift - 1), 2 ** (bits + shift)) lands
+        # in one of half_count buckets, each 2 ** shift wide.
+        shift = value.bit_length() - self._sub_bucket_bits
+        sub_bucket = value >> shift
+        return self._sub_bucket_count + (shift - 1) * self._half_count + (sub_bucket - self._half_count)
+
+    def _highest_equivalent_value(self, index):
+        if index < self._sub_bucket_count:
+            return index
+
+        offset = index - self._sub_bucket_count
+        shift = offset // self._half_count + 1
+        sub_bucket = offset % self._half_count + self._half_count
+        return (sub_bucket << shift) + (1 << shift) - 1
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.highest_value)
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, percentile):
+        """Return the value below which ``percentile`` percent of values fall.
+
+        The result is the largest value that shares a bucket with the
+        percentile value, capped at the largest recorded value.
+        """
+        if not self.count:
+            return 0
+
+        target = max(1, math.ceil(percentile / 100 * self.count))
+        seen = 0
+
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_equivalent_value(index), self.max)
+
+        return self.max
@@ -1,22 +1,48 @@
 #!/usr/bin/env python
 # encoding: utf-8
-import json
+import asyncio
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 
 import falcon
 import statsd
 
+from .asgi import AsyncApp
 from .clients import (
+    AsyncPopularItemsClient,
+    AsyncRecommendationsClient,
     AuthenticationClient,
     PopularItemsClient,
     RecommendationsClient
 )
+from .concurrency_limits import (
+    AsyncConcurrencyLimitMiddleware,
+    ConcurrencyLimitMiddleware,
+    SharedAIMDLimiter
+)
+from .deadlines import AsyncDeadlineMiddleware, DeadlineMiddleware, earliest, remaining
 from .metrics_helpers import metrics_client
-from .middleware import PermissionsMiddleware
+from .response_cache import STALE_WARNING, is_stale
+from .serializers import splice
+from .middleware import AsyncPermissionsMiddleware, PermissionsMiddleware
+from .settings_helpers import get_client_settings
+from .settings_snapshot import settings_snapshot
+
 
+# The most downstream calls a single worker process will have in flight
+# at once when fanning out.
+FAN_OUT_POOL_SIZE = 10
 
+log = logging.getLogger(__name__)
 metrics = metrics_client()
+snapshot = settings_snapshot()
 recommended = RecommendationsClient()
 popular = PopularItemsClient()
+async_recommended = AsyncRecommendationsClient()
+async_popular = AsyncPopularItemsClient()
+executor = ThreadPoolExecutor(max_workers=FAN_OUT_POOL_SIZE)
 
 
 class HomepageResource:
@@ -39,25 +65,140 @@ class HomepageResource:
         {"recommendations": [12, 23, 100, 122, 220, 333, 340, 400, 555, 654], "popular_items": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]}
 
     Note that the request must include an authentication token.
+
+    If the ``fan_out`` setting is enabled, requests to the recommendations
+    and popularity services are made concurrently.
+
+    The ``deadline`` setting caps the time spent waiting for both of them,
+    as does any deadline the request came with (see `DeadlineMiddleware`).
+    The services are given the deadline, and any service that has not
+    responded when it passes is treated as unavailable.
+
+    If a client served a stale cached response (see `ResponseCache`), the
+    homepage is marked stale with the same Warning header.
     """
+    def __init__(self, settings=None):
+        if settings:
+            self.apply_settings(settings)
+        else:
+            self.apply_settings(get_client_settings())
+            snapshot.watch(self.apply_settings)
+
+    def apply_settings(self, settings):
+        """Change the settings used for new requests."""
+        settings = settings.copy()
+
+        if settings['deadline']:
+            settings['deadline'] = float(settings['deadline'])
+
+        self.settings = settings
+
+    def _deadline(self, req):
+        """Return the deadline for the services this request calls."""
+        if self.settings['deadline']:
+            deadline = time.monotonic() + self.settings['deadline']
+        else:
+            deadline = None
+
+        return earliest(req.context.get('deadline'), deadline)
+
+    def _fetch_sequentially(self, auth_header, deadline):
+        return {
+            'recommendations': recommended.get(headers=auth_header, deadline=deadline),
+            'popular_items': popular.get(headers=auth_header, deadline=deadline)
+        }
+
+    def _fetch_concurrently(self, auth_header, deadline):
+        futures = {
+            executor.submit(recommended.get, headers=auth_header, deadline=deadline): 'recommendations',
+            executor.submit(popular.get, headers=auth_header, deadline=deadline): 'popular_items'
+        }
+        responses = {}
+
+        try:
+            for future in as_completed(futures, timeout=remaining(deadline)):
+                responses[futures[future]] = future.result()
+        except TimeoutError:
+            # Requests still waiting for a thread would only hold up other
+            # homepage requests that share the pool, so they are dropped.
+            for future in futures:
+                future.cancel()
+            self._deadline_exceeded(set(futures.values()) - set(responses))
+
+        return responses
+
+    def _deadline_exceeded(self, missing):
+        log.error('Deadline exceeded waiting for: %s', ', '.join(sorted(missing)))
+        metrics.incr('homepage.deadline_exceeded')
+
+    def _render(self, responses, resp):
+        if any(response is not None and is_stale(response) for response in responses.values()):
+            resp.set_header('Warning', STALE_WARNING)
+
+        # The services' responses are already JSON, so they are copied into
+        # the homepage as they are.
+        resp.data = splice({
+            name: self._content(responses.get(name))
+            for name in ('recommendations', 'popular_items')
+        })
+
+    def _content(self, response):
+        if response is None or response.status_code != 200:
+            return b'[]'
+        return response.content
 
     def on_get(self, req, resp):
         """Return data for the homepage."""
         auth_header = req.context.get('auth_header')
-        recommendations = recommended.get(headers=auth_header)
-        recommendations = recommendations.json() if recommendations else []
-        popular_items = popular.get(headers=auth_header)
-        popular_items = popular_items.json() if popular_items else []
-
-        resp.body = json.dumps({
-            'recommendations': recommendations,
-            'popular_items': popular_items
-        })
+        deadline = self._deadline(req)
+
+        if self.settings['fan_out']:
+            responses = self._fetch_concurrently(auth_header, deadline)
+        else:
+            responses = self._fetch_sequentially(auth_header, deadline)
 
+        self._render(responses, resp)
+        metrics.incr('homepage.get')
+
+
+class AsyncHomepageResource(HomepageResource):
+    """An asyncio version of HomepageResource, for `AsyncApp`.
+
+    Requests to the recommendations and popularity services are always
+    made concurrently, within the request's deadline if there is one.
+    """
+    async def on_get(self, req, resp):
+        """Return data for the homepage."""
+        auth_header = req.context.get('auth_header')
+        deadline = self._deadline(req)
+        tasks = {
+            asyncio.ensure_future(
+                async_recommended.get(headers=auth_header, deadline=deadline)): 'recommendations',
+            asyncio.ensure_future(
+                async_popular.get(headers=auth_header, deadline=deadline)): 'popular_items'
+        }
+
+        done, pending = await asyncio.wait(tasks, timeout=remaining(deadline))
+
+        if pending:
+            for task in pending:
+                task.cancel()
+            self._deadline_exceeded({tasks[task] for task in pending})
+
+        self._render({tasks[task]: task.result() for task in done}, resp)
         metrics.incr('homepage.get')
 
 
 api = falcon.API(middleware=[
+    ConcurrencyLimitMiddleware(SharedAIMDLimiter('home')),
+    DeadlineMiddleware(),
     PermissionsMiddleware('can_view_homepage')
 ])
 api.add_route('/', HomepageResource())
+
+asgi_api = AsyncApp(middleware=[
+    AsyncConcurrencyLimitMiddleware(),
+    AsyncDeadlineMiddleware(),
+    AsyncPermissionsMiddleware('can_view_homepage')
+])
+asgi_api.add_route('/', AsyncHomepageResource())
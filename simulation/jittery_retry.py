@@ -1,15 +1,154 @@
 #!/usr/bin/env python
 # encoding: utf-8
 import random
+import threading
+import time
 
+from requests.packages.urllib3.exceptions import MaxRetryError
 from requests.packages.urllib3.util.retry import Retry
 
+from .metrics_helpers import metrics_client
+
+
+# The defaults for RetryBudget: the retries allowed per second even without
+# successful requests, and the most retries that can be saved up.
+RETRY_BUDGET_MIN_PER_SECOND = 1
+RETRY_BUDGET_CAPACITY = 100
+
+metrics = metrics_client()
+
+_local = threading.local()
+_budget = None
+
+
+def reset_retry_count(deadline=None):
+    """Start counting retries made by the current thread from zero.
+
+    If ``deadline`` is given, as a `time.monotonic()` time, the thread's
+    requests are not retried once backing off could take them past it.
+    """
+    _local.count = 0
+    _local.deadline = deadline
+
+
+def retry_count():
+    """Return the number of retries made by the current thread."""
+    return getattr(_local, 'count', 0)
+
+
+class RetryBudget:
+    """A token bucket that limits retries to a fraction of requests.
+
+    Each successful request adds ``ratio`` tokens to the bucket, and each
+    retry takes one, so retries stay under ``ratio`` times the number of
+    recent successful requests. When a dependency fails, the bucket soon
+    empties and requests stop being retried, rather than multiplying the
+    load on the dependency.
+
+    ``min_per_second`` tokens are added every second regardless, so that a
+    process can retry a little before it has seen any successes. The
+    bucket holds at most ``capacity`` tokens.
+    """
+    def __init__(self, ratio=0.1, min_per_second=RETRY_BUDGET_MIN_PER_SECOND,
+                 capacity=RETRY_BUDGET_CAPACITY, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._refilled_at = clock()
+        self._lock = threading.Lock()
+
+    def _add(self, tokens):
+        self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def deposit(self):
+        """Record a successful request."""
+        with self._lock:
+            self._add(self.ratio)
+
+    def withdraw(self):
+        """Return True if a retry is within the budget, and spend it."""
+        with self._lock:
+            now = self._clock()
+            self._add((now - self._refilled_at) * self.min_per_second)
+            self._refilled_at = now
+
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+            return True
+
+    def reset(self):
+        """Fill the bucket, as if no retries had been made."""
+        with self._lock:
+            self._tokens = self.capacity
+            self._refilled_at = self._clock()
+
+
+def retry_budget(ratio=None):
+    """Return this process's `RetryBudget`, changing its ``ratio`` if given."""
+    global _budget
+
+    if _budget is None:
+        _budget = RetryBudget()
+
+    if ratio is not None:
+        _budget.ratio = ratio
+
+    return _budget
+
 
 class RetryWithFullJitter(Retry):
     """A Retry object that applies random "full" jitter to backoff rates.
 
     Based on: https://www.awsarchitectureblog.com/2015/03/backoff.html
+
+    Retries are counted per thread, so that the caller can see how many
+    retries a request took; see `retry_count()`.
+
+    Retries after an error are skipped if they would exceed ``budget``, a
+    `RetryBudget`, or if the longest possible backoff would pass
+    ``deadline`` (a `time.monotonic()` time), which defaults to the deadline
+    given to `reset_retry_count()`. Skipped retries are counted as
+    ``retry_budget.exhausted`` and ``retry.deadline_exceeded``.
     """
+    def __init__(self, *args, budget=None, deadline=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.budget = budget
+        self.deadline = deadline
+
+    def new(self, **kwargs):
+        kwargs.setdefault('budget', self.budget)
+        kwargs.setdefault('deadline', self.deadline)
+        return super().new(**kwargs)
+
+    def increment(self, method=None, url=None, response=None, error=None,
+                  _pool=None, _stacktrace=None):
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+
+        if error is not None:
+            deadline = self.deadline
+
+            if deadline is None:
+                deadline = getattr(_local, 'deadline', None)
+
+            if deadline is not None and time.monotonic() + new_retry.max_backoff_time() >= deadline:
+                metrics.incr('retry.deadline_exceeded')
+                raise MaxRetryError(_pool, url, error)
+
+            if self.budget is not None and not self.budget.withdraw():
+                metrics.incr('retry_budget.exhausted')
+                raise MaxRetryError(_pool, url, error)
+
+        _local.count = retry_count() + 1
+        return new_retry
+
+    def max_backoff_time(self):
+        """Return the longest backoff that `get_backoff_time()` can return."""
+        return super().get_backoff_time()
+
     def get_backoff_time(self):
         value = super().get_backoff_time()
         return random.uniform(0.0, value)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import asyncio
+import json
+import random
+
+from collections import Counter
+
+import aiohttp
+
+from .histogram import Histogram
+from .metrics_helpers import HISTOGRAM_PERCENTILES
+from .users import user_token
+
+
+OPEN_LOOP = 'open'
+CLOSED_LOOP = 'closed'
+
+
+class LoadResult:
+    """The latencies, statuses and errors of the requests in a load test.
+
+    Latencies are kept in a `Histogram` in microseconds and reported in
+    milliseconds. Requests that got a response are counted by status code,
+    and requests that did not are counted by error.
+    """
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.duration = 0
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values()) + sum(self.errors.values())
+
+    def record(self, seconds, status=None, error=None):
+        """Record a request that took ``seconds`` and got ``status`` or ``error``."""
+        self.latency.record(seconds * 1000 * 1000)
+
+        if error is None:
+            self.statuses[str(status)] += 1
+        else:
+            self.errors[error] += 1
+
+    def to_dict(self):
+        """Return the results as a dict that can be serialized as JSON."""
+        latency = {name: self.latency.percentile(percentile) / 1000
+                   for name, percentile in HISTOGRAM_PERCENTILES}
+        latency['mean'] = self.latency.mean() / 1000
+        latency['max'] = (self.latency.max or 0) / 1000
+
+        return {
+            'requests': self.requests,
+            'duration': self.duration,
+            'throughput': self.requests / self.duration if self.duration else 0,
+            'latency_ms': latency,
+            'statuses': dict(self.statuses),
+            'errors': dict(self.errors)
+        }
+
+
+class LoadGenerator:
+    """Sends GET requests to ``url`` for ``warmup`` plus ``duration`` seconds.
+
+    In CLOSED_LOOP mode, ``concurrency`` clients each send a request as
+    soon as their last one finishes, so a slower service gets fewer
+    requests. In OPEN_LOOP mode, requests are sent at a constant ``rate``
+    per second however slowly the service responds, over at most
+    ``concurrency`` connections. An open loop's latencies are measured from
+    when each request was due to be sent, so time spent waiting for a
+    connection counts against the service rather than being left out
+    ("coordinated omission").
+
+    Requests sent during the warmup are not recorded. Requests that take
+    longer than ``timeout`` seconds are counted as timeouts.
+
+    If ``users`` is given, each request is sent as a random one of that
+    many simulated users, with the user's `user_token()` as its
+    Authorization header.
+    """
+    def __init__(self, url, headers=None, mode=CLOSED_LOOP, concurrency=10, rate=None,
+                 duration=10, warmup=0, timeout=10, users=None):
+        if mode == OPEN_LOOP and not rate:
+            raise ValueError('An open loop needs a rate')
+
+        self.url = url
+        self.headers = headers or {}
+        self.mode = mode
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.timeout = timeout
+        self.users = users
+
+    def parameters(self):
+        """Return the parameters of the load test, for its results."""
+        return {
+            'url': self.url,
+            'mode': self.mode,
+            'concurrency': self.concurrency,
+            'rate': self.rate,
+            'duration': self.duration,
+            'warmup': self.warmup,
+            'timeout': self.timeout,
+            'users': self.users
+        }
+
+    async def run(self):
+        """Run the load test and return its `LoadResult`."""
+        loop = asyncio.get_event_loop()
+        result = LoadResult()
+        started_at = loop.time()
+        self._recording_from = started_at + self.warmup
+        self._end = self._recording_from + self.duration
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=self.headers) as session:
+            if self.mode == OPEN_LOOP:
+                await self._run_open_loop(session, result)
+            else:
+                await self._run_closed_loop(session, result)
+
+        result.duration = min(loop.time(), self._end) - self._recording_from
+        return result
+
+    def _headers(self):
+        """Return the headers to send with a request, besides ``headers``."""
+        if self.users:
+            return {'Authorization': user_token(random.randrange(self.users))}
+        return None
+
+    async def _send(self, session):
+        """Send a request and return its status code."""
+        async with session.get(self.url, headers=self._headers()) as response:
+            await response.read()
+            return response.status
+
+    async def _request(self, session, result, started_at):
+        status = error = None
+
+        try:
+            status = await self._send(session)
+        except asyncio.TimeoutError:
+            error = 'timeout'
+        except aiohttp.ClientError as e:
+            error = type(e).__name__
+
+        if started_at >= self._recording_from:
+            result.record(asyncio.get_event_loop().time() - started_at, status, error)
+
+    async def _run_closed_loop(self, session, result):
+        loop = asyncio.get_event_loop()
+
+        async def client():
+            while loop.time() < self._end:
+                await self._request(session, result, loop.time())
+
+        await asyncio.gather(*[client() for _ in range(self.concurrency)])
+
+    async def _run_open_loop(self, session, result):
+        loop = asyncio.get_event_loop()
+        interval = 1 / self.rate
+        first = loop.time()
+        pending = set()
+        sent = 0
+
+        while True:
+            due = first + sent * interval
+
+            if due >= self._end:
+                break
+
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+
+            task = asyncio.ensure_future(self._request(session, result, due))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            sent += 1
+
+        if pending:
+            await asyncio.wait(pending)
+
+
+def run_load_test(generator):
+    """Run ``generator``'s load test and return its results as a dict."""
+    result = asyncio.get_event_loop().run_until_complete(generator.run())
+    results = generator.parameters()
+    results.update(result.to_dict())
+    return results
+
+
+def summarize(results):
+    """Return a human-readable summary of load test ``results``."""
+    latency = results['latency_ms']
+    names = [name for name, _ in HISTOGRAM_PERCENTILES] + ['max']
+    lines = [
+        '{requests} requests in {duration:.1f}s ({throughput:.1f}/s)'.format(**results),
+        'Latency (ms): ' + ', '.join('{} {:.1f}'.format(name, latency[name]) for name in names),
+        'Statuses: ' + _counts(results['statuses'])
+    ]
+
+    if results['errors']:
+        lines.append('Errors: ' + _counts(results['errors']))
+
+    return '\n'.join(lines)
+
+
+def _counts(counts):
+    return ', '.join('{}: {}'.format(key, count) for key, count in sorted(counts.items())) or 'none'
+
+
+def parse_header(value):
+    name, _, header_value = value.partition(':')
+
+    if not header_value:
+        raise argparse.ArgumentTypeError('Headers look like "Name: value"')
+
+    return name.strip(), header_value.strip()
+
+
+parser = argparse.ArgumentParser(description='Send load to an HTTP endpoint')
+parser.add_argument('url', help='The URL to send GET requests to')
+parser.add_argument('--mode', choices=[CLOSED_LOOP, OPEN_LOOP], default=CLOSED_LOOP,
+                    help='Send requests as soon as earlier ones finish, or at a constant rate')
+parser.add_argument('--rate', type=float, default=None,
+                    help='The requests per second to send (requires --mode open)')
+parser.add_argument('--concurrency', type=int, default=10,
+                    help='The number of clients, or the most connections in an open loop')
+parser.add_argument('--duration', type=float, default=10,
+                    help='The number of seconds to record requests for')
+parser.add_argument('--warmup', type=float, default=0,
+                    help='The number of seconds to send requests for before recording them')
+parser.add_argument('--timeout', type=float, default=10,
+                    help='The number of seconds after which a request counts as a timeout')
+parser.add_argument('--header', type=parse_header, action='append', default=[],
+                    help='A header to send, like "Authorization: Token 0x123"')
+parser.add_argument('--users', type=int, default=None,
+                    help='Send each request as a random one of the specified number of users')
+parser.add_argument('--output', default=None,
+                    help='Write the results as JSON to the specified file')
+
+
+def main(args=None):
+    flags = parser.parse_args(args)
+
+    if flags.mode == OPEN_LOOP and not flags.rate:
+        parser.error('--mode open requires --rate')
+
+    generator = LoadGenerator(flags.url, headers=dict(flags.header), mode=flags.mode,
+                              concurrency=flags.concurrency, rate=flags.rate,
+                              duration=flags.duration, warmup=flags.warmup, timeout=flags.timeout,
+                              users=flags.users)
+    results = run_load_test(generator)
+    print(summarize(results))
+
+    if flags.output:
+        with open(flags.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
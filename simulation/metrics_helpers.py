@@ -1,18 +1,199 @@
-import statsd
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+
+from collections import defaultdict
+
 import simulation
 
+from .histogram import Histogram
+
+
+# How often, in seconds, to send buffered metrics to StatsD.
+FLUSH_INTERVAL = 1
+
+# The largest UDP payload that fits in a single Ethernet frame. Each packet
+# sent to StatsD holds as many metrics as will fit in this many bytes.
+MAX_PACKET_SIZE = 1432
+
+# The most timer samples to buffer for a single key between flushes.
+# Further samples are dropped until the next flush.
+MAX_TIMER_SAMPLES = 1000
+
+# The percentiles reported for each histogram, and the field names they are
+# reported under.
+HISTOGRAM_PERCENTILES = (
+    ('p50', 50),
+    ('p95', 95),
+    ('p99', 99),
+    ('p999', 99.9)
+)
+
+log = logging.getLogger(__name__)
+
+_client = None
+
 
 class StatsClient:
-    def __init__(self, testing):
-        if testing:
-            statsd.Connection.set_defaults(host='localhost', port=8125, sample_rate=1, disabled=True)
-        else:
-            statsd.Connection.set_defaults(host='telegraf', port=8125, sample_rate=1)
+    """A StatsD client that buffers metrics and sends them in batches.
+
+    Recording a metric only updates an in-memory buffer: counters are
+    summed, the last value of a gauge wins, and timer samples are kept in
+    a list. A background thread flushes the buffer every ``flush_interval``
+    seconds, packing as many metrics as fit into each UDP packet.
+
+    Histograms summarize values locally: each flush reports the count,
+    maximum and HISTOGRAM_PERCENTILES of the values recorded since the
+    previous flush, then starts a new histogram. Percentiles from different
+    processes can't be combined, and Telegraf would keep only one process's
+    gauge, so histograms are tagged with the ``pid`` of the process that
+    recorded them, and queries aggregate over the processes.
+
+    Metrics take optional ``tags``, which are sent in the InfluxDB format
+    that Telegraf's StatsD input understands, e.g.
+    ``api_latency.p99,outcome=timeout,path=/recommendations,pid=7:1000.5|g``.
+
+    When testing, metrics are buffered but never sent.
+    """
+    def __init__(self, testing, host='telegraf', port=8125, flush_interval=FLUSH_INTERVAL):
+        self.disabled = testing
+        self.address = (host, port)
+        self.flush_interval = flush_interval
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._timers = defaultdict(list)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._socket = None
+
+    def _ensure_flusher(self):
+        if self.disabled or self._flusher_pid == os.getpid():
+            return
+
+        with self._lock:
+            # The thread does not survive a fork, so each worker process
+            # needs to start its own.
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._socket = None
+
+        thread = threading.Thread(target=self._flush_forever, name='metrics-flusher')
+        thread.daemon = True
+        thread.start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def incr(self, key, count=1, tags=None):
+        """Add ``count`` to the counter ``key``."""
+        self._ensure_flusher()
+        key = key + _format_tags(tags)
+        with self._lock:
+            self._counters[key] += count
+
+    def gauge(self, key, value, tags=None):
+        """Set the gauge ``key`` to ``value``."""
+        self._ensure_flusher()
+        key = key + _format_tags(tags)
+        with self._lock:
+            self._gauges[key] = value
 
-    def incr(self, key):
-        counter = statsd.Counter(key)
-        counter += 1
+    def timing(self, key, milliseconds):
+        """Record that something measured by ``key`` took ``milliseconds``."""
+        self._ensure_flusher()
+        with self._lock:
+            samples = self._timers[key]
+            if len(samples) < MAX_TIMER_SAMPLES:
+                samples.append(milliseconds)
+
+    def histogram(self, key, milliseconds, tags=None):
+        """Record a duration of ``milliseconds`` in the histogram ``key``."""
+        self._ensure_flusher()
+        tags = _format_tags(dict(tags or {}, pid=os.getpid()))
+
+        with self._lock:
+            histogram = self._histograms.get((key, tags))
+            if histogram is None:
+                histogram = self._histograms[(key, tags)] = Histogram()
+            # Histograms count integers, so keep microsecond precision.
+            histogram.record(milliseconds * 1000)
+
+    def _drain(self):
+        """Return the buffered metrics as StatsD lines and empty the buffer."""
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(int)
+            gauges, self._gauges = self._gauges, {}
+            timers, self._timers = self._timers, defaultdict(list)
+            histograms, self._histograms = self._histograms, {}
+
+        lines = ['{}:{}|c'.format(key, value) for key, value in counters.items()]
+        lines.extend('{}:{}|g'.format(key, value) for key, value in gauges.items())
+        lines.extend('{}:{:g}|ms'.format(key, sample)
+                     for key, samples in timers.items() for sample in samples)
+
+        for (key, tags), histogram in histograms.items():
+            lines.append('{}.count{}:{}|c'.format(key, tags, histogram.count))
+            lines.append('{}.max{}:{:g}|g'.format(key, tags, histogram.max / 1000))
+
+            for field, percentile in HISTOGRAM_PERCENTILES:
+                value = histogram.percentile(percentile) / 1000
+                lines.append('{}.{}{}:{:g}|g'.format(key, field, tags, value))
+
+        return lines
+
+    def _packets(self, lines):
+        """Yield packets of newline-separated lines up to MAX_PACKET_SIZE."""
+        packet = b''
+
+        for line in lines:
+            line = line.encode('utf-8')
+
+            if packet and len(packet) + len(line) + 1 > MAX_PACKET_SIZE:
+                yield packet
+                packet = b''
+
+            packet = packet + b'\n' + line if packet else line
+
+        if packet:
+            yield packet
+
+    def flush(self):
+        """Send all buffered metrics to StatsD."""
+        lines = self._drain()
+
+        if self.disabled or not lines:
+            return
+
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._socket.connect(self.address)
+
+            for packet in self._packets(lines):
+                self._socket.send(packet)
+        except OSError:
+            log.exception('Could not send metrics to %s:%s', *self.address)
+            self._socket = None
+
+
+def _format_tags(tags):
+    """Return ``tags`` in the form Telegraf expects after a metric name."""
+    return ''.join(',{}={}'.format(name, value) for name, value in sorted((tags or {}).items()))
 
 
 def metrics_client():
-    return StatsClient(simulation.TESTING)
+    """Return this process's `StatsClient`."""
+    global _client
+
+    if _client is None:
+        _client = StatsClient(simulation.TESTING)
+        atexit.register(_client.flush)
+
+    return _client
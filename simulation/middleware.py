@@ -1,37 +1,132 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import asyncio
 import logging
-import random
 import time
 import sys
 
 import falcon
 import statsd
 
-from .clients import AuthenticationClient
+from .cache import TTLCache
+from .clients import AsyncAuthenticationClient, AuthenticationClient
+from .deadlines import check_deadline, remaining
+from .faults import NON_BLOCKING, injected_delay, status_line
 from .metrics_helpers import metrics_client
-from .redis_helpers import redis_client
-from .settings import PERFORMANCE_PROBLEMS_KEY
+from .settings_helpers import get_client_settings
+from .settings_snapshot import settings_snapshot
 
 
+# How long, in seconds, to reuse the details the authentication service
+# returned for a token, and how many tokens' details to keep.
+AUTH_CACHE_TTL = 10
+AUTH_CACHE_SIZE = 10000
+
+_MISSING = object()
+
 log = logging.getLogger(__name__)
 auth_client = AuthenticationClient()
+async_auth_client = AsyncAuthenticationClient()
 metrics = metrics_client()
-redis = redis_client()
+snapshot = settings_snapshot()
 
 
 class FuzzingMiddleware:
-    """Middleware that simulates network latency.
+    """Middleware that simulates network latency and other faults.
 
     If we are in a simulated performance problem condition, the wrapped
-    endpoint responds with random delay.
+    endpoint responds with random delay. The delay stands in for slow work,
+    so it stops at the request's deadline and the request is shed.
+
+    If the endpoint has a `FaultProfile`, its responses are delayed by the
+    profile's latency too, then some are replaced with errors, and the rest
+    may have their bodies sent slowly.
+
+    When the ``latency_injection`` setting is NON_BLOCKING, responses are
+    not delayed here, where the delay would hold a worker, but by the API
+    clients that call the endpoint.
     """
+    def __init__(self, settings=None):
+        if settings:
+            self.apply_settings(settings)
+        else:
+            self.apply_settings(get_client_settings())
+            snapshot.watch(self.apply_settings)
+
+    def apply_settings(self, settings):
+        """Change the settings used for new requests."""
+        self.blocking = settings['latency_injection'] != NON_BLOCKING
+
     def process_request(self, req, resp):
-        simulate_performance_problem = req.path in redis.smembers(PERFORMANCE_PROBLEMS_KEY)
+        delay = self._delay(req)
 
-        if simulate_performance_problem:
+        if delay is not None:
             log.info('Delaying response time: %s', req.path)
-            time.sleep(random.randint(5, 10))
+            time.sleep(delay)
+            check_deadline(req)
+
+        self._check_error(req)
+
+    def process_response(self, req, resp, resource):
+        profile = req.context.get('fault_profile')
+
+        if profile is not None and profile.slow_body is not None:
+            self._stream(resp, profile.drip)
+
+    def _delay(self, req):
+        """Return how long to delay the response to ``req``, or None."""
+        delay = injected_delay(snapshot, req.path) if self.blocking else None
+        time_left = remaining(req.context.get('deadline'))
+
+        if delay is not None and time_left is not None:
+            delay = max(min(delay, time_left), 0)
+
+        return delay
+
+    def _check_error(self, req):
+        profile = snapshot.fault_profile(req.path)
+
+        if profile is None:
+            return
+
+        req.context['fault_profile'] = profile
+        status = profile.error_status()
+
+        if status is not None:
+            log.info('Simulating a %s response: %s', status, req.path)
+            raise falcon.HTTPError(status_line(status), 'Simulated fault')
+
+    def _stream(self, resp, drip):
+        """Replace the body of ``resp`` with one sent slowly by ``drip``."""
+        data = resp.data if resp.data is not None else (resp.body or '').encode('utf-8')
+
+        if data:
+            resp.data = resp.body = None
+            resp.stream = drip(data)
+            resp.stream_len = len(data)
+
+
+class AsyncFuzzingMiddleware(FuzzingMiddleware):
+    """An asyncio version of FuzzingMiddleware, for `AsyncApp`.
+
+    Delayed requests wait without blocking the process, so other requests
+    are served in the meantime.
+    """
+    async def process_request(self, req, resp):
+        delay = self._delay(req)
+
+        if delay is not None:
+            log.info('Delaying response time: %s', req.path)
+            await asyncio.sleep(delay)
+            check_deadline(req)
+
+        self._check_error(req)
+
+    async def process_response(self, req, resp, resource):
+        profile = req.context.get('fault_profile')
+
+        if profile is not None and profile.slow_body is not None:
+            self._stream(resp, profile.async_drip)
 
 
 class PermissionsMiddleware:
@@ -40,9 +135,21 @@ class PermissionsMiddleware:
     This middleware should receive a ``permission`` string on init,
     which identifies a single permission, as a string, that the
     user must possess to access the wrapped endpoint.
+
+    User details returned by the authentication service are cached by
+    token for ``cache_ttl`` seconds (zero disables the cache). Tokens the
+    authentication service rejected are cached for ``negative_cache_ttl``
+    seconds, which defaults to not caching them at all.
+
+    The authentication service is given the request's deadline, if
+    `DeadlineMiddleware` found one.
     """
-    def __init__(self, permission):
+    def __init__(self, permission, cache_ttl=AUTH_CACHE_TTL,
+                 negative_cache_ttl=0, cache_size=AUTH_CACHE_SIZE):
         self._required_permission = permission
+        self._cache_ttl = cache_ttl
+        self._negative_cache_ttl = negative_cache_ttl
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
 
     def process_request(self, req, resp):
         token = req.get_header('Authorization')
@@ -53,20 +160,20 @@ class PermissionsMiddleware:
                                           '',
                                           href='http://docs.example.com/auth')
 
-        auth_headers = {'Authorization': token}
-        auth_response = auth_client.post(headers=auth_headers)
+        deadline = req.context.get('deadline')
+        user_details, cache_hit = self._cache.get_or_load(
+            token, lambda token: self._authenticate(token, deadline))
+        self._authorize(req, token, user_details, cache_hit)
 
-        if not auth_response:
-            raise falcon.HTTPInternalServerError('Server error', 'There was a server error')
+    def _authorize(self, req, token, user_details, cache_hit):
+        metrics.incr('authorization.cache_hit' if cache_hit else 'authorization.cache_miss')
 
-        if auth_response.status_code == 401:
+        if user_details is None:
             raise falcon.HTTPUnauthorized('Authorization failed',
                                           '',
                                           '',
                                           href='http://docs.example.com/auth')
 
-        user_details = auth_response.json()
-
         if not self._has_permission(user_details):
             metrics.incr('authorization.permission_denied')
             description = 'You do not have permission to access this resource.'
@@ -77,9 +184,28 @@ class PermissionsMiddleware:
 
         metrics.incr('authorization.authorization_success')
 
-        req.context['auth_header'] = auth_headers
+        req.context['auth_header'] = {'Authorization': token}
         req.context['user_details'] = user_details
 
+    def _authenticate(self, token, deadline=None):
+        """Ask the authentication service for the details of ``token``.
+
+        Returns a (user_details, ttl) tuple for the cache. ``user_details``
+        is None if the authentication service rejected the token.
+        """
+        auth_response = auth_client.post(headers={'Authorization': token}, deadline=deadline)
+        return self._user_details(auth_response)
+
+    def _user_details(self, auth_response):
+        # Error responses are falsy, so check for a rejected token first.
+        if auth_response is not None and auth_response.status_code == 401:
+            return None, self._negative_cache_ttl
+
+        if not auth_response:
+            raise falcon.HTTPInternalServerError('Server error', 'There was a server error')
+
+        return auth_response.json(), self._cache_ttl
+
     def _has_permission(self, user_details):
         permissions = user_details.get('permissions', [])
 
@@ -87,3 +213,46 @@ class PermissionsMiddleware:
             return True
 
         return False
+
+
+class AsyncPermissionsMiddleware(PermissionsMiddleware):
+    """An asyncio version of PermissionsMiddleware, for `AsyncApp`.
+
+    Concurrent requests with the same uncached token share a single call to
+    the authentication service.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loading = {}
+
+    async def process_request(self, req, resp):
+        token = req.get_header('Authorization')
+
+        if not token:
+            raise falcon.HTTPUnauthorized('Auth token required',
+                                          '',
+                                          '',
+                                          href='http://docs.example.com/auth')
+
+        cached = self._cache.get(token, _MISSING)
+
+        if cached is not _MISSING:
+            self._authorize(req, token, cached, cache_hit=True)
+            return
+
+        loading = self._loading.get(token)
+
+        if loading is None:
+            loading = self._loading[token] = asyncio.ensure_future(
+                self._authenticate_async(token, req.context.get('deadline')))
+            loading.add_done_callback(lambda _: self._loading.pop(token, None))
+
+        user_details = await asyncio.shield(loading)
+        self._authorize(req, token, user_details, cache_hit=False)
+
+    async def _authenticate_async(self, token, deadline=None):
+        auth_response = await async_auth_client.post(headers={'Authorization': token},
+                                                     deadline=deadline)
+        user_details, ttl = self._user_details(auth_response)
+        self._cache.set(token, user_details, ttl)
+        return user_details
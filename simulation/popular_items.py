@@ -1,14 +1,35 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import hashlib
 import json
+import logging
+import threading
+import time
 
 import falcon
 import statsd
 
+from redis.exceptions import RedisError
+
+from .concurrency_limits import ConcurrencyLimitMiddleware, SharedAIMDLimiter
+from .deadlines import DeadlineMiddleware
 from .metrics_helpers import metrics_client
 from .middleware import FuzzingMiddleware
+from .redis_helpers import redis_client
+from .serializers import dumps
+
+
+# The Redis key holding yesterday's most popular items, as a JSON list.
+POPULAR_ITEMS_KEY = 'popular_items'
+
+# The items served until any are stored under POPULAR_ITEMS_KEY.
+DEFAULT_POPULAR_ITEMS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
 
+# How many seconds to serve popular items before reading them again, and
+# for which caches (the homepage's and nginx's) can reuse them.
+REFRESH_INTERVAL = 60
 
+log = logging.getLogger(__name__)
 metrics = metrics_client()
 
 
@@ -30,15 +51,66 @@ class PopularItemsResource:
         <
         * Closing connection 0
         [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+
+    Popular items change once a day, so they are read from the
+    POPULAR_ITEMS_KEY Redis key at most once every ``refresh_interval``
+    seconds and serialized once per read. Responses carry an ETag and
+    allow caching for ``refresh_interval`` seconds, and requests whose
+    If-None-Match header has the current ETag get an empty 304 response.
     """
+    def __init__(self, redis=None, refresh_interval=REFRESH_INTERVAL, clock=time.monotonic):
+        self.refresh_interval = refresh_interval
+        self._redis = redis or redis_client()
+        self._clock = clock
+        self._data = None
+        self._etag = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def _read_items(self):
+        try:
+            items = self._redis.get(POPULAR_ITEMS_KEY)
+        except RedisError:
+            log.exception('Could not read popular items from Redis')
+            return None
+
+        return json.loads(items) if items else DEFAULT_POPULAR_ITEMS
+
+    def _payload(self):
+        """Return the serialized popular items and their ETag."""
+        with self._lock:
+            now = self._clock()
+
+            if self._refreshed_at is None or now - self._refreshed_at >= self.refresh_interval:
+                items = self._read_items()
+
+                # Keep serving the last items read if Redis is unavailable.
+                if items is not None or self._data is None:
+                    self._data = dumps(items or DEFAULT_POPULAR_ITEMS)
+                    self._etag = '"{}"'.format(hashlib.sha1(self._data).hexdigest())
+
+                self._refreshed_at = now
+
+            return self._data, self._etag
+
     def on_get(self, req, resp):
         """Return yesterday's most popular items."""
         metrics.incr('popular_items.get')
-        most_popular_yesterday = [1, 2, 3, 4, 5, 6, 7, 8 , 9, 10]
-        resp.body = json.dumps(most_popular_yesterday)
+        data, etag = self._payload()
+        resp.etag = etag
+        resp.cache_control = ['public', 'max-age={}'.format(self.refresh_interval)]
+
+        if req.if_none_match and etag in [tag.strip() for tag in req.if_none_match.split(',')]:
+            metrics.incr('popular_items.not_modified')
+            resp.status = falcon.HTTP_304
+            return
+
+        resp.data = data
 
 
 api = falcon.API(middleware=[
+    ConcurrencyLimitMiddleware(SharedAIMDLimiter('popular')),
+    DeadlineMiddleware(),
     FuzzingMiddleware()
 ])
 api.add_route('/popular_items', PopularItemsResource())
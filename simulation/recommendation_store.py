@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import asyncio
+import json
+import logging
+import random
+import struct
+
+from redis.exceptions import RedisError
+
+from .cache import TTLCache
+from .metrics_helpers import metrics_client
+from .redis_helpers import redis_client
+from .users import simulated_user_uuids
+
+
+# Each user's recommendations are stored under this key as item IDs packed
+# into unsigned 32-bit little-endian integers, four bytes per item.
+RECOMMENDATIONS_KEY = 'recommendations:{}'
+ITEM_FORMAT = '<I'
+
+# The items recommended to users who have none stored.
+DEFAULT_RECOMMENDATIONS = [12, 23, 100, 122, 220, 333, 340, 400, 555, 654]
+
+# How many users' recommendations a process keeps in memory, and for how
+# many seconds. Recommendations are recomputed daily, so a few minutes out
+# of date is fine.
+CACHE_SIZE = 100000
+CACHE_TTL = 300
+
+# How many users' recommendations `load()` sends to Redis in one pipeline.
+LOAD_BATCH_SIZE = 1000
+
+log = logging.getLogger(__name__)
+metrics = metrics_client()
+
+
+def pack(items):
+    """Return ``items``, a list of item IDs, packed into bytes."""
+    return struct.pack('<{}I'.format(len(items)), *items)
+
+
+def unpack(data):
+    """Return the list of item IDs packed into ``data`` by `pack()`."""
+    return list(struct.unpack('<{}I'.format(len(data) // struct.calcsize(ITEM_FORMAT)), data))
+
+
+class RecommendationStore:
+    """Looks up the items recommended for users, by user UUID.
+
+    Recommendations are precomputed and loaded into Redis with `load()`.
+    Lookups are cached in an in-process LRU cache of ``cache_size`` users
+    for ``cache_ttl`` seconds, and `get_many()` fetches every user missing
+    from the cache in one Redis round-trip. Users with nothing stored, and
+    every user while Redis is unavailable, get DEFAULT_RECOMMENDATIONS.
+    """
+    def __init__(self, redis=None, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
+        self._redis = redis or redis_client(decode_responses=False)
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def get(self, user_uuid):
+        """Return the items recommended for ``user_uuid``."""
+        return self.get_many([user_uuid])[user_uuid]
+
+    def get_many(self, user_uuids):
+        """Return a dict of the items recommended for each of ``user_uuids``."""
+        recommendations, missing = self._lookup(user_uuids)
+
+        if missing:
+            recommendations.update(self._fetch(missing))
+
+        return recommendations
+
+    async def get_async(self, user_uuid):
+        """An asyncio version of `get()`."""
+        return (await self.get_many_async([user_uuid]))[user_uuid]
+
+    async def get_many_async(self, user_uuids):
+        """An asyncio version of `get_many()`.
+
+        Users missing from the cache are fetched from Redis in the event
+        loop's default executor, so a slow Redis does not stall every other
+        request the loop is serving.
+        """
+        recommendations, missing = self._lookup(user_uuids)
+
+        if missing:
+            loop = asyncio.get_event_loop()
+            recommendations.update(await loop.run_in_executor(None, self._fetch, missing))
+
+        return recommendations
+
+    def _lookup(self, user_uuids):
+        """Return the cached recommendations for ``user_uuids``, and a list
+        of the users missing from the cache."""
+        recommendations = {}
+        missing = []
+
+        for user_uuid in user_uuids:
+            items = self._cache.get(user_uuid)
+
+            if items is None:
+                missing.append(user_uuid)
+            else:
+                recommendations[user_uuid] = items
+
+        metrics.incr('recommendations.cache_hit', len(recommendations))
+
+        if missing:
+            metrics.incr('recommendations.cache_miss', len(missing))
+
+        return recommendations, missing
+
+    def _fetch(self, user_uuids):
+        try:
+            values = self._redis.mget([RECOMMENDATIONS_KEY.format(user_uuid)
+                                       for user_uuid in user_uuids])
+        except RedisError:
+            log.exception('Could not read recommendations from Redis')
+            # Don't cache the defaults, so users get their own once Redis
+            # is back.
+            return {user_uuid: DEFAULT_RECOMMENDATIONS for user_uuid in user_uuids}
+
+        recommendations = {}
+
+        for user_uuid, value in zip(user_uuids, values):
+            items = unpack(value) if value is not None else DEFAULT_RECOMMENDATIONS
+            self._cache.set(user_uuid, items)
+            recommendations[user_uuid] = items
+
+        return recommendations
+
+    def load(self, recommendations, batch_size=LOAD_BATCH_SIZE):
+        """Store ``recommendations``, an iterable of (user UUID, items) pairs.
+
+        Users are sent to Redis ``batch_size`` at a time, in pipelines, so
+        millions can be loaded without a round-trip for each. Returns the
+        number of users stored.
+        """
+        pipeline = self._redis.pipeline(transaction=False)
+        count = 0
+
+        for user_uuid, items in recommendations:
+            pipeline.set(RECOMMENDATIONS_KEY.format(user_uuid), pack(items))
+            count += 1
+
+            if count % batch_size == 0:
+                pipeline.execute()
+
+        pipeline.execute()
+        self._cache.clear()
+        return count
+
+
+def random_recommendations(users, items_per_user=10, max_item=100000):
+    """Yield (user UUID, items) pairs of random recommendations for ``users`` users.
+
+    The users are simulated users 0 to ``users - 1``, whose tokens the
+    load generator sends with ``--users``.
+    """
+    for user_uuid in simulated_user_uuids(users):
+        yield user_uuid, random.sample(range(1, max_item), items_per_user)
+
+
+def read_recommendations(lines):
+    """Yield (user UUID, items) pairs from JSON ``lines``.
+
+    Each line holds an object like ``{"uuid": "...", "items": [1, 2, 3]}``.
+    """
+    for line in lines:
+        if line.strip():
+            row = json.loads(line)
+            yield row['uuid'], row['items']
+
+
+parser = argparse.ArgumentParser(description='Load precomputed recommendations into Redis')
+parser.add_argument('file', nargs='?', type=argparse.FileType('r'),
+                    help='A file of JSON lines like {"uuid": "...", "items": [1, 2, 3]}')
+parser.add_argument('--users', type=int, default=None,
+                    help='Load random recommendations for the specified number of users instead')
+
+
+def main(args=None):
+    flags = parser.parse_args(args)
+
+    if flags.users is not None:
+        recommendations = random_recommendations(flags.users)
+    elif flags.file is not None:
+        recommendations = read_recommendations(flags.file)
+    else:
+        parser.error('Give a file to load, or --users')
+
+    count = RecommendationStore().load(recommendations)
+    print('Loaded recommendations for {} users'.format(count))
+
+
+if __name__ == '__main__':
+    main()
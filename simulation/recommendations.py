@@ -1,18 +1,35 @@
 #!/usr/bin/env python
 # encoding: utf-8
-import json
 import logging
 
 import falcon
 import statsd
 
 
+from .asgi import AsyncApp
+from .concurrency_limits import (
+    AsyncConcurrencyLimitMiddleware,
+    ConcurrencyLimitMiddleware,
+    SharedAIMDLimiter
+)
+from .deadlines import AsyncDeadlineMiddleware, DeadlineMiddleware
 from .metrics_helpers import metrics_client
-from .middleware import PermissionsMiddleware, FuzzingMiddleware
+from .middleware import (
+    AsyncFuzzingMiddleware,
+    AsyncPermissionsMiddleware,
+    FuzzingMiddleware,
+    PermissionsMiddleware
+)
+from .recommendation_store import RecommendationStore
+from .serializers import loads, write_json
 
 
+# The most users whose recommendations can be asked for in one request.
+MAX_BATCH_SIZE = 1000
+
 log = logging.getLogger(__name__)
 metrics = metrics_client()
+store = RecommendationStore()
 
 
 class RecommendationsResource:
@@ -35,22 +52,99 @@ class RecommendationsResource:
         [12, 23, 100, 122, 220, 333, 340, 400, 555, 654]
 
     Note that the request must include an authentication token.
+
+    Recommendations are precomputed and looked up in a `RecommendationStore`.
     """
+    def __init__(self, store=store):
+        self._store = store
+
     def _recommended_for_user(self, user_uuid):
         """Return items recommended for a user."""
-        # Pretend we looked these numbers up by ``user_uuid``, probably in a
-        # precomputed hash table (redis, etc.).
-        return [12, 23, 100, 122, 220, 333, 340, 400, 555, 654]
+        return self._store.get(user_uuid)
 
     def on_get(self, req, resp):
         """Return recommendations for a user."""
         metrics.incr('recommendations.get')
         user_details = req.context['user_details']
-        resp.body = json.dumps(self._recommended_for_user(user_details['uuid']))
+        write_json(resp, self._recommended_for_user(user_details['uuid']))
+
+
+class AsyncRecommendationsResource(RecommendationsResource):
+    """An asyncio version of RecommendationsResource, for `AsyncApp`."""
+    async def on_get(self, req, resp):
+        """Return recommendations for a user."""
+        metrics.incr('recommendations.get')
+        user_details = req.context['user_details']
+        write_json(resp, await self._store.get_async(user_details['uuid']))
+
+
+class RecommendationsBatchResource:
+    """A resource that returns recommendations for many users at once.
+
+    POST a list of user UUIDs to this endpoint to see their recommendations:
+
+        $ curl -v -H "Authorization: Token 0x132" "http://192.168.99.100:8002/recommendations/batch" \
+                -d '{"uuids": ["31a4ca9c-b3e2-4a4f-a2f5-3c5bbd0ac2a7"]}'
+
+    Response:
+
+        < HTTP/1.1 200 OK
+        < content-type: application/json; charset=UTF-8
+        <
+        {"31a4ca9c-b3e2-4a4f-a2f5-3c5bbd0ac2a7": [12, 23, 100, 122, 220, 333, 340, 400, 555, 654]}
+
+    Users missing from the process's cache are looked up in a single
+    round-trip to Redis. At most MAX_BATCH_SIZE users can be asked for.
+    """
+    def __init__(self, store=store):
+        self._store = store
+
+    def _parse_uuids(self, body):
+        try:
+            uuids = loads(body)['uuids']
+        except (ValueError, KeyError, TypeError):
+            raise falcon.HTTPBadRequest('Bad request',
+                                        'The body must be a JSON object with a list of "uuids".')
+
+        if not isinstance(uuids, list) or not all(isinstance(user_uuid, str) for user_uuid in uuids):
+            raise falcon.HTTPBadRequest('Bad request', '"uuids" must be a list of strings.')
+
+        if len(uuids) > MAX_BATCH_SIZE:
+            raise falcon.HTTPBadRequest(
+                'Bad request', 'At most {} users can be asked for at once.'.format(MAX_BATCH_SIZE))
+
+        return uuids
+
+    def on_post(self, req, resp):
+        """Return recommendations for the given users."""
+        metrics.incr('recommendations.batch')
+        uuids = self._parse_uuids(req.stream.read())
+        write_json(resp, self._store.get_many(uuids))
+
+
+class AsyncRecommendationsBatchResource(RecommendationsBatchResource):
+    """An asyncio version of RecommendationsBatchResource, for `AsyncApp`."""
+    async def on_post(self, req, resp):
+        """Return recommendations for the given users."""
+        metrics.incr('recommendations.batch')
+        uuids = self._parse_uuids(req.body)
+        write_json(resp, await self._store.get_many_async(uuids))
 
 
 api = falcon.API(middleware=[
+    ConcurrencyLimitMiddleware(SharedAIMDLimiter('recommendations')),
+    DeadlineMiddleware(),
     PermissionsMiddleware('can_view_recommendations'),
     FuzzingMiddleware()
 ])
 api.add_route('/recommendations', RecommendationsResource())
+api.add_route('/recommendations/batch', RecommendationsBatchResource())
+
+asgi_api = AsyncApp(middleware=[
+    AsyncConcurrencyLimitMiddleware(),
+    AsyncDeadlineMiddleware(),
+    AsyncPermissionsMiddleware('can_view_recommendations'),
+    AsyncFuzzingMiddleware()
+])
+asgi_api.add_route('/recommendations', AsyncRecommendationsResource())
+asgi_api.add_route('/recommendations/batch', AsyncRecommendationsBatchResource())
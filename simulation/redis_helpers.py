@@ -14,14 +14,20 @@ def from_redis_value(value):
         val = True
     elif value == 'False':
         val = False
+    elif value == 'None':
+        val = None
     else:
         val = value
     return val
 
 
-def redis_client():
-    """Return a `redis.StrictRedis` with the correct db and port."""
+def redis_client(decode_responses=True):
+    """Return a `redis.StrictRedis` with the correct db and port.
+
+    Pass ``decode_responses=False`` to get values as bytes, e.g. to store
+    binary data.
+    """
     if simulation.TESTING:
-        return fakeredis.FakeStrictRedis(decode_responses=True)
+        return fakeredis.FakeStrictRedis(decode_responses=decode_responses)
 
-    return redis.StrictRedis(host="redis", port=6379, db=0, decode_responses=True)
+    return redis.StrictRedis(host="redis", port=6379, db=0, decode_responses=decode_responses)
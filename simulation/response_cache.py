@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import copy
+import threading
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+from .cache import TTLCache
+
+
+# The Warning header that marks a response served from the cache after it
+# went stale, as described in RFC 7234.
+STALE_WARNING = '110 - "Response is Stale"'
+
+FRESH = 'fresh'
+STALE = 'stale'
+
+
+def mark_stale(response):
+    """Return a copy of ``response`` with a Warning header saying it is stale."""
+    response = copy.copy(response)
+    response.headers = CaseInsensitiveDict(response.headers)
+    response.headers['Warning'] = STALE_WARNING
+    return response
+
+
+def is_stale(response):
+    """Return True if ``response`` was marked by `mark_stale()`."""
+    return response.headers.get('Warning') == STALE_WARNING
+
+
+def max_age(response):
+    """Return the max-age from the Cache-Control header of ``response``.
+
+    Returns None if there is none.
+    """
+    directives = [directive.strip().lower()
+                  for directive in response.headers.get('Cache-Control', '').split(',')]
+
+    for directive in directives:
+        if directive.startswith('max-age='):
+            try:
+                return int(directive[len('max-age='):])
+            except ValueError:
+                return None
+
+    return None
+
+
+class ResponseCache:
+    """A cache of successful responses that keeps serving them once stale.
+
+    A response is fresh for ``fresh_ttl`` seconds after it is stored,
+    unless a different time is given when storing it (e.g. its `max_age()`),
+    then stale for another ``stale_ttl`` seconds, after which it is dropped.
+    Stale responses are still served, so that callers keep getting the
+    last good response while a service is down or slow, but the caller is
+    expected to revalidate them; `start_revalidation()` makes sure only
+    one caller at a time does so for each key.
+
+    Responses are keyed by URL and by the request headers named in
+    ``vary``, e.g. ``('Authorization',)`` for responses that depend on the
+    user. At most ``maxsize`` responses are kept.
+    """
+    def __init__(self, fresh_ttl=10, stale_ttl=300, vary=(), maxsize=1024, clock=time.monotonic):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.vary = vary
+        self._clock = clock
+        self._cache = TTLCache(maxsize=maxsize, ttl=fresh_ttl + stale_ttl, clock=clock)
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    def key(self, url, headers=None):
+        """Return the cache key for a request to ``url`` with ``headers``."""
+        headers = CaseInsensitiveDict(headers or {})
+        return (url,) + tuple(headers.get(name) for name in self.vary)
+
+    def lookup(self, key):
+        """Return a (response, state) tuple for ``key``.
+
+        ``state`` is FRESH, STALE, or None if nothing is cached.
+        """
+        entry = self._cache.get(key)
+
+        if entry is None:
+            return None, None
+
+        fresh_until, response = entry
+
+        if self._clock() < fresh_until:
+            return response, FRESH
+        return response, STALE
+
+    def store(self, key, response, fresh_ttl=None):
+        """Cache ``response`` for ``key``, fresh for ``fresh_ttl`` seconds."""
+        fresh_ttl = self.fresh_ttl if fresh_ttl is None else fresh_ttl
+        self._cache.set(key, (self._clock() + fresh_ttl, response), ttl=fresh_ttl + self.stale_ttl)
+
+    def clear(self):
+        """Drop every cached response."""
+        self._cache.clear()
+
+    def start_revalidation(self, key):
+        """Return True if the caller should revalidate ``key``.
+
+        Returns False while another caller is revalidating it. The caller
+        must call `finish_revalidation()` when done, whatever the outcome.
+        """
+        with self._lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            return True
+
+    def finish_revalidation(self, key):
+        with self._lock:
+            self._revalidating.discard(key)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+
+from collections import OrderedDict
+
+from .metrics_helpers import HISTOGRAM_PERCENTILES
+
+
+SCENARIOS = ('ideal', 'performance', 'outage', 'tail_latency')
+
+# The fault profiles of the scenarios that have them, by path (see
+# `FaultProfile`). In the tail latency scenario, most requests are fast, but
+# a few are much slower, fail, or have their connections reset.
+FAULT_PROFILES = {
+    'tail_latency': {
+        '/recommendations': {
+            'latency': {'distribution': 'lognormal', 'median': 0.05, 'sigma': 1},
+            'error_rate': 0.01,
+            'error_statuses': [500, 503],
+            'reset_rate': 0.01
+        },
+        '/popular_items': {
+            'latency': {'distribution': 'bimodal', 'fast': 0.01, 'slow': 1, 'slow_fraction': 0.02}
+        }
+    }
+}
+
+# The resilience settings to try in each scenario, by name, as the
+# `run_simulation.py` options that differ from their defaults.
+RESILIENCE = OrderedDict([
+    ('none', {}),
+    ('timeouts', {'timeout': 1}),
+    ('retries', {'timeout': 1, 'retries': True, 'retry_budget': 0.1}),
+    ('circuit_breakers', {'timeout': 1, 'circuit_breakers': True}),
+    ('hedged_requests', {'timeout': 1, 'hedged_requests': True}),
+    ('response_cache', {'timeout': 1, 'response_cache': True}),
+    ('bulkheads', {'timeout': 1, 'fan_out': True, 'bulkheads': 5}),
+    ('concurrency_limit', {'timeout': 1, 'concurrency_limit': True}),
+])
+
+# By default, a cell regresses when its p99 latency is more than 20% higher
+# than the baseline's, or its error rate more than 1 percentage point higher.
+MAX_P99_REGRESSION = 0.2
+MAX_ERROR_RATE_REGRESSION = 0.01
+
+
+def cell_name(scenario, resilience):
+    return '{}/{}'.format(scenario, resilience)
+
+
+def cells(scenarios=SCENARIOS, resilience=tuple(RESILIENCE)):
+    """Yield a (name, scenario, options) tuple for each cell of the matrix.
+
+    ``options`` are the `run_simulation.py` options for the cell's
+    resilience settings.
+    """
+    for scenario in scenarios:
+        for name in resilience:
+            if name not in RESILIENCE:
+                raise ValueError('Unknown resilience settings {!r}; choose from: {}'.format(
+                    name, ', '.join(RESILIENCE)))
+
+            yield cell_name(scenario, name), scenario, dict(RESILIENCE[name])
+
+
+def error_rate(results):
+    """Return the fraction of requests in load test ``results`` that failed.
+
+    Requests fail when they get a 5xx response or no response at all.
+    """
+    if not results['requests']:
+        return 0
+
+    server_errors = sum(count for status, count in results['statuses'].items()
+                        if status.startswith('5'))
+    return (server_errors + sum(results['errors'].values())) / results['requests']
+
+
+def summarize_cell(results):
+    """Return the figures compared between runs from load test ``results``."""
+    return {
+        'requests': results['requests'],
+        'throughput': results['throughput'],
+        'latency_ms': results['latency_ms'],
+        'error_rate': error_rate(results),
+        'statuses': results['statuses'],
+        'errors': results['errors']
+    }
+
+
+def compare(results, baseline, max_p99_regression=MAX_P99_REGRESSION,
+            max_error_rate_regression=MAX_ERROR_RATE_REGRESSION):
+    """Return a description of each cell of ``results`` that regressed.
+
+    ``results`` and ``baseline`` map cell names to `summarize_cell()`
+    dicts. Cells missing from either are not compared.
+    """
+    regressions = []
+
+    for name, cell in results.items():
+        if name not in baseline:
+            continue
+
+        base = baseline[name]
+        p99, base_p99 = cell['latency_ms']['p99'], base['latency_ms']['p99']
+
+        if p99 > base_p99 * (1 + max_p99_regression):
+            regressions.append('{}: p99 rose from {:.1f}ms to {:.1f}ms'.format(name, base_p99, p99))
+
+        if cell['error_rate'] > base['error_rate'] + max_error_rate_regression:
+            regressions.append('{}: error rate rose from {:.2%} to {:.2%}'.format(
+                name, base['error_rate'], cell['error_rate']))
+
+    return regressions
+
+
+def format_table(results):
+    """Return a table of the throughput, latency and error rate of each cell."""
+    percentiles = [name for name, _ in HISTOGRAM_PERCENTILES]
+    width = max([len('cell')] + [len(name) for name in results])
+    header = ['{:<{}}'.format('cell', width), '{:>8}'.format('req/s')]
+    header += ['{:>9}'.format(name) for name in percentiles] + ['{:>7}'.format('errors')]
+    lines = [' '.join(header)]
+
+    for name, cell in results.items():
+        row = ['{:<{}}'.format(name, width), '{:>8.1f}'.format(cell['throughput'])]
+        row += ['{:>9.1f}'.format(cell['latency_ms'][percentile]) for percentile in percentiles]
+        row += ['{:>7.2%}'.format(cell['error_rate'])]
+        lines.append(' '.join(row))
+
+    return '\n'.join(lines)
+
+
+def load_results(path):
+    """Return the cells of the matrix results saved at ``path``."""
+    with open(path) as results_file:
+        return json.load(results_file, object_pairs_hook=OrderedDict)['cells']
+
+
+def save_results(path, results, parameters=None):
+    """Save the matrix ``results`` and the ``parameters`` they were run with to ``path``."""
+    with open(path, 'w') as results_file:
+        json.dump({'parameters': parameters or {}, 'cells': results}, results_file, indent=2)
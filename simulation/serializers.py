@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+# The JSON libraries that can serialize responses, as (dumps, loads) pairs
+# where ``dumps`` returns bytes. Faster libraries are used if installed.
+BACKENDS = {
+    'json': (_json_dumps, json.loads)
+}
+
+try:
+    import orjson
+except ImportError:
+    pass
+else:
+    BACKENDS['orjson'] = (orjson.dumps, orjson.loads)
+
+try:
+    import ujson
+except ImportError:
+    pass
+else:
+    BACKENDS['ujson'] = (lambda obj: ujson.dumps(obj).encode('utf-8'), ujson.loads)
+
+# The backends to use, fastest first.
+PREFERRED_BACKENDS = ('orjson', 'ujson', 'json')
+
+backend = None
+_dumps = None
+_loads = None
+
+
+def use_backend(name):
+    """Serialize JSON with the backend called ``name`` from now on."""
+    global backend, _dumps, _loads
+
+    if name not in BACKENDS:
+        raise ValueError('JSON backend {!r} is not installed; installed backends are: {}'.format(
+            name, ', '.join(sorted(BACKENDS))))
+
+    backend = name
+    _dumps, _loads = BACKENDS[name]
+
+
+def dumps(obj):
+    """Return ``obj`` serialized as JSON bytes."""
+    return _dumps(obj)
+
+
+def loads(data):
+    """Return the object serialized as JSON in ``data``, bytes or a string."""
+    return _loads(data)
+
+
+def write_json(resp, obj):
+    """Serialize ``obj`` as the body of the response ``resp``."""
+    resp.data = dumps(obj)
+
+
+def splice(fields):
+    """Return JSON bytes for an object whose values are already serialized.
+
+    ``fields`` maps each key to its value as JSON bytes, e.g. the body of
+    another service's response, which is copied in without being decoded
+    and encoded again.
+    """
+    return b'{' + b','.join(dumps(key) + b':' + value for key, value in fields.items()) + b'}'
+
+
+use_backend(next(name for name in PREFERRED_BACKENDS if name in BACKENDS))
@@ -5,25 +5,116 @@ import logging
 
 import falcon
 
+from .faults import FaultProfile
 from .redis_helpers import redis_client, from_redis_hash
+from .serializers import write_json
+from .settings_helpers import parse_settings
 
 
 SETTINGS_KEY = 'settings'
 OUTAGES_KEY = 'outages'
 PERFORMANCE_PROBLEMS_KEY = 'performance_problems'
 
+# A Redis hash of the fault profile to simulate for each path, as JSON.
+FAULT_PROFILES_KEY = 'fault_profiles'
+
+# Services subscribe to this channel to hear about settings changes.
+SETTINGS_CHANNEL = 'settings_changed'
+
+# Incremented by every change made through the Settings API, so that
+# services can tell whether settings changed without reading all of them.
+SETTINGS_VERSION_KEY = 'settings_version'
+
+# Incremented by every PUT, which starts a new simulation, so that services
+# can forget what they learned during the last one.
+SIMULATION_KEY = 'simulation'
+
+# The settings that hold sets of paths with simulated faults.
+FAULT_KEYS = (OUTAGES_KEY, PERFORMANCE_PROBLEMS_KEY)
+
 VALID_SETTINGS = {
     OUTAGES_KEY,
     PERFORMANCE_PROBLEMS_KEY,
+    FAULT_PROFILES_KEY,
     'circuit_breakers',
+    'shared_circuit_breakers',
+    'circuit_breaker_mode',
+    'failure_rate_threshold',
+    'slow_call_duration',
+    'slow_call_rate_threshold',
     'timeout',
-    'retries'
+    'retries',
+    'retry_budget',
+    'hedged_requests',
+    'hedge_percentile',
+    'hedge_budget',
+    'response_cache',
+    'bulkheads',
+    'bulkhead_max_concurrent',
+    'fan_out',
+    'deadline',
+    'concurrency_limit',
+    'pool_maxsize',
+    'pool_block',
+    'pool_idle_timeout',
+    'keep_alive',
+    'latency_injection'
 }
 
 log = logging.getLogger(__name__)
 redis = redis_client()
 
 
+def _commit(pipeline, event):
+    """Apply the commands queued in ``pipeline`` as one transaction.
+
+    The settings version is incremented and ``event`` is published to
+    SETTINGS_CHANNEL in the same transaction. Returns the results of the
+    queued commands.
+    """
+    pipeline.incr(SETTINGS_VERSION_KEY)
+    pipeline.publish(SETTINGS_CHANNEL, event)
+    return pipeline.execute()[:-2]
+
+
+def _parse_fault_profiles(profiles, allow_removal=False):
+    """Return ``profiles``, a dict of fault profiles by path, as JSON by path.
+
+    With ``allow_removal``, paths can map to None. Raises a 400 error if
+    any profile is invalid.
+    """
+    if not isinstance(profiles, dict):
+        raise falcon.HTTPBadRequest('Bad request', 'fault_profiles must map paths to profiles')
+
+    parsed = {}
+
+    for path, profile in profiles.items():
+        if profile is None and allow_removal:
+            parsed[path] = None
+            continue
+
+        try:
+            parsed[path] = json.dumps(FaultProfile.from_dict(profile).to_dict(), sort_keys=True)
+        except ValueError as e:
+            raise falcon.HTTPBadRequest('Bad request', 'Invalid fault profile for {}: {}'.format(
+                path, e))
+
+    return parsed
+
+
+def _fault_profiles_from_hash(hash):
+    return {path: json.loads(profile) for path, profile in (hash or {}).items()}
+
+
+def _parse_json(req):
+    try:
+        return json.loads(req.stream.read()) or {}
+    except (TypeError, json.JSONDecodeError):
+        raise falcon.HTTPBadRequest(
+            'Bad request',
+            'Request body was not valid JSON')
+
+
 class SettingsResource:
     """A resource that stores settings for the current simulation.
 
@@ -44,20 +135,30 @@ class SettingsResource:
         <
         * Closing connection 0
         {"outages": ["/recommendations"]}
+
+    Each change is made in a single MULTI/EXEC transaction, so services
+    never see it half applied.
+
+    ``fault_profiles`` sets the faults to simulate for each path, as
+    described by `FaultProfile`, e.g.:
+
+        {"fault_profiles": {"/recommendations": {
+            "latency": {"distribution": "lognormal", "median": 0.05, "sigma": 1},
+            "error_rate": 0.01}}}
     """
     def _parse_settings(self, req):
-        try:
-            settings = json.loads(req.stream.read()) or {}
-        except (TypeError, json.JSONDecodeError):
-            raise falcon.HTTPBadRequest(
-                'Bad request',
-                'Request body was not valid JSON')
+        settings = _parse_json(req)
 
         if not VALID_SETTINGS & set(settings.keys()):
             raise falcon.HTTPBadRequest(
                 'Bad request',
                 'Valid settings are: {}'.format(', '.join(VALID_SETTINGS)))
 
+        try:
+            parse_settings(settings)
+        except ValueError as e:
+            raise falcon.HTTPBadRequest('Bad request', str(e))
+
         return settings
 
     def on_get(self, req, resp):
@@ -72,46 +173,147 @@ class SettingsResource:
         if perf_problems:
             settings[PERFORMANCE_PROBLEMS_KEY] = perf_problems
 
-        resp.body = json.dumps(settings)
+        fault_profiles = _fault_profiles_from_hash(redis.hgetall(FAULT_PROFILES_KEY))
+
+        if fault_profiles:
+            settings[FAULT_PROFILES_KEY] = fault_profiles
+
+        write_json(resp, settings)
+
+    def _replace_paths(self, pipeline, settings, new_settings):
+        for key in FAULT_KEYS:
+            if key in settings:
+                pipeline.delete(key)
+
+                if settings[key]:
+                    pipeline.sadd(key, *settings[key])
+
+                new_settings[key] = list(set(settings[key]))
+
+    def _hash_settings(self, settings):
+        return {k: v for k, v in settings.items()
+                if k not in FAULT_KEYS and k != FAULT_PROFILES_KEY}
 
     def on_put(self, req, resp):
-        """Replace current simulation settings."""
+        """Replace current simulation settings, starting a new simulation.
+
+        ``fault_profiles``, if given, replaces every path's fault profile.
+        """
         settings = self._parse_settings(req)
-        new_settings = {k: v for k, v in settings.items()
-                        if k not in (OUTAGES_KEY, PERFORMANCE_PROBLEMS_KEY)}
+        new_settings = self._hash_settings(settings)
+        pipeline = redis.pipeline()
 
         if new_settings:
-            redis.hmset(SETTINGS_KEY, new_settings)
+            pipeline.hmset(SETTINGS_KEY, new_settings)
 
-        for key in (OUTAGES_KEY, PERFORMANCE_PROBLEMS_KEY):
-            if key in settings:
-                redis.delete(key)
-                for path in settings[key]:
-                    redis.sadd(key, path)
-                new_settings[key] = list(redis.smembers(key) or [])
+        self._replace_paths(pipeline, settings, new_settings)
+
+        if FAULT_PROFILES_KEY in settings:
+            profiles = _parse_fault_profiles(settings[FAULT_PROFILES_KEY])
+            pipeline.delete(FAULT_PROFILES_KEY)
 
-        resp.body = json.dumps(new_settings)
+            if profiles:
+                pipeline.hmset(FAULT_PROFILES_KEY, profiles)
+
+            new_settings[FAULT_PROFILES_KEY] = _fault_profiles_from_hash(profiles)
+
+        pipeline.incr(SIMULATION_KEY)
+        _commit(pipeline, 'put')
+        write_json(resp, new_settings)
 
     def on_patch(self, req, resp):
-        """Partially update the current simulation settings."""
+        """Partially update the current simulation settings.
+
+        ``fault_profiles``, if given, replaces the fault profiles of the
+        paths it includes. A path whose profile is null has it removed.
+        """
         settings = self._parse_settings(req)
-        current_settings = from_redis_hash(redis.hgetall(SETTINGS_KEY) or {})
-        new_settings = {k: v for k, v in settings.items()
-                        if k not in (OUTAGES_KEY, PERFORMANCE_PROBLEMS_KEY)}
+        new_settings = self._hash_settings(settings)
+        pipeline = redis.pipeline()
 
         if new_settings:
-            current_settings.update(new_settings)
-            redis.hmset(SETTINGS_KEY, current_settings)
+            pipeline.hmset(SETTINGS_KEY, new_settings)
 
-        for key in (OUTAGES_KEY, PERFORMANCE_PROBLEMS_KEY):
-            if key in settings:
-                redis.delete(key)
-                for path in settings[key]:
-                    redis.sadd(key, path)
-                current_settings[key] = list(redis.smembers(key) or [])
+        # Read the settings back first, so they are at a known position.
+        pipeline.hgetall(SETTINGS_KEY)
+        hash_position = 1 if new_settings else 0
+        self._replace_paths(pipeline, settings, new_settings)
+
+        if FAULT_PROFILES_KEY in settings:
+            profiles = _parse_fault_profiles(settings[FAULT_PROFILES_KEY], allow_removal=True)
+            removed = [path for path, profile in profiles.items() if profile is None]
+            changed = {path: profile for path, profile in profiles.items() if profile is not None}
+
+            if removed:
+                pipeline.hdel(FAULT_PROFILES_KEY, *removed)
+            if changed:
+                pipeline.hmset(FAULT_PROFILES_KEY, changed)
+
+            pipeline.hgetall(FAULT_PROFILES_KEY)
+
+        results = _commit(pipeline, 'patch')
+        current_settings = from_redis_hash(results[hash_position] or {})
+        current_settings.update(new_settings)
+
+        if FAULT_PROFILES_KEY in settings:
+            current_settings[FAULT_PROFILES_KEY] = _fault_profiles_from_hash(results[-1])
+
+        write_json(resp, current_settings)
+
+
+class FaultsResource:
+    """A resource that adds and removes many simulated faults at once.
+
+    POST the paths to add to, or remove from, the outages and performance
+    problems to this endpoint. Every change is made in one transaction.
+    E.g.:
+
+        $ curl -X POST "http://192.168.99.100:8004/settings/faults" \
+                -d '{"outages": {"add": ["/recommendations"], "remove": ["/popular_items"]}}'
+
+    Response:
+
+        < HTTP/1.1 200 OK
+        < content-type: application/json; charset=UTF-8
+        <
+        {"outages": ["/recommendations"], "performance_problems": []}
+    """
+    def _parse_faults(self, req):
+        faults = _parse_json(req)
+        description = ('The body must map {} to objects with lists of paths to "add" '
+                       'and "remove".'.format(' or '.join(FAULT_KEYS)))
+
+        if not isinstance(faults, dict) or not faults or not set(faults) <= set(FAULT_KEYS):
+            raise falcon.HTTPBadRequest('Bad request', description)
+
+        for changes in faults.values():
+            if not isinstance(changes, dict) or not set(changes) <= {'add', 'remove'}:
+                raise falcon.HTTPBadRequest('Bad request', description)
+
+            for paths in changes.values():
+                if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+                    raise falcon.HTTPBadRequest('Bad request', description)
+
+        return faults
+
+    def on_post(self, req, resp):
+        """Add and remove simulated faults."""
+        faults = self._parse_faults(req)
+        pipeline = redis.pipeline()
+
+        for key, changes in faults.items():
+            if changes.get('remove'):
+                pipeline.srem(key, *changes['remove'])
+            if changes.get('add'):
+                pipeline.sadd(key, *changes['add'])
+
+        for key in FAULT_KEYS:
+            pipeline.smembers(key)
 
-        resp.body = json.dumps(current_settings)
+        members = _commit(pipeline, 'faults')[-len(FAULT_KEYS):]
+        write_json(resp, {key: list(paths or []) for key, paths in zip(FAULT_KEYS, members)})
 
 
 api = falcon.API()
 api.add_route('/settings', SettingsResource())
+api.add_route('/settings/faults', FaultsResource())
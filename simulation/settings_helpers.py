@@ -4,13 +4,64 @@ import json
 
 from .redis_helpers import from_redis_hash, redis_client
 from .default_settings import DEFAULT_SETTINGS
+from .faults import BLOCKING, NON_BLOCKING
 
 SETTINGS_KEY = 'settings'
 
+# How to parse the settings with numeric values, which often arrive as
+# strings, e.g. from run_simulation.py's flags or the Redis hash.
+NUMERIC_SETTINGS = {
+    'failure_rate_threshold': float,
+    'slow_call_duration': float,
+    'slow_call_rate_threshold': float,
+    'timeout': float,
+    'retry_budget': float,
+    'hedge_percentile': float,
+    'hedge_budget': float,
+    'bulkhead_max_concurrent': int,
+    'deadline': float,
+    'pool_maxsize': int,
+    'pool_idle_timeout': float
+}
+
+# The numeric settings that turn off what they control when they are empty,
+# e.g. None or 0.
+OPTIONAL_SETTINGS = {'slow_call_duration', 'timeout', 'retry_budget', 'deadline',
+                     'pool_idle_timeout'}
+
+BOOLEAN_SETTINGS = {
+    'circuit_breakers',
+    'shared_circuit_breakers',
+    'retries',
+    'hedged_requests',
+    'response_cache',
+    'bulkheads',
+    'fan_out',
+    'concurrency_limit',
+    'pool_block',
+    'keep_alive'
+}
+
+# The settings that must have one of a few values.
+CHOICE_SETTINGS = {
+    'circuit_breaker_mode': ('consecutive_failures', 'failure_rate'),
+    'latency_injection': (BLOCKING, NON_BLOCKING)
+}
+
 _client_settings = None
 redis = redis_client()
 
 
+def client_settings_from_hash(hash):
+    """Return client settings given the settings hash stored in Redis.
+
+    Any setting in ``hash`` overrides its default.
+    """
+    settings = DEFAULT_SETTINGS.copy()
+    settings.update(from_redis_hash(hash or {}))
+    return settings
+
+
 def get_client_settings():
     """Return the settings that ApiClient instances should use.
 
@@ -19,8 +70,35 @@ def get_client_settings():
     """
     global _client_settings
 
-    settings = DEFAULT_SETTINGS.copy()
-    settings.update(from_redis_hash(redis.hgetall(SETTINGS_KEY) or {}))
-    _client_settings = settings
+    _client_settings = client_settings_from_hash(redis.hgetall(SETTINGS_KEY))
 
     return _client_settings
+
+
+def parse_settings(settings):
+    """Return a copy of ``settings`` with their numeric values parsed.
+
+    Raises ValueError if any setting has a value of the wrong type, so
+    that callers can check every value before they use any.
+    """
+    parsed = settings.copy()
+
+    for name, value in settings.items():
+        if name in NUMERIC_SETTINGS:
+            if name in OPTIONAL_SETTINGS and not value:
+                continue
+            if isinstance(value, bool):
+                raise ValueError('{} must be a number'.format(name))
+            try:
+                parsed[name] = NUMERIC_SETTINGS[name](value)
+            except (TypeError, ValueError):
+                raise ValueError('{} must be a number'.format(name))
+        elif name in BOOLEAN_SETTINGS:
+            if not isinstance(value, bool):
+                raise ValueError('{} must be true or false'.format(name))
+        elif name in CHOICE_SETTINGS:
+            if value not in CHOICE_SETTINGS[name]:
+                raise ValueError('{} must be one of: {}'.format(
+                    name, ', '.join(CHOICE_SETTINGS[name])))
+
+    return parsed
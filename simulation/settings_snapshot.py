@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+import redis as redis_lib
+
+import simulation
+
+from .faults import FaultProfile
+from .redis_helpers import redis_client
+from .settings import (
+    FAULT_PROFILES_KEY,
+    OUTAGES_KEY,
+    PERFORMANCE_PROBLEMS_KEY,
+    SETTINGS_CHANNEL,
+    SETTINGS_KEY,
+    SETTINGS_VERSION_KEY,
+    SIMULATION_KEY
+)
+from .settings_helpers import client_settings_from_hash
+
+
+# How often, in seconds, to re-read settings from Redis in case a change
+# notification was missed, e.g. because the subscriber was reconnecting.
+POLL_INTERVAL = 5
+
+# How long, in seconds, to wait before resubscribing after losing the
+# connection to Redis.
+RESUBSCRIBE_DELAY = 1
+
+log = logging.getLogger(__name__)
+
+_snapshot = None
+
+
+class SettingsSnapshot:
+    """An in-memory copy of the simulation's settings.
+
+    Checking the outage and performance problem sets and the fault profiles
+    in Redis on every request would put Redis in the hot path of every hop.
+    Instead, this class keeps a local copy of them, refreshed whenever the Settings
+    API publishes a change to ``SETTINGS_CHANNEL``. As a fallback, the copy
+    is also refreshed when it is more than ``poll_interval`` seconds old.
+
+    The subscriber runs in a daemon thread, started the first time the
+    snapshot is read in each process.
+
+    Objects that hold on to client settings, like API clients, can register
+    a callback with ``watch()`` to receive the new client settings whenever
+    they change, instead of requiring a restart. Objects that learn from the
+    requests they see, like circuit breakers and caches, can register one
+    with ``watch_reset()`` to forget it when a new simulation starts, so
+    that one simulation's results do not depend on the one before.
+
+    The Settings API increments SETTINGS_VERSION_KEY with every change, so
+    a refresh only reads that key while the version stays the same. All
+    the settings are read in one transaction, so a change is never seen
+    half applied.
+    """
+    def __init__(self, redis, poll_interval=POLL_INTERVAL, subscribe=True):
+        self.poll_interval = poll_interval
+        self.outages = frozenset()
+        self.performance_problems = frozenset()
+        self.fault_profiles = {}
+        self.client_settings = None
+        self.version = None
+        self.simulation = None
+        self._watchers = []
+        self._reset_watchers = []
+        self._redis = redis
+        self._subscribe = subscribe
+        self._subscriber_pid = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Re-read the settings from Redis.
+
+        If Redis is unavailable, the last known settings remain in effect.
+        """
+        try:
+            version = self._redis.get(SETTINGS_VERSION_KEY)
+
+            # Settings written without the Settings API have no version, so
+            # they are always read.
+            if version is None or version != self.version:
+                self._read_settings()
+        except redis_lib.RedisError:
+            log.exception('Could not refresh settings from Redis')
+
+        self._refreshed_at = time.monotonic()
+
+    def _read_settings(self):
+        pipeline = self._redis.pipeline()
+        pipeline.get(SETTINGS_VERSION_KEY)
+        pipeline.smembers(OUTAGES_KEY)
+        pipeline.smembers(PERFORMANCE_PROBLEMS_KEY)
+        pipeline.hgetall(SETTINGS_KEY)
+        pipeline.hgetall(FAULT_PROFILES_KEY)
+        pipeline.get(SIMULATION_KEY)
+        (version, outages, performance_problems, settings_hash, profiles,
+         simulation) = pipeline.execute()
+        client_settings = client_settings_from_hash(settings_hash)
+        # A process that just started has nothing to forget.
+        new_simulation = self.client_settings is not None and simulation != self.simulation
+
+        self.version = version
+        self.simulation = simulation
+        self.outages = frozenset(outages or ())
+        self.performance_problems = frozenset(performance_problems or ())
+        self.fault_profiles = self._parse_fault_profiles(profiles or {})
+
+        if client_settings != self.client_settings:
+            self.client_settings = client_settings
+            self._notify(client_settings)
+
+        if new_simulation:
+            self._notify_reset()
+
+    def _parse_fault_profiles(self, profiles):
+        parsed = {}
+
+        for path, profile in profiles.items():
+            try:
+                parsed[path] = FaultProfile.from_dict(json.loads(profile))
+            except ValueError:
+                log.exception('Ignoring invalid fault profile for %s', path)
+
+        return parsed
+
+    def watch(self, callback):
+        """Call ``callback`` with the new client settings when they change.
+
+        Bound methods are held weakly, so watching does not keep the object
+        that owns the method alive.
+        """
+        self._add_watcher(self._watchers, callback)
+
+    def watch_reset(self, callback):
+        """Call ``callback`` with no arguments when a new simulation starts.
+
+        Bound methods are held weakly, as they are by `watch()`.
+        """
+        self._add_watcher(self._reset_watchers, callback)
+
+    def _add_watcher(self, watchers, callback):
+        if hasattr(callback, '__self__'):
+            ref = weakref.WeakMethod(callback)
+        else:
+            ref = lambda: callback
+
+        with self._lock:
+            watchers.append(ref)
+
+    def _callbacks(self, watchers):
+        """Return the callbacks in ``watchers`` whose objects still exist."""
+        with self._lock:
+            watchers[:] = [ref for ref in watchers if ref() is not None]
+            return [callback for callback in (ref() for ref in watchers) if callback is not None]
+
+    def _notify(self, client_settings):
+        for callback in self._callbacks(self._watchers):
+            try:
+                callback(client_settings.copy())
+            except Exception:
+                log.exception('Error applying new settings')
+
+    def _notify_reset(self):
+        for callback in self._callbacks(self._reset_watchers):
+            try:
+                callback()
+            except Exception:
+                log.exception('Error resetting for a new simulation')
+
+    def _ensure_fresh(self):
+        if self._subscribe and self._subscriber_pid != os.getpid():
+            self._start_subscriber()
+
+        refreshed_at = self._refreshed_at
+
+        if refreshed_at is None or time.monotonic() - refreshed_at >= self.poll_interval:
+            self.refresh()
+
+    def _start_subscriber(self):
+        with self._lock:
+            # The thread does not survive a fork, so each worker process
+            # needs to start its own.
+            if self._subscriber_pid == os.getpid():
+                return
+            self._subscriber_pid = os.getpid()
+
+        thread = threading.Thread(target=self._listen, name='settings-subscriber')
+        thread.daemon = True
+        thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(SETTINGS_CHANNEL)
+                # Anything published while we were not subscribed was missed.
+                self.refresh()
+
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.refresh()
+            except redis_lib.RedisError:
+                log.exception('Lost settings subscription, resubscribing')
+                time.sleep(RESUBSCRIBE_DELAY)
+
+    def is_outage(self, path):
+        """Return True if requests to ``path`` should simulate an outage."""
+        self._ensure_fresh()
+        return path in self.outages
+
+    def has_performance_problem(self, path):
+        """Return True if responses from ``path`` should be delayed."""
+        self._ensure_fresh()
+        return path in self.performance_problems
+
+    def fault_profile(self, path):
+        """Return the `FaultProfile` to simulate for ``path``, or None."""
+        self._ensure_fresh()
+        return self.fault_profiles.get(path)
+
+
+def settings_snapshot():
+    """Return this process's `SettingsSnapshot`.
+
+    When testing, the snapshot re-reads Redis on every check so that tests
+    can change settings directly in Redis.
+    """
+    global _snapshot
+
+    if _snapshot is None:
+        if simulation.TESTING:
+            _snapshot = SettingsSnapshot(redis_client(), poll_interval=0, subscribe=False)
+        else:
+            _snapshot = SettingsSnapshot(redis_client())
+
+    return _snapshot
@@ -1,5 +1,8 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import asyncio
+import json
+
 from requests import Timeout
 
 import simulation
@@ -26,11 +29,55 @@ def mock_runtime_error(*args, **kwargs):
 
 class MockResponse:
     """A helper for mocking `request` library responses."""
-    def __init__(self, json_data, status_code):
+    def __init__(self, json_data, status_code, headers=None):
         self.json_data = json_data
         self.status_code = status_code
+        self.headers = headers or {}
+
+    @property
+    def content(self):
+        return json.dumps(self.json_data).encode('utf-8')
 
     def json(self):
         return self.json_data
 
 
+class FakeClock:
+    """A clock for tests to set, in place of e.g. `time.monotonic`."""
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def run(coroutine):
+    """Run ``coroutine`` to completion on the default event loop."""
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def simulate_asgi_request(app, method, path, headers=None, body=b''):
+    """Send a request to the ASGI application ``app``.
+
+    Returns a (status, headers, body) tuple.
+    """
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'headers': [(name.lower().encode(), value.encode())
+                    for name, value in (headers or {}).items()]
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    run(app(scope, receive, send))
+    start, *bodies = sent
+    response_headers = {name.decode(): value.decode() for name, value in start['headers']}
+
+    return start['status'], response_headers, b''.join(message['body'] for message in bodies)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import json
+import time
 from unittest import mock
 
 import pybreaker
@@ -7,12 +9,22 @@ import pybreaker
 from falcon.testing import TestCase
 
 from simulation import api_client
+from simulation.circuit_breakers import SharedCircuitBreaker
+from simulation.deadlines import DEADLINE_HEADER
 from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.hedging import Hedger
 from simulation.jittery_retry import RetryWithFullJitter
-from simulation.settings import SettingsResource
+from simulation.response_cache import ResponseCache, is_stale
+from simulation.settings import (
+    FAULT_PROFILES_KEY,
+    OUTAGES_KEY,
+    PERFORMANCE_PROBLEMS_KEY,
+    SettingsResource
+)
 from simulation.redis_helpers import redis_client
 from simulation.settings_helpers import get_client_settings
 from . import (
+    MockResponse,
     mock_200_response,
     mock_connection_error,
     mock_runtime_error,
@@ -25,6 +37,20 @@ class FakeApiClient(api_client.ApiClient):
     circuit_breaker = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=30)
 
 
+class SharedBreakerApiClient(api_client.ApiClient):
+    url = "http://example.com"
+    circuit_breaker = SharedCircuitBreaker('example', fail_max=5, reset_timeout=30)
+
+
+class HedgedApiClient(api_client.ApiClient):
+    url = "http://example.com"
+    hedger = Hedger()
+
+
+class CachedApiClient(api_client.ApiClient):
+    url = "http://example.com/cached"
+
+
 class TestApiClient(TestCase):
     def setUp(self):
         super().setUp()
@@ -63,6 +89,18 @@ class TestApiClient(TestCase):
         FakeApiClient(settings).get()
         mock_get.assert_called_with('http://example.com', timeout=1)
 
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_sends_deadline(self, mock_get):
+        FakeApiClient(DEFAULT_SETTINGS).get(deadline=time.monotonic() + 0.5)
+        kwargs = mock_get.call_args[1]
+        assert 0.4 < kwargs['timeout'] <= 0.5
+        assert 400 < int(kwargs['headers'][DEADLINE_HEADER]) <= 500
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_skips_request_past_deadline(self, mock_get):
+        assert FakeApiClient(DEFAULT_SETTINGS).get(deadline=time.monotonic()) is None
+        assert not mock_get.called
+
     @mock.patch('requests.Session.get', side_effect=mock_200_response)
     def test_get_uses_provided_timeout(self, mock_get):
         settings = DEFAULT_SETTINGS.copy()
@@ -106,3 +144,315 @@ class TestApiClient(TestCase):
         settings = get_client_settings()
         FakeApiClient(settings).get()
         mock_get.assert_called_with('http://example.com', timeout=10)
+
+    @mock.patch('time.sleep')
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_waits_out_non_blocking_latency(self, mock_get, mock_sleep):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(latency_injection='non_blocking', timeout='5')
+        client = FakeApiClient(settings)
+        client.url = 'http://example.com/slow'
+        redis_client().hset(FAULT_PROFILES_KEY, '/slow', json.dumps(
+            {'latency': {'distribution': 'fixed', 'seconds': 2}}))
+
+        assert client.get().status_code == 200
+        mock_sleep.assert_called_once_with(2)
+
+    @mock.patch('time.sleep')
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_non_blocking_latency_times_out(self, mock_get, mock_sleep):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(latency_injection='non_blocking', timeout='1')
+        client = FakeApiClient(settings)
+        client.url = 'http://example.com/slow'
+        redis_client().sadd(PERFORMANCE_PROBLEMS_KEY, '/slow')
+
+        assert client.get() is None
+        mock_sleep.assert_called_once_with(1)
+        assert not mock_get.called
+
+    @mock.patch('time.sleep')
+    @mock.patch('simulation.api_client.injected_delay', side_effect=[5, 0.5])
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_retries_non_blocking_latency_with_fresh_latency(self, mock_get, mock_injected_delay,
+                                                              mock_sleep):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(latency_injection='non_blocking', timeout='1', retries=True)
+        client = FakeApiClient(settings)
+
+        assert client.get().status_code == 200
+        assert mock_injected_delay.call_count == 2
+        assert mock_get.call_count == 1
+        mock_sleep.assert_any_call(0.5)
+
+    @mock.patch('simulation.api_client.injected_delay', side_effect=[5, 0])
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_hedges_non_blocking_latency_with_fresh_latency(self, mock_get, mock_injected_delay):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(latency_injection='non_blocking', timeout='0.3', hedged_requests=True)
+        client = HedgedApiClient(settings)
+        start = time.monotonic()
+
+        with mock.patch.object(client.hedger, 'delay', return_value=0.01):
+            assert client.get().status_code == 200
+
+        assert time.monotonic() - start < 0.3
+        assert mock_injected_delay.call_count == 2
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_simulates_connection_resets(self, mock_get):
+        redis_client().hset(FAULT_PROFILES_KEY, '/reset', json.dumps({'reset_rate': 1}))
+        client = FakeApiClient()
+        client.url = 'http://example.com/reset'
+        assert client.get() is None
+        assert not mock_get.called
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_simulates_outage(self, mock_get):
+        redis_client().sadd(OUTAGES_KEY, '/outage')
+        client = FakeApiClient()
+        client.url = 'http://example.com/outage'
+        assert client.get() is None
+        assert not mock_get.called
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_follows_settings_changes(self, mock_get):
+        client = FakeApiClient()
+        self.simulate_patch('/settings', body='{"timeout": 10}')
+        client.get()
+        mock_get.assert_called_with('http://example.com', timeout=10)
+
+    def test_settings_changes_keep_connection_pools(self):
+        client = FakeApiClient()
+        pool_manager = client.adapters['http://example.com'].poolmanager
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(retries=True)
+        client.apply_settings(settings)
+        adapter = client.adapters['http://example.com']
+        assert adapter.poolmanager is pool_manager
+        assert isinstance(adapter.max_retries, RetryWithFullJitter)
+
+    def test_pool_settings(self):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(pool_maxsize='25', pool_block=True, pool_idle_timeout='5')
+        adapter = FakeApiClient(settings).adapters['http://example.com']
+        assert adapter.poolmanager.connection_pool_kw['maxsize'] == 25
+        assert adapter.poolmanager.connection_pool_kw['block']
+        assert adapter.idle_timeout == 5
+
+    def test_invalid_settings_change_nothing(self):
+        client = FakeApiClient(DEFAULT_SETTINGS.copy())
+        adapter = client.adapters['http://example.com']
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(timeout='5', bulkhead_max_concurrent='3', pool_maxsize='abc')
+
+        with self.assertRaises(ValueError):
+            client.apply_settings(settings)
+        assert client.settings['timeout'] is None
+        assert client.bulkhead.max_concurrent == 10
+        assert client.adapters['http://example.com'] is adapter
+
+    def test_clients_can_override_pool_size(self):
+        class BigPoolClient(FakeApiClient):
+            pool_maxsize = 50
+
+        adapter = BigPoolClient(DEFAULT_SETTINGS.copy()).adapters['http://example.com']
+        assert adapter.poolmanager.connection_pool_kw['maxsize'] == 50
+
+    def test_shared_circuit_breakers_setting(self):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(shared_circuit_breakers=True)
+        client = SharedBreakerApiClient(settings)
+        assert client.circuit_breaker.shared
+
+        settings.update(shared_circuit_breakers=False)
+        client.apply_settings(settings)
+        assert not client.circuit_breaker.shared
+
+    @mock.patch('requests.Session.get', side_effect=mock_connection_error)
+    def test_failure_rate_circuit_breaker_mode(self, mock_get):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(circuit_breaker_mode='failure_rate')
+        client = FakeApiClient(settings)
+        client.get()
+        assert client.circuit_breaker.fail_counter == 0
+        assert client.rate_circuit_breaker.current_state == 'closed'
+
+    def test_retry_budget(self):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(retries=True, retry_budget='0.2')
+        client = FakeApiClient(settings, max_retries=1)
+        max_retries = client.adapters['http://example.com'].max_retries
+        assert max_retries.budget.ratio == 0.2
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_hedged_requests(self, mock_get):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(hedged_requests=True)
+        client = HedgedApiClient(settings)
+
+        with mock.patch.object(client.hedger, 'call', wraps=client.hedger.call) as mock_call:
+            assert client.get().status_code == 200
+        assert mock_call.called
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_records_latency_for_hedging(self, mock_get):
+        client = HedgedApiClient(DEFAULT_SETTINGS)
+
+        with mock.patch.object(client.hedger, 'record') as mock_record:
+            client.get()
+        assert mock_record.called
+
+    @mock.patch.object(api_client.metrics, 'incr')
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_bulkhead_rejects_when_full(self, mock_get, mock_incr):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(bulkheads=True, bulkhead_max_concurrent='1')
+        client = FakeApiClient(settings)
+        client.bulkhead.acquire()
+
+        assert client.get() is None
+        assert not mock_get.called
+        mock_incr.assert_called_once_with('.bulkhead_full')
+
+    @mock.patch('requests.Session.get', side_effect=mock_timeout)
+    def test_bulkhead_released_after_request(self, mock_get):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(bulkheads=True, bulkhead_max_concurrent='1')
+        client = FakeApiClient(settings)
+        client.get()
+        client.get()
+
+        assert mock_get.call_count == 2
+        assert client.bulkhead.in_progress == 0
+
+    @mock.patch('simulation.api_client.injected_delay', side_effect=RuntimeError)
+    def test_bulkhead_released_after_unexpected_error(self, mock_injected_delay):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(bulkheads=True, bulkhead_max_concurrent='1',
+                        latency_injection='non_blocking')
+        client = FakeApiClient(settings)
+
+        assert client.get() is None
+        assert client.bulkhead.in_progress == 0
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_new_simulation_resets_client(self, mock_get):
+        self.now = 0
+        self.simulate_put('/settings', body='{"response_cache": true}')
+        client = CachedApiClient()
+        client.response_cache = ResponseCache(fresh_ttl=10, stale_ttl=10, clock=self.clock)
+        client.get()
+        client.circuit_breaker.open()
+
+        self.simulate_put('/settings', body='{"response_cache": true}')
+        api_client.snapshot.refresh()
+        client.get()
+        assert mock_get.call_count == 2
+        assert client.circuit_breaker.current_state == 'closed'
+
+    def cached_client(self):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(response_cache=True)
+        client = CachedApiClient(settings)
+        client.response_cache = ResponseCache(fresh_ttl=10, stale_ttl=10, clock=self.clock)
+        return client
+
+    def clock(self):
+        return self.now
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_response_cache_skips_network_while_fresh(self, mock_get):
+        self.now = 0
+        client = self.cached_client()
+
+        assert client.get().json() == [1, 2, 3]
+        assert client.get().json() == [1, 2, 3]
+        assert mock_get.call_count == 1
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_response_cache_varies_on_headers(self, mock_get):
+        self.now = 0
+        client = self.cached_client()
+        client.response_cache.vary = ('Authorization',)
+
+        client.get(headers={'Authorization': '1'})
+        client.get(headers={'Authorization': '2'})
+        assert mock_get.call_count == 2
+
+    @mock.patch.object(api_client, 'executor')
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_response_cache_serves_stale_while_revalidating(self, mock_get, mock_executor):
+        self.now = 0
+        client = self.cached_client()
+        client.get()
+        self.now = 15
+        mock_get.side_effect = mock_connection_error
+
+        response = client.get()
+        assert is_stale(response)
+        assert response.json() == [1, 2, 3]
+        # Another request does not revalidate again.
+        client.get()
+        assert mock_executor.submit.call_count == 1
+
+        # A failed revalidation leaves the stale response in place.
+        mock_executor.submit.call_args[0][0](*mock_executor.submit.call_args[0][1:])
+        assert is_stale(client.get())
+        assert mock_executor.submit.call_count == 2
+
+    @mock.patch.object(api_client, 'executor')
+    @mock.patch('requests.Session.get')
+    def test_response_cache_revalidates_with_etag(self, mock_get, mock_executor):
+        self.now = 0
+        client = self.cached_client()
+        mock_get.return_value = MockResponse([1, 2, 3], 200, {'ETag': '"1"',
+                                                               'Cache-Control': 'max-age=60'})
+        client.get()
+        self.now = 30
+        client.get()
+        assert mock_get.call_count == 1
+
+        self.now = 60
+        mock_get.return_value = MockResponse(None, 304, {'Cache-Control': 'max-age=60'})
+        assert is_stale(client.get())
+        mock_executor.submit.call_args[0][0](*mock_executor.submit.call_args[0][1:])
+
+        assert mock_get.call_args[1]['headers']['If-None-Match'] == '"1"'
+        response = client.get()
+        assert not is_stale(response)
+        assert response.json() == [1, 2, 3]
+
+    @mock.patch('requests.Session.get', side_effect=mock_connection_error)
+    def test_response_cache_does_not_store_failures(self, mock_get):
+        self.now = 0
+        client = self.cached_client()
+
+        assert client.get() is None
+        assert client.get() is None
+        assert mock_get.call_count == 2
+
+    def test_disabling_retries(self):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(retries=True)
+        client = FakeApiClient(settings)
+        settings.update(retries=False)
+        client.apply_settings(settings)
+        max_retries = client.adapters['http://example.com'].max_retries
+        assert not isinstance(max_retries, RetryWithFullJitter)
+        assert max_retries.total == 0
+
+    @mock.patch.object(api_client.metrics, 'histogram')
+    @mock.patch('requests.Session.get', side_effect=mock_200_response)
+    def test_records_latency(self, mock_get, mock_histogram):
+        self.client.get()
+        key, _, = mock_histogram.call_args[0]
+        tags = mock_histogram.call_args[1]['tags']
+        assert key == 'api_latency'
+        assert tags == {'path': '', 'outcome': 'success', 'retries': 0}
+
+    @mock.patch.object(api_client.metrics, 'histogram')
+    @mock.patch('requests.Session.get', side_effect=mock_timeout)
+    def test_records_latency_outcome(self, mock_get, mock_histogram):
+        self.client.get()
+        assert mock_histogram.call_args[1]['tags']['outcome'] == 'timeout'
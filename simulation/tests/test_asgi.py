@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+from unittest import TestCase
+
+import falcon
+
+from simulation.asgi import AsyncApp
+from . import simulate_asgi_request
+
+
+class EchoResource:
+    async def on_get(self, req, resp):
+        resp.body = json.dumps({'token': req.get_header('Authorization'),
+                                'context': req.context})
+
+    async def on_post(self, req, resp):
+        resp.data = req.body
+        resp.set_header('X-Echo', 'true')
+
+
+class BrokenResource:
+    async def on_get(self, req, resp):
+        raise ValueError('Out of pancakes')
+
+
+class ContextMiddleware:
+    async def process_request(self, req, resp):
+        req.context['user'] = 'pancakes'
+
+
+class ResponseMiddleware:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    async def process_request(self, req, resp):
+        pass
+
+    async def process_response(self, req, resp, resource):
+        self.calls.append((self.name, resp.status))
+
+
+class ForbiddingMiddleware:
+    async def process_request(self, req, resp):
+        raise falcon.HTTPForbidden('Permission denied', 'No pancakes for you')
+
+
+class TestAsyncApp(TestCase):
+    def setUp(self):
+        self.app = AsyncApp(middleware=[ContextMiddleware()])
+        self.app.add_route('/echo', EchoResource())
+
+    def test_routes_to_responder(self):
+        status, headers, body = simulate_asgi_request(
+            self.app, 'GET', '/echo', headers={'Authorization': 'Token 1234'})
+
+        assert status == 200
+        assert headers['content-type'] == 'application/json; charset=UTF-8'
+        assert json.loads(body.decode()) == {'token': 'Token 1234',
+                                             'context': {'user': 'pancakes'}}
+
+    def test_sends_bytes_and_headers(self):
+        status, headers, body = simulate_asgi_request(self.app, 'POST', '/echo', body=b'[1]')
+
+        assert status == 200
+        assert body == b'[1]'
+        assert headers['x-echo'] == 'true'
+        assert headers['content-length'] == '3'
+
+    def test_unknown_route(self):
+        status, _, _ = simulate_asgi_request(self.app, 'GET', '/missing')
+        assert status == 404
+
+    def test_unknown_method(self):
+        status, _, _ = simulate_asgi_request(self.app, 'DELETE', '/echo')
+        assert status == 405
+
+    def test_middleware_errors(self):
+        app = AsyncApp(middleware=[ForbiddingMiddleware()])
+        app.add_route('/echo', EchoResource())
+        status, _, body = simulate_asgi_request(app, 'GET', '/echo')
+
+        assert status == 403
+        assert json.loads(body.decode())['title'] == 'Permission denied'
+
+    def test_process_response_in_reverse_order(self):
+        calls = []
+        app = AsyncApp(middleware=[ResponseMiddleware('outer', calls),
+                                   ResponseMiddleware('inner', calls)])
+        app.add_route('/echo', EchoResource())
+        simulate_asgi_request(app, 'GET', '/echo')
+
+        assert calls == [('inner', falcon.HTTP_200), ('outer', falcon.HTTP_200)]
+
+    def test_process_response_after_middleware_errors(self):
+        calls = []
+        app = AsyncApp(middleware=[ResponseMiddleware('outer', calls),
+                                   ForbiddingMiddleware(),
+                                   ResponseMiddleware('inner', calls)])
+        app.add_route('/echo', EchoResource())
+        simulate_asgi_request(app, 'GET', '/echo')
+
+        assert calls == [('outer', falcon.HTTP_403)]
+
+    def test_unexpected_errors(self):
+        calls = []
+        app = AsyncApp(middleware=[ResponseMiddleware('outer', calls)])
+        app.add_route('/broken', BrokenResource())
+        status, _, body = simulate_asgi_request(app, 'GET', '/broken')
+
+        assert status == 500
+        assert json.loads(body.decode())['title'] == 'Internal Server Error'
+        assert calls == [('outer', falcon.HTTP_500)]
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import json
+import time
+from unittest import mock
+
+import aiohttp
+from falcon.testing import TestCase
+
+from simulation import async_api_client
+from simulation.async_api_client import AsyncApiClient, AsyncResponse
+from simulation.circuit_breakers import CircuitBreaker
+from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.redis_helpers import redis_client
+from simulation.response_cache import ResponseCache, is_stale
+from simulation.settings import (
+    FAULT_PROFILES_KEY,
+    OUTAGES_KEY,
+    PERFORMANCE_PROBLEMS_KEY,
+    SettingsResource
+)
+from . import run
+
+
+class FakeAsyncApiClient(AsyncApiClient):
+    url = "http://example.com/fake"
+    circuit_breaker = CircuitBreaker(fail_max=5, reset_timeout=30)
+
+
+async def mock_200_response(*args, **kwargs):
+    return AsyncResponse(200, {}, json.dumps([1, 2, 3]).encode())
+
+
+async def mock_connection_error(*args, **kwargs):
+    raise aiohttp.ClientConnectionError()
+
+
+async def mock_timeout(*args, **kwargs):
+    raise asyncio.TimeoutError()
+
+
+async def mock_runtime_error(*args, **kwargs):
+    raise RuntimeError()
+
+
+class TestAsyncResponse(TestCase):
+    def test_error_responses_are_falsy(self):
+        assert AsyncResponse(200, {}, b'[]')
+        assert AsyncResponse(302, {}, b'')
+        assert not AsyncResponse(401, {}, b'{}')
+        assert not AsyncResponse(500, {}, b'{}')
+
+
+class TestAsyncApiClient(TestCase):
+    def setUp(self):
+        super().setUp()
+        redis_client().flushdb()
+        self.client = FakeAsyncApiClient()
+        self.api.add_route('/settings', SettingsResource())
+
+    def tearDown(self):
+        self.client.circuit_breaker.close()
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_get_returns_response(self, mock_send):
+        response = run(self.client.get())
+        assert response.status_code == 200
+        assert response.json() == [1, 2, 3]
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_get_uses_default_timeout(self, mock_send):
+        run(self.client.get())
+        timeout = mock_send.call_args[1]['timeout']
+        assert timeout.sock_connect == 1
+        assert timeout.sock_read == 1
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_get_uses_provided_timeout(self, mock_send):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(timeout=5)
+        run(FakeAsyncApiClient(settings).get())
+        assert mock_send.call_args[1]['timeout'].sock_read == 5
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_follows_settings_changes(self, mock_send):
+        self.simulate_patch('/settings', body='{"timeout": 10}')
+        run(self.client.get())
+        assert mock_send.call_args[1]['timeout'].sock_read == 10
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_connection_error)
+    def test_connection_error_returns_none(self, mock_send):
+        assert run(self.client.get()) is None
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_timeout)
+    def test_timeout_returns_none(self, mock_send):
+        assert run(self.client.get()) is None
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_runtime_error)
+    def test_unexpected_error_returns_none(self, mock_send):
+        assert run(self.client.get()) is None
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_connection_error)
+    def test_uses_circuit_breaker(self, mock_send):
+        assert self.client.circuit_breaker.fail_counter == 0
+        run(self.client.get())
+        assert self.client.circuit_breaker.fail_counter == 1
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_connection_error)
+    def test_open_circuit_breaker_skips_request(self, mock_send):
+        self.client.circuit_breaker.open()
+        assert run(self.client.get()) is None
+        assert not mock_send.called
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_half_open_circuit_breaker_closes_on_success(self, mock_send):
+        self.client.circuit_breaker.half_open()
+        run(self.client.get())
+        assert self.client.circuit_breaker.current_state == 'closed'
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_connection_error)
+    def test_retries_connection_errors(self, mock_send):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(retries=True)
+        run(FakeAsyncApiClient(settings, max_retries=2).get())
+        assert mock_send.call_count == 3
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_connection_error)
+    def test_does_not_retry_without_retries_setting(self, mock_send):
+        run(self.client.get())
+        assert mock_send.call_count == 1
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_waits_out_non_blocking_latency(self, mock_send):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(latency_injection='non_blocking', timeout='5')
+        client = FakeAsyncApiClient(settings)
+        redis_client().hset(FAULT_PROFILES_KEY, '/fake', json.dumps(
+            {'latency': {'distribution': 'fixed', 'seconds': 0.05}}))
+
+        start = time.monotonic()
+        assert run(client.get()).status_code == 200
+        assert time.monotonic() - start >= 0.05
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_non_blocking_latency_times_out(self, mock_send):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(latency_injection='non_blocking', timeout='0.05')
+        client = FakeAsyncApiClient(settings)
+        redis_client().sadd(PERFORMANCE_PROBLEMS_KEY, '/fake')
+
+        start = time.monotonic()
+        assert run(client.get()) is None
+        assert time.monotonic() - start < 1
+        assert not mock_send.called
+
+    @mock.patch('simulation.async_api_client.injected_delay', side_effect=[1, 0])
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_retries_non_blocking_latency_with_fresh_latency(self, mock_send, mock_injected_delay):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(latency_injection='non_blocking', timeout='0.05', retries=True)
+        client = FakeAsyncApiClient(settings)
+
+        assert run(client.get()).status_code == 200
+        assert mock_injected_delay.call_count == 2
+        assert mock_send.call_count == 1
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_simulates_connection_resets(self, mock_send):
+        redis_client().hset(FAULT_PROFILES_KEY, '/fake', json.dumps({'reset_rate': 1}))
+        assert run(self.client.get()) is None
+        assert not mock_send.called
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_simulates_outage(self, mock_send):
+        redis_client().sadd(OUTAGES_KEY, '/fake')
+        assert run(self.client.get()) is None
+        assert not mock_send.called
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_bulkhead_rejects_when_full(self, mock_send):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(bulkheads=True, bulkhead_max_concurrent='1')
+        client = FakeAsyncApiClient(settings)
+        client.bulkhead.acquire()
+
+        assert run(client.get()) is None
+        assert not mock_send.called
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_bulkhead_released_after_request(self, mock_send):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(bulkheads=True, bulkhead_max_concurrent='1')
+        client = FakeAsyncApiClient(settings)
+
+        assert run(client.get()).status_code == 200
+        assert run(client.get()).status_code == 200
+        assert client.bulkhead.in_progress == 0
+
+    @mock.patch('simulation.async_api_client.injected_delay', side_effect=RuntimeError)
+    def test_bulkhead_released_after_unexpected_error(self, mock_injected_delay):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(bulkheads=True, bulkhead_max_concurrent='1',
+                        latency_injection='non_blocking')
+        client = FakeAsyncApiClient(settings)
+
+        assert run(client.get()) is None
+        assert client.bulkhead.in_progress == 0
+
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_200_response)
+    def test_response_cache_serves_stale_while_revalidating(self, mock_send):
+        now = [0]
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(response_cache=True)
+        client = FakeAsyncApiClient(settings)
+        client.response_cache = ResponseCache(fresh_ttl=10, stale_ttl=10, clock=lambda: now[0])
+
+        run(client.get())
+        assert not is_stale(run(client.get()))
+        assert mock_send.call_count == 1
+
+        now[0] = 15
+        assert is_stale(run(client.get()))
+        run(asyncio.sleep(0))
+        assert mock_send.call_count == 2
+        assert not is_stale(run(client.get()))
+
+    @mock.patch.object(async_api_client.metrics, 'histogram')
+    @mock.patch.object(FakeAsyncApiClient, '_send', side_effect=mock_connection_error)
+    def test_records_latency(self, mock_send, mock_histogram):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(retries=True)
+        run(FakeAsyncApiClient(settings, max_retries=2).get())
+        tags = mock_histogram.call_args[1]['tags']
+        assert tags == {'path': '/fake', 'outcome': 'connection_error', 'retries': 2}
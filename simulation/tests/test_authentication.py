@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from unittest import mock
 from falcon.testing import TestCase
 
 from simulation.authentication import AuthenticationResource
+from simulation.users import user_uuid
 
 
 class TestAuthentication(TestCase):
@@ -15,13 +15,19 @@ class TestAuthentication(TestCase):
         resp = self.simulate_post('/authenticate')
         assert resp.status_code == 401
 
-    @mock.patch('uuid.uuid4')
-    def test_post_returns_user_details_with_valid_token(self, mock_uuid4):
-        mock_uuid4.return_value = '1234'
+    def test_post_returns_user_details_with_valid_token(self):
         resp = self.simulate_post('/authenticate', headers={"Authorization": "1234"})
         expected_data = {
-            'uuid': '1234',
+            'uuid': user_uuid('1234'),
             'permissions': ['can_view_recommendations', 'can_view_homepage']
         }
         assert resp.status_code == 200
         assert expected_data == resp.json
+
+    def test_tokens_always_belong_to_the_same_user(self):
+        first = self.simulate_post('/authenticate', headers={"Authorization": "1234"})
+        second = self.simulate_post('/authenticate', headers={"Authorization": "1234"})
+        other = self.simulate_post('/authenticate', headers={"Authorization": "5678"})
+
+        assert first.json['uuid'] == second.json['uuid']
+        assert first.json['uuid'] != other.json['uuid']
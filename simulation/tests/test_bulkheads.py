@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from unittest import TestCase
+
+from simulation.bulkheads import Bulkhead
+
+
+class TestBulkhead(TestCase):
+    def setUp(self):
+        self.bulkhead = Bulkhead(max_concurrent=2)
+
+    def test_fails_fast_when_full(self):
+        assert self.bulkhead.acquire()
+        assert self.bulkhead.acquire()
+        assert not self.bulkhead.acquire()
+        assert self.bulkhead.in_progress == 2
+
+    def test_release_makes_room(self):
+        self.bulkhead.acquire()
+        self.bulkhead.acquire()
+        self.bulkhead.release()
+        assert self.bulkhead.acquire()
+
+    def test_max_concurrent_can_change(self):
+        self.bulkhead.acquire()
+        self.bulkhead.max_concurrent = 1
+        assert not self.bulkhead.acquire()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import threading
+from unittest import TestCase
+
+from simulation.cache import TTLCache
+from . import FakeClock
+
+
+class TestTTLCache(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_returns_stored_value(self):
+        self.cache.set('a', 1)
+        assert self.cache.get('a') == 1
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.clock.now = 10
+        assert self.cache.get('a') is None
+
+    def test_entries_can_have_their_own_ttl(self):
+        self.cache.set('a', 1, ttl=20)
+        self.clock.now = 15
+        assert self.cache.get('a') == 1
+
+    def test_zero_ttl_is_not_stored(self):
+        self.cache.set('a', 1, ttl=0)
+        assert len(self.cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        assert self.cache.get('a') == 1
+        assert self.cache.get('b') is None
+        assert self.cache.get('c') == 3
+
+    def test_get_or_load_reports_hits_and_misses(self):
+        def loader(key):
+            return key.upper(), 10
+
+        assert self.cache.get_or_load('a', loader) == ('A', False)
+        assert self.cache.get_or_load('a', loader) == ('A', True)
+
+    def test_get_or_load_does_not_cache_errors(self):
+        def loader(key):
+            raise RuntimeError()
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_load('a', loader)
+
+        assert self.cache.get('a') is None
+
+    def test_get_or_load_collapses_concurrent_misses(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def loader(key):
+            calls.append(key)
+            started.set()
+            release.wait(timeout=5)
+            return 'value', 10
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(self.cache.get_or_load('a', loader)))
+        first.start()
+        started.wait(timeout=5)
+        second = threading.Thread(target=lambda: results.append(self.cache.get_or_load('a', loader)))
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+
+        assert calls == ['a']
+        assert [value for value, _ in results] == ['value', 'value']
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import threading
+import time
+
+from unittest import TestCase, mock
+
+import pybreaker
+import pytest
+
+from redis.exceptions import ConnectionError
+
+from simulation.circuit_breakers import CircuitBreaker, RateCircuitBreaker, SharedCircuitBreaker
+from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.redis_helpers import redis_client
+from . import FakeClock
+
+
+def fail():
+    raise RuntimeError()
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(fail_max=2, reset_timeout=30)
+
+    def test_opens_after_fail_max_failures(self):
+        with pytest.raises(RuntimeError):
+            self.breaker.call(fail)
+        with pytest.raises(pybreaker.CircuitBreakerError):
+            self.breaker.call(fail)
+        assert self.breaker.current_state == 'open'
+
+    def test_success_resets_failures(self):
+        with pytest.raises(RuntimeError):
+            self.breaker.call(fail)
+        assert self.breaker.call(lambda: 'ok') == 'ok'
+        assert self.breaker.fail_counter == 0
+
+    def test_does_not_hold_lock_during_call(self):
+        other_thread_called = threading.Event()
+
+        def slow():
+            thread = threading.Thread(target=self.breaker.call, args=(other_thread_called.set,))
+            thread.start()
+            thread.join(1)
+            return other_thread_called.is_set()
+
+        assert self.breaker.call(slow)
+
+    def test_allows_one_trial_call(self):
+        self.breaker.half_open()
+        self.breaker.before_call()
+
+        with pytest.raises(pybreaker.CircuitBreakerError):
+            self.breaker.before_call()
+
+        self.breaker.record_success()
+        assert self.breaker.current_state == 'closed'
+
+    def test_failed_trial_call_opens(self):
+        self.breaker.half_open()
+        self.breaker.before_call()
+
+        with pytest.raises(pybreaker.CircuitBreakerError):
+            self.breaker.record_failure(RuntimeError())
+        assert self.breaker.current_state == 'open'
+
+
+class TestSharedCircuitBreaker(TestCase):
+    def setUp(self):
+        redis_client().flushdb()
+        # Two breakers with one name stand in for two worker processes.
+        self.breaker = SharedCircuitBreaker('fake', fail_max=2, reset_timeout=30, shared=True)
+        self.other_breaker = SharedCircuitBreaker('fake', fail_max=2, reset_timeout=30, shared=True)
+
+    def test_failures_are_shared(self):
+        with pytest.raises(RuntimeError):
+            self.breaker.call(fail)
+        with pytest.raises(pybreaker.CircuitBreakerError):
+            self.other_breaker.call(fail)
+
+        assert self.breaker.current_state == 'open'
+        with pytest.raises(pybreaker.CircuitBreakerError):
+            self.breaker.call(lambda: 'ok')
+
+    def test_success_resets_shared_failures(self):
+        with pytest.raises(RuntimeError):
+            self.breaker.call(fail)
+        self.other_breaker.call(lambda: 'ok')
+        assert self.breaker.fail_counter == 0
+
+    def test_success_while_closed_is_not_written(self):
+        call_state = self.breaker.before_call()
+
+        with mock.patch.object(self.breaker._redis, 'transaction') as mock_transaction:
+            self.breaker.record_success(call_state=call_state)
+        assert not mock_transaction.called
+
+    def test_success_after_failures_is_written(self):
+        with pytest.raises(RuntimeError):
+            self.other_breaker.call(fail)
+
+        call_state = self.breaker.before_call()
+        with mock.patch.object(self.breaker._redis, 'transaction') as mock_transaction:
+            self.breaker.record_success(call_state=call_state)
+        assert mock_transaction.called
+
+    def test_success_resets_failure_during_call(self):
+        call_state = self.breaker.before_call()
+
+        # Another call through the same breaker fails while the first is
+        # in progress, and a third call starts after the failure.
+        self.breaker.before_call()
+        self.breaker.record_failure(RuntimeError())
+        later_call_state = self.breaker.before_call()
+        assert self.breaker.fail_counter == 1
+
+        self.breaker.record_success(call_state=call_state)
+        assert self.breaker.fail_counter == 0
+
+        # The third call saw the failure, so it writes its success too.
+        self.breaker.record_failure(RuntimeError())
+        self.breaker.record_success(call_state=later_call_state)
+        assert self.breaker.fail_counter == 0
+
+    def test_one_process_makes_trial_call(self):
+        self.breaker.open()
+
+        with mock.patch('time.time', return_value=time.time() + 31):
+            self.breaker.before_call()
+            with pytest.raises(pybreaker.CircuitBreakerError):
+                self.other_breaker.before_call()
+
+        self.breaker.record_success()
+        assert self.other_breaker.current_state == 'closed'
+        self.other_breaker.call(lambda: 'ok')
+
+    def test_failed_trial_call_opens(self):
+        self.breaker.half_open()
+
+        with pytest.raises(pybreaker.CircuitBreakerError):
+            self.breaker.record_failure(RuntimeError())
+        assert self.other_breaker.current_state == 'open'
+
+    def test_close_resets_shared_state(self):
+        self.breaker.open()
+        self.other_breaker.close()
+        assert self.breaker.current_state == 'closed'
+        assert self.breaker.call(lambda: 'ok') == 'ok'
+
+    def test_not_shared_keeps_state_in_memory(self):
+        self.breaker.shared = False
+
+        with pytest.raises(RuntimeError):
+            self.breaker.call(fail)
+        assert self.breaker.fail_counter == 1
+        assert self.other_breaker.fail_counter == 0
+
+    def test_falls_back_to_memory_without_redis(self):
+        with mock.patch.object(self.breaker._redis, 'transaction', side_effect=ConnectionError):
+            with pytest.raises(RuntimeError):
+                self.breaker.call(fail)
+            with pytest.raises(pybreaker.CircuitBreakerError):
+                self.breaker.call(fail)
+
+        assert self.breaker.state.name == 'open'
+
+
+class TestRateCircuitBreaker(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = RateCircuitBreaker(window=10, buckets=10, minimum_calls=10,
+                                          failure_rate=0.5, clock=self.clock)
+
+    def fail(self, times):
+        for _ in range(times):
+            self.breaker.before_call()
+            self.breaker.record_failure(RuntimeError())
+
+    def succeed(self, times, duration=0.01):
+        for _ in range(times):
+            self.breaker.before_call()
+            self.breaker.record_success(duration)
+
+    def test_needs_minimum_calls(self):
+        self.fail(9)
+        assert self.breaker.current_state == 'closed'
+
+    def test_opens_at_failure_rate(self):
+        self.succeed(5)
+        self.fail(4)
+
+        with pytest.raises(pybreaker.CircuitBreakerError):
+            self.fail(1)
+        assert self.breaker.current_state == 'open'
+
+    def test_low_failure_rate_stays_closed(self):
+        for _ in range(10):
+            self.succeed(9)
+            self.fail(1)
+        assert self.breaker.current_state == 'closed'
+
+    def test_old_calls_leave_window(self):
+        self.fail(9)
+        self.clock.now = 10
+        self.succeed(1)
+        self.fail(8)
+        assert self.breaker.current_state == 'closed'
+
+    def test_opens_at_slow_call_rate(self):
+        self.breaker.slow_call_duration = 1
+        self.breaker.slow_call_rate = 0.5
+        self.succeed(5)
+        self.succeed(5, duration=2)
+        assert self.breaker.current_state == 'open'
+
+    def test_slow_trial_call_opens(self):
+        self.breaker.slow_call_duration = 1
+        self.breaker.half_open()
+        self.succeed(1, duration=2)
+        assert self.breaker.current_state == 'open'
+
+    def test_close_empties_window(self):
+        self.fail(9)
+        self.breaker.close()
+        self.fail(1)
+        assert self.breaker.current_state == 'closed'
+
+    def test_apply_settings(self):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(failure_rate_threshold='0.1', slow_call_duration='2',
+                        slow_call_rate_threshold='0.2')
+        self.breaker.apply_settings(settings)
+        assert self.breaker.failure_rate == 0.1
+        assert self.breaker.slow_call_duration == 2
+        assert self.breaker.slow_call_rate == 0.2
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import threading
+import time
+from unittest import mock
+
+import falcon
+
+from falcon.testing import StartResponseMock, TestCase, create_environ
+from redis.exceptions import ConnectionError
+
+from simulation.asgi import AsyncApp
+from simulation.concurrency_limits import (
+    AIMDLimiter,
+    AsyncConcurrencyLimitMiddleware,
+    ConcurrencyLimitMiddleware,
+    SharedAIMDLimiter
+)
+from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.redis_helpers import redis_client
+from . import FakeClock, simulate_asgi_request
+
+
+def simulate_get(app, path='/'):
+    """Send a GET request to the WSGI application ``app``, and return its status."""
+    start_response = StartResponseMock()
+    app(create_environ(path), start_response)
+    return start_response.status
+
+
+class OkResource:
+    def on_get(self, req, resp):
+        resp.body = '[]'
+
+
+class AsyncOkResource:
+    async def on_get(self, req, resp):
+        resp.body = '[]'
+
+
+class BlockingResource:
+    def __init__(self):
+        self.started = threading.Event()
+        self.finish = threading.Event()
+
+    def on_get(self, req, resp):
+        self.started.set()
+        self.finish.wait(timeout=5)
+        resp.body = '[]'
+
+
+class AsyncBrokenResource:
+    async def on_get(self, req, resp):
+        raise ValueError('Out of pancakes')
+
+
+class TestAIMDLimiter(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.limiter = AIMDLimiter(initial_limit=4, max_limit=10, clock=self.clock)
+
+    def test_rejects_beyond_limit(self):
+        assert all(self.limiter.acquire() for _ in range(4))
+        assert not self.limiter.acquire()
+
+        self.limiter.release(0.1)
+        assert self.limiter.acquire()
+
+    def test_grows_while_busy_and_fast(self):
+        for _ in range(4):
+            self.limiter.acquire()
+        for _ in range(4):
+            self.limiter.acquire()
+            self.limiter.release(0.1)
+
+        assert self.limiter.limit > 4
+
+    def test_does_not_grow_while_idle(self):
+        for _ in range(20):
+            self.limiter.acquire()
+            self.limiter.release(0.1)
+
+        assert self.limiter.limit == 4
+
+    def test_backs_off_when_slow(self):
+        self.limiter.acquire()
+        self.limiter.release(0.1)
+        self.limiter.acquire()
+        self.limiter.release(1)
+
+        assert self.limiter.limit == 4 * 0.9
+
+    def test_never_below_min_limit(self):
+        self.limiter.acquire()
+        self.limiter.release(0.1)
+
+        for _ in range(100):
+            self.clock.now += 1
+            self.limiter.acquire()
+            self.limiter.release(1)
+
+        assert self.limiter.limit == 1
+
+    def test_backs_off_once_per_burst(self):
+        self.limiter.acquire()
+        self.limiter.release(0.1)
+
+        for _ in range(4):
+            self.limiter.acquire()
+        self.clock.now = 1
+        for _ in range(4):
+            self.limiter.release(1)
+
+        assert self.limiter.limit == 4 * 0.9
+
+        # Requests that started after the back off can back off again.
+        self.clock.now = 2
+        self.limiter.acquire()
+        self.limiter.release(1)
+
+        assert self.limiter.limit == 4 * 0.9 * 0.9
+
+    def test_reset(self):
+        self.limiter.acquire()
+        self.limiter.release(0.1)
+        self.limiter.acquire()
+        self.limiter.release(1)
+
+        self.limiter.reset()
+        assert self.limiter.limit == 4
+        self.limiter.acquire()
+        self.limiter.release(1)
+        assert self.limiter.limit == 4
+
+    def test_baseline_follows_latency(self):
+        self.limiter.acquire()
+        self.limiter.release(0.1)
+
+        # Two windows later, 1s is the new normal.
+        for now in (30, 60):
+            self.clock.now = now
+            self.limiter.acquire()
+            self.limiter.release(1)
+
+        limit = self.limiter.limit
+        self.limiter.acquire()
+        self.limiter.release(1)
+        assert self.limiter.limit == limit
+
+
+class TestSharedAIMDLimiter(TestCase):
+    def setUp(self):
+        super().setUp()
+        redis_client().flushdb()
+        # Two limiters with one name stand in for two worker processes.
+        self.limiter = SharedAIMDLimiter('fake', initial_limit=1)
+        self.other_limiter = SharedAIMDLimiter('fake', initial_limit=1)
+
+    def test_counts_requests_in_every_process(self):
+        request = self.limiter.acquire()
+        assert request
+        assert self.other_limiter.acquire() is False
+
+        self.limiter.release(0.1, request)
+        assert self.other_limiter.acquire()
+
+    def test_forgets_requests_of_dead_processes(self):
+        self.limiter.acquire()
+
+        with mock.patch('time.time', return_value=time.time() + 61):
+            assert self.other_limiter.acquire()
+
+    def test_lets_requests_through_without_redis(self):
+        self.other_limiter.acquire()
+
+        with mock.patch.object(self.limiter._redis, 'pipeline', side_effect=ConnectionError):
+            request = self.limiter.acquire()
+            assert request is None
+            self.limiter.release(0.1, request)
+
+
+class TestConcurrencyLimitMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        settings = DEFAULT_SETTINGS.copy()
+        settings['concurrency_limit'] = True
+        self.limiter = AIMDLimiter(initial_limit=1)
+        self.middleware = ConcurrencyLimitMiddleware(self.limiter, settings)
+        self.api = falcon.API(middleware=[self.middleware])
+        self.api.add_route('/', OkResource())
+
+    def test_releases_after_response(self):
+        assert self.simulate_get('/').status_code == 200
+        assert self.simulate_get('/').status_code == 200
+        assert self.limiter.in_flight == 0
+
+    @mock.patch('simulation.concurrency_limits.metrics')
+    def test_rejects_beyond_limit(self, metrics):
+        self.limiter.acquire()
+        resp = self.simulate_get('/')
+
+        assert resp.status_code == 503
+        assert resp.headers['Retry-After'] == '1'
+        assert self.limiter.in_flight == 1
+        metrics.incr.assert_called_once_with('concurrency_limit.rejected', tags={'path': '/'})
+
+    def test_releases_after_error(self):
+        resp = self.simulate_get('/missing')
+
+        assert resp.status_code == 404
+        assert self.limiter.in_flight == 0
+
+    def test_disabled(self):
+        self.middleware.apply_settings(DEFAULT_SETTINGS)
+        self.limiter.acquire()
+
+        assert self.simulate_get('/').status_code == 200
+
+
+class TestSharedConcurrencyLimitMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        redis_client().flushdb()
+        settings = DEFAULT_SETTINGS.copy()
+        settings['concurrency_limit'] = True
+        self.resource = BlockingResource()
+        # Two apps with one limiter name stand in for two gunicorn workers,
+        # each handling one request at a time.
+        self.workers = []
+        for _ in range(2):
+            limiter = SharedAIMDLimiter('fake', initial_limit=1)
+            api = falcon.API(middleware=[ConcurrencyLimitMiddleware(limiter, settings)])
+            api.add_route('/', self.resource)
+            self.workers.append(api)
+
+    def test_rejects_requests_beyond_limit_of_all_workers(self):
+        thread = threading.Thread(target=simulate_get, args=(self.workers[0],))
+        thread.start()
+        assert self.resource.started.wait(timeout=5)
+
+        assert simulate_get(self.workers[1]) == falcon.HTTP_503
+
+        self.resource.finish.set()
+        thread.join()
+        assert simulate_get(self.workers[1]) == falcon.HTTP_200
+
+
+class TestAsyncConcurrencyLimitMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        settings = DEFAULT_SETTINGS.copy()
+        settings['concurrency_limit'] = True
+        self.limiter = AIMDLimiter(initial_limit=1)
+        self.app = AsyncApp(middleware=[AsyncConcurrencyLimitMiddleware(self.limiter, settings)])
+        self.app.add_route('/', AsyncOkResource())
+        self.app.add_route('/broken', AsyncBrokenResource())
+
+    def test_releases_after_response(self):
+        status, _, _ = simulate_asgi_request(self.app, 'GET', '/')
+
+        assert status == 200
+        assert self.limiter.in_flight == 0
+
+    def test_rejects_beyond_limit(self):
+        self.limiter.acquire()
+        status, headers, _ = simulate_asgi_request(self.app, 'GET', '/')
+
+        assert status == 503
+        assert headers['retry-after'] == '1'
+
+    def test_releases_after_unexpected_error(self):
+        for _ in range(2):
+            status, _, _ = simulate_asgi_request(self.app, 'GET', '/broken')
+            assert status == 500
+
+        assert self.limiter.in_flight == 0
+        status, _, _ = simulate_asgi_request(self.app, 'GET', '/')
+        assert status == 200
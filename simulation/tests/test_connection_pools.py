@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import time
+from unittest import TestCase, mock
+
+import pytest
+
+from simulation import connection_pools
+from simulation.connection_pools import PooledAdapter
+
+
+class TestPooledAdapter(TestCase):
+    def test_adapters_with_same_settings_share_pools(self):
+        assert PooledAdapter().poolmanager is PooledAdapter().poolmanager
+
+    def test_adapters_with_different_settings_do_not_share_pools(self):
+        assert PooledAdapter(maxsize=1).poolmanager is not PooledAdapter(maxsize=2).poolmanager
+
+    def test_close_leaves_shared_pools_open(self):
+        adapter = PooledAdapter(maxsize=3)
+        pool = adapter.get_connection('http://example.com/')
+        adapter.close()
+        assert PooledAdapter(maxsize=3).get_connection('http://example.com/') is pool
+
+    def test_closes_idle_connections(self):
+        adapter = PooledAdapter(maxsize=4, idle_timeout=60)
+        pool = adapter.get_connection('http://example.com/')
+        idle_conn, busy_conn = mock.Mock(), mock.Mock()
+        pool.pool.get()
+        pool.pool.get()
+        pool.pool.put(idle_conn)
+        pool.pool.put(busy_conn)
+        idle_conn.idle_since = time.monotonic() - 61
+        busy_conn.idle_since = time.monotonic()
+
+        adapter.get_connection('http://example.com/')
+        assert idle_conn.close.called
+        assert not busy_conn.close.called
+
+    def test_records_when_connections_become_idle(self):
+        pool = PooledAdapter(maxsize=6).get_connection('http://example.com/')
+        conn = mock.Mock()
+        pool.pool.get()
+        pool._put_conn(conn)
+        assert conn.idle_since == pytest.approx(time.monotonic(), abs=1)
+
+    @mock.patch.object(connection_pools.metrics, 'incr')
+    @mock.patch.object(connection_pools.metrics, 'gauge')
+    def test_reports_saturation(self, mock_gauge, mock_incr):
+        adapter = PooledAdapter(maxsize=2)
+        pool = adapter.get_connection('http://saturated.example.com/')
+        pool.pool.get()
+        pool.pool.get()
+
+        adapter.get_connection('http://saturated.example.com/')
+        mock_gauge.assert_called_with('connection_pool.in_use', 2,
+                                      tags={'host': 'saturated.example.com'})
+        mock_incr.assert_called_with('connection_pool.saturated',
+                                     tags={'host': 'saturated.example.com'})
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import time
+
+import falcon
+
+from falcon.testing import TestCase
+
+from simulation.deadlines import (
+    DEADLINE_HEADER,
+    DeadlineMiddleware,
+    deadline_from_header,
+    deadline_header,
+    earliest
+)
+
+
+class ContextResource:
+    def on_get(self, req, resp):
+        self.deadline = req.context['deadline']
+
+
+class TestDeadlineMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.api = falcon.API(middleware=[DeadlineMiddleware()])
+        self.resource = ContextResource()
+        self.api.add_route('/', self.resource)
+
+    def test_without_deadline(self):
+        resp = self.simulate_get('/')
+        assert resp.status_code == 200
+        assert self.resource.deadline is None
+
+    def test_reads_deadline(self):
+        before = time.monotonic()
+        resp = self.simulate_get('/', headers={DEADLINE_HEADER: '500'})
+        assert resp.status_code == 200
+        assert before + 0.4 < self.resource.deadline <= time.monotonic() + 0.5
+
+    def test_sheds_expired_requests(self):
+        resp = self.simulate_get('/', headers={DEADLINE_HEADER: '0'})
+        assert resp.status_code == 504
+        assert not hasattr(self.resource, 'deadline')
+
+    def test_ignores_invalid_deadline(self):
+        resp = self.simulate_get('/', headers={DEADLINE_HEADER: 'soon'})
+        assert resp.status_code == 200
+        assert self.resource.deadline is None
+
+
+class TestDeadlineHelpers(TestCase):
+    def test_header_round_trip(self):
+        deadline = time.monotonic() + 2
+        assert abs(deadline_from_header(deadline_header(deadline)) - deadline) < 0.01
+
+    def test_header_of_past_deadline(self):
+        assert deadline_header(time.monotonic() - 1) == '0'
+
+    def test_earliest(self):
+        assert earliest(None, 2, 1) == 1
+        assert earliest(None, None) is None
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from unittest import TestCase, mock
+
+import pytest
+
+from simulation.faults import FaultProfile, injected_delay, status_line
+
+from . import run
+
+
+class TestFaultProfileFromDict(TestCase):
+    def test_defaults(self):
+        profile = FaultProfile.from_dict({})
+
+        assert profile.delay() == 0
+        assert profile.error_status() is None
+        assert not profile.should_reset()
+        assert profile.slow_body is None
+
+    def test_round_trip(self):
+        profile = {
+            'latency': {'distribution': 'bimodal', 'fast': 0.01, 'slow': 1, 'slow_fraction': 0.1},
+            'error_rate': 0.1,
+            'error_statuses': [502, 503],
+            'reset_rate': 0.05,
+            'slow_body': {'chunk_size': 10, 'interval': 0.1}
+        }
+        assert FaultProfile.from_dict(profile).to_dict() == profile
+
+    def test_invalid_profiles(self):
+        invalid = [
+            [],
+            {'errors': 0.1},
+            {'latency': {'distribution': 'gamma'}},
+            {'latency': {'distribution': 'fixed'}},
+            {'latency': {'distribution': 'fixed', 'seconds': -1}},
+            {'latency': {'distribution': 'fixed', 'seconds': 1, 'sigma': 1}},
+            {'latency': {'distribution': 'uniform', 'min': 2, 'max': 1}},
+            {'latency': {'distribution': 'bimodal', 'fast': 0, 'slow': 1, 'slow_fraction': 2}},
+            {'error_rate': 1.5},
+            {'error_rate': '0.1'},
+            {'reset_rate': True},
+            {'error_statuses': [200]},
+            {'error_statuses': ['500']},
+            {'error_statuses': []},
+            {'slow_body': {'chunk_size': 0, 'interval': 1}},
+            {'slow_body': {'chunk_size': 10}},
+        ]
+
+        for profile in invalid:
+            with pytest.raises(ValueError):
+                FaultProfile.from_dict(profile)
+
+
+class TestFaultProfile(TestCase):
+    def setUp(self):
+        self.random = mock.Mock()
+
+    def profile(self, **kwargs):
+        return FaultProfile(random=self.random, **kwargs)
+
+    def test_fixed_latency(self):
+        assert self.profile(latency={'distribution': 'fixed', 'seconds': 2}).delay() == 2
+
+    def test_uniform_latency(self):
+        self.random.uniform.return_value = 1.5
+        profile = self.profile(latency={'distribution': 'uniform', 'min': 1, 'max': 2})
+
+        assert profile.delay() == 1.5
+        self.random.uniform.assert_called_with(1, 2)
+
+    def test_lognormal_latency(self):
+        self.random.lognormvariate.return_value = 0.2
+        profile = self.profile(latency={'distribution': 'lognormal', 'median': 1, 'sigma': 0.5})
+
+        assert profile.delay() == 0.2
+        self.random.lognormvariate.assert_called_with(0, 0.5)
+
+    def test_bimodal_latency(self):
+        profile = self.profile(latency={'distribution': 'bimodal', 'fast': 0.01, 'slow': 2,
+                                        'slow_fraction': 0.1})
+        self.random.random.return_value = 0.05
+        assert profile.delay() == 2
+        self.random.random.return_value = 0.5
+        assert profile.delay() == 0.01
+
+    def test_error_status(self):
+        profile = self.profile(error_rate=0.1, error_statuses=[503])
+        self.random.choice.side_effect = lambda statuses: statuses[0]
+        self.random.random.return_value = 0.05
+        assert profile.error_status() == 503
+        self.random.random.return_value = 0.5
+        assert profile.error_status() is None
+
+    def test_should_reset(self):
+        profile = self.profile(reset_rate=0.1)
+        self.random.random.return_value = 0.05
+        assert profile.should_reset()
+        self.random.random.return_value = 0.5
+        assert not profile.should_reset()
+
+    @mock.patch('time.sleep')
+    def test_drip(self, mock_sleep):
+        profile = self.profile(slow_body={'chunk_size': 4, 'interval': 0.5})
+
+        assert list(profile.drip(b'0123456789')) == [b'0123', b'4567', b'89']
+        assert mock_sleep.call_args_list == [mock.call(0.5)] * 3
+
+    def test_async_drip(self):
+        profile = self.profile(slow_body={'chunk_size': 4, 'interval': 0})
+
+        async def chunks():
+            return [chunk async for chunk in profile.async_drip(b'0123456789')]
+
+        assert run(chunks()) == [b'0123', b'4567', b'89']
+
+
+class FakeSnapshot:
+    def __init__(self, performance_problems=(), fault_profiles=None):
+        self.performance_problems = performance_problems
+        self.fault_profiles = fault_profiles or {}
+
+    def has_performance_problem(self, path):
+        return path in self.performance_problems
+
+    def fault_profile(self, path):
+        return self.fault_profiles.get(path)
+
+
+class TestInjectedDelay(TestCase):
+    def test_no_latency(self):
+        snapshot = FakeSnapshot(fault_profiles={'/recommendations': FaultProfile(error_rate=1)})
+        assert injected_delay(snapshot, '/recommendations') is None
+
+    @mock.patch('random.randint', return_value=7)
+    def test_performance_problem(self, mock_randint):
+        snapshot = FakeSnapshot(performance_problems={'/recommendations'})
+        assert injected_delay(snapshot, '/recommendations') == 7
+
+    @mock.patch('random.randint', return_value=7)
+    def test_adds_fault_profile_latency(self, mock_randint):
+        profile = FaultProfile(latency={'distribution': 'fixed', 'seconds': 0.5})
+        snapshot = FakeSnapshot(fault_profiles={'/recommendations': profile})
+        assert injected_delay(snapshot, '/recommendations') == 0.5
+
+        snapshot.performance_problems = {'/recommendations'}
+        assert injected_delay(snapshot, '/recommendations') == 7.5
+
+
+class TestStatusLine(TestCase):
+    def test_status_line(self):
+        assert status_line(503) == '503 Service Unavailable'
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from unittest import TestCase
+
+import requests
+
+from simulation.clients import AsyncRecommendationsClient, RecommendationsClient
+from simulation.harness import Harness, rewrite_url
+from simulation.redis_helpers import redis_client
+
+
+HEADERS = {'Authorization': 'Token 0x123'}
+
+
+class TestRewriteUrl(TestCase):
+    def test_replaces_host_and_port(self):
+        assert rewrite_url('http://recommendations:8002/recommendations', '127.0.0.1:5000') == \
+            'http://127.0.0.1:5000/recommendations'
+
+
+class TestHarness(TestCase):
+    def tearDown(self):
+        redis_client().flushdb()
+
+    def test_serves_the_homepage(self):
+        with Harness() as harness:
+            response = requests.get(harness.home_url, headers=HEADERS)
+
+        assert response.status_code == 200
+        assert set(response.json()) == {'recommendations', 'popular_items'}
+
+    def test_settings_reach_the_services(self):
+        with Harness() as harness:
+            response = requests.patch(harness.settings_url, headers=HEADERS,
+                                      json={'outages': ['/recommendations']})
+            assert response.status_code == 200
+
+            response = requests.get(harness.home_url, headers=HEADERS)
+
+        assert response.status_code == 200
+        assert response.json()['recommendations'] == []
+
+    def test_points_clients_at_the_services(self):
+        url = RecommendationsClient.url
+
+        with Harness() as harness:
+            port = harness.servers['recommendations'].server_port
+            assert RecommendationsClient.url == 'http://127.0.0.1:{}/recommendations'.format(port)
+            assert AsyncRecommendationsClient.url == RecommendationsClient.url
+
+        assert RecommendationsClient.url == url
+        assert AsyncRecommendationsClient.url == url
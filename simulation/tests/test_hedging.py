@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import threading
+from unittest import TestCase, mock
+
+import pytest
+
+from simulation import hedging
+from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.hedging import Hedger
+from . import FakeClock
+
+
+class TestHedger(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.hedger = Hedger(percentile=50, minimum_samples=10, window=60, clock=self.clock)
+        self.released = threading.Event()
+
+    def tearDown(self):
+        self.released.set()
+
+    def record(self, seconds, times=10):
+        for _ in range(times):
+            self.hedger.record(seconds)
+
+    def test_no_delay_without_enough_samples(self):
+        self.record(0.01, times=9)
+        assert self.hedger.delay() is None
+
+    def test_delay_is_percentile_latency(self):
+        self.record(0.01)
+        self.record(0.5)
+        assert self.hedger.delay() == pytest.approx(0.01, rel=0.01)
+
+    def test_uses_previous_window_until_current_fills(self):
+        self.record(0.01)
+        self.clock.now = 60
+        self.record(1, times=5)
+        assert self.hedger.delay() == pytest.approx(0.01, rel=0.01)
+
+        self.clock.now = 120
+        assert self.hedger.delay() is None
+
+    def test_reset_forgets_latencies(self):
+        self.record(0.01)
+        self.hedger.reset()
+        assert self.hedger.delay() is None
+
+    def test_fast_attempt_is_not_hedged(self):
+        attempt = mock.Mock(return_value='fast')
+        self.record(0.5)
+        assert self.hedger.call(attempt, '/fake') == 'fast'
+        assert attempt.call_count == 1
+
+    @mock.patch.object(hedging.metrics, 'incr')
+    def test_slow_attempt_is_hedged(self, mock_incr):
+        calls = []
+
+        def attempt():
+            calls.append(1)
+            if len(calls) == 1:
+                self.released.wait(timeout=5)
+                return 'slow'
+            return 'hedge'
+
+        self.record(0.01)
+        assert self.hedger.call(attempt, '/fake') == 'hedge'
+        mock_incr.assert_any_call('/fake.hedged')
+        mock_incr.assert_any_call('/fake.hedge_won')
+
+    def test_failed_hedge_waits_for_first_attempt(self):
+        calls = []
+
+        def attempt():
+            calls.append(1)
+            if len(calls) == 1:
+                self.released.wait(timeout=0.2)
+                return 'slow'
+            raise RuntimeError()
+
+        self.record(0.01)
+        assert self.hedger.call(attempt, '/fake') == 'slow'
+
+    def test_budget_limits_hedges(self):
+        self.hedger.budget = mock.Mock()
+        self.hedger.budget.withdraw.return_value = False
+        attempt = mock.Mock(side_effect=lambda: self.released.wait(timeout=0.05) or 'slow')
+
+        self.record(0.001)
+        assert self.hedger.call(attempt, '/fake') == 'slow'
+        assert attempt.call_count == 1
+
+    @mock.patch.object(hedging.metrics, 'incr')
+    def test_full_pool_makes_attempts_inline(self, mock_incr):
+        hedger = Hedger(percentile=50, minimum_samples=10, pool_size=2, clock=self.clock)
+        started = threading.Semaphore(0)
+
+        def slow_attempt():
+            started.release()
+            return self.released.wait(timeout=5)
+
+        slow = [threading.Thread(target=hedger.call, args=(slow_attempt, '/fake'))
+                for _ in range(2)]
+        for thread in slow:
+            thread.start()
+        for _ in slow:
+            assert started.acquire(timeout=5)
+
+        assert hedger.call(threading.current_thread, '/fake') is threading.current_thread()
+        mock_incr.assert_called_once_with('/fake.hedge_pool_full')
+
+        self.released.set()
+        for thread in slow:
+            thread.join()
+        assert hedger.call(threading.current_thread, '/fake') is not threading.current_thread()
+
+    @mock.patch.object(hedging.metrics, 'incr')
+    def test_full_pool_skips_hedge(self, mock_incr):
+        hedger = Hedger(percentile=50, minimum_samples=10, pool_size=1, clock=self.clock)
+        for _ in range(10):
+            hedger.record(0.001)
+
+        attempt = mock.Mock(side_effect=lambda: self.released.wait(timeout=0.05) or 'slow')
+        assert hedger.call(attempt, '/fake') == 'slow'
+        assert attempt.call_count == 1
+        mock_incr.assert_called_once_with('/fake.hedge_pool_full')
+
+    def test_apply_settings(self):
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(hedge_percentile='99', hedge_budget='0.05')
+        self.hedger.apply_settings(settings)
+        assert self.hedger.percentile == 99
+        assert self.hedger.budget.ratio == 0.05
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from unittest import TestCase
+
+from simulation.histogram import Histogram
+
+
+class TestHistogram(TestCase):
+    def test_empty_histogram(self):
+        histogram = Histogram()
+        assert histogram.count == 0
+        assert histogram.percentile(99) == 0
+        assert histogram.mean() == 0
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.record(value)
+
+        assert histogram.percentile(50) == 50
+        assert histogram.percentile(99) == 99
+        assert histogram.percentile(100) == 100
+
+    def test_large_values_are_within_precision(self):
+        histogram = Histogram(significant_figures=2)
+        for value in range(1000, 1000001, 1000):
+            histogram.record(value)
+
+        p99 = histogram.percentile(99)
+        assert abs(p99 - 990000) / 990000 < 0.01
+
+    def test_percentile_does_not_exceed_max(self):
+        histogram = Histogram()
+        histogram.record(123456)
+        assert histogram.percentile(99.9) == 123456
+
+    def test_values_above_highest_value_are_clamped(self):
+        histogram = Histogram(highest_value=1000)
+        histogram.record(5000)
+        assert histogram.max == 1000
+        assert histogram.percentile(50) == 1000
+
+    def test_tracks_count_min_max_and_mean(self):
+        histogram = Histogram()
+        for value in (10, 20, 30):
+            histogram.record(value)
+
+        assert histogram.count == 3
+        assert histogram.min == 10
+        assert histogram.max == 30
+        assert histogram.mean() == 20
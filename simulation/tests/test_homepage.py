@@ -1,10 +1,21 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 from falcon.testing import TestCase
 
-from simulation.homepage import HomepageResource
-from . import MockResponse
+from simulation import homepage
+from simulation.asgi import AsyncApp
+from simulation.async_api_client import AsyncApiClient, AsyncResponse
+from simulation.deadlines import DEADLINE_HEADER
+from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.homepage import AsyncHomepageResource, HomepageResource
+from simulation.response_cache import STALE_WARNING
+from . import MockResponse, simulate_asgi_request
 
 
 def mock_200_responses(*args, **kwargs):
@@ -28,3 +39,138 @@ class TestHomepage(TestCase):
         }
         assert 200 == resp.status_code
         assert expected_data == resp.json
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_responses)
+    def test_passes_deadline_on(self, mock_get):
+        req = mock.Mock(context={'deadline': time.monotonic() + 1})
+        HomepageResource().on_get(req, mock.Mock())
+
+        for call in mock_get.call_args_list:
+            assert 900 < int(call[1]['headers'][DEADLINE_HEADER]) <= 1000
+
+
+    @mock.patch('requests.Session.get')
+    def test_marks_stale_responses(self, mock_get):
+        def stale_recommendations(*args, **kwargs):
+            response = mock_200_responses(*args, **kwargs)
+            if args[0] == 'http://recommendations:8002/recommendations':
+                response.headers['Warning'] = STALE_WARNING
+            return response
+
+        mock_get.side_effect = stale_recommendations
+        resp = self.simulate_get('/home')
+        assert resp.headers['warning'] == STALE_WARNING
+        assert resp.json['recommendations'] == [1, 2, 3]
+
+    @mock.patch('requests.Session.get')
+    def test_ignores_error_responses(self, mock_get):
+        def unavailable_recommendations(*args, **kwargs):
+            if args[0] == 'http://recommendations:8002/recommendations':
+                return MockResponse({'title': 'Server overloaded'}, 503)
+            return mock_200_responses(*args, **kwargs)
+
+        mock_get.side_effect = unavailable_recommendations
+        resp = self.simulate_get('/home')
+        assert resp.json == {'recommendations': [], 'popular_items': [4, 5, 6]}
+
+class TestHomepageFanOut(TestCase):
+    def setUp(self):
+        super().setUp()
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(fan_out=True, deadline='0.1')
+        self.api.add_route('/home', HomepageResource(settings))
+        self.recommendations_released = threading.Event()
+
+    def tearDown(self):
+        self.recommendations_released.set()
+
+    @mock.patch('requests.Session.get', side_effect=mock_200_responses)
+    def test_get_returns_expected_data(self, mock_get):
+        resp = self.simulate_get('/home')
+        expected_data = {
+            'recommendations': [1, 2, 3],
+            'popular_items': [4, 5, 6]
+        }
+        assert 200 == resp.status_code
+        assert expected_data == resp.json
+
+    @mock.patch('requests.Session.get')
+    def test_deadline_returns_available_data(self, mock_get):
+        def slow_recommendations(*args, **kwargs):
+            if args[0] == 'http://recommendations:8002/recommendations':
+                self.recommendations_released.wait(timeout=5)
+            return mock_200_responses(*args, **kwargs)
+
+        mock_get.side_effect = slow_recommendations
+        resp = self.simulate_get('/home')
+        expected_data = {
+            'recommendations': [],
+            'popular_items': [4, 5, 6]
+        }
+        assert 200 == resp.status_code
+        assert expected_data == resp.json
+
+    @mock.patch('requests.Session.get')
+    def test_deadline_cancels_requests_waiting_for_a_thread(self, mock_get):
+        def slow_recommendations(*args, **kwargs):
+            self.recommendations_released.wait(timeout=5)
+            return mock_200_responses(*args, **kwargs)
+
+        mock_get.side_effect = slow_recommendations
+        executor = ThreadPoolExecutor(max_workers=1)
+        futures = []
+
+        def submit(*args, **kwargs):
+            futures.append(ThreadPoolExecutor.submit(executor, *args, **kwargs))
+            return futures[-1]
+
+        with mock.patch.object(executor, 'submit', side_effect=submit):
+            with mock.patch.object(homepage, 'executor', executor):
+                resp = self.simulate_get('/home')
+
+        assert resp.json == {'recommendations': [], 'popular_items': []}
+        assert [future.cancelled() for future in futures] == [False, True]
+        self.recommendations_released.set()
+        executor.shutdown()
+
+
+async def mock_async_200_responses(self, method, url, *args, **kwargs):
+    if url == 'http://recommendations:8002/recommendations':
+        return AsyncResponse(200, {}, b'[1, 2, 3]')
+    elif url == 'http://popular:8003/popular_items':
+        return AsyncResponse(200, {}, b'[4, 5, 6]')
+
+
+class TestAsyncHomepage(TestCase):
+    def setUp(self):
+        super().setUp()
+        settings = DEFAULT_SETTINGS.copy()
+        settings.update(deadline='0.1')
+        self.app = AsyncApp()
+        self.app.add_route('/home', AsyncHomepageResource(settings))
+
+    @mock.patch.object(AsyncApiClient, '_send', new=mock_async_200_responses)
+    def test_get_returns_expected_data(self):
+        status, _, body = simulate_asgi_request(self.app, 'GET', '/home')
+        expected_data = {
+            'recommendations': [1, 2, 3],
+            'popular_items': [4, 5, 6]
+        }
+        assert 200 == status
+        assert expected_data == json.loads(body.decode())
+
+    def test_deadline_returns_available_data(self):
+        async def slow_recommendations(client, method, url, *args, **kwargs):
+            if url == 'http://recommendations:8002/recommendations':
+                await asyncio.sleep(5)
+            return await mock_async_200_responses(client, method, url)
+
+        with mock.patch.object(AsyncApiClient, '_send', new=slow_recommendations):
+            status, _, body = simulate_asgi_request(self.app, 'GET', '/home')
+
+        expected_data = {
+            'recommendations': [],
+            'popular_items': [4, 5, 6]
+        }
+        assert 200 == status
+        assert expected_data == json.loads(body.decode())
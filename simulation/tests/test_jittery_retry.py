@@ -1,13 +1,19 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from unittest import TestCase
+import time
+from unittest import TestCase, mock
 
-from requests.packages.urllib3.exceptions import ProtocolError
+import pytest
 
-from simulation.jittery_retry import RetryWithFullJitter
+from requests.packages.urllib3.exceptions import MaxRetryError, ProtocolError
+
+from simulation.jittery_retry import RetryBudget, RetryWithFullJitter, reset_retry_count, retry_count
 
 
 class TestRetryWithFullJitter(TestCase):
+    def setUp(self):
+        # Forget any deadline left behind by an earlier request.
+        reset_retry_count()
 
     def _retry(self, retry, times, error):
         for _ in range(times):
@@ -33,3 +39,68 @@ class TestRetryWithFullJitter(TestCase):
 
         assert backoff1 != backoff2
 
+    def test_counts_retries(self):
+        reset_retry_count()
+        self._retry(RetryWithFullJitter(total=3), times=2, error=ProtocolError)
+        assert retry_count() == 2
+
+    def test_budget_limits_retries(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0, capacity=1)
+        retry = self._retry(RetryWithFullJitter(total=3, budget=budget),
+                            times=1, error=ProtocolError)
+
+        with pytest.raises(MaxRetryError):
+            retry.increment(error=ProtocolError())
+
+        budget.deposit()
+        budget.deposit()
+        retry.increment(error=ProtocolError())
+
+    def test_skips_retries_past_deadline(self):
+        retry = RetryWithFullJitter(total=3, backoff_factor=10, deadline=time.monotonic() + 1)
+        retry = retry.increment(error=ProtocolError())
+
+        with pytest.raises(MaxRetryError):
+            retry.increment(error=ProtocolError())
+
+    def test_uses_thread_deadline(self):
+        reset_retry_count(deadline=time.monotonic() - 1)
+
+        with pytest.raises(MaxRetryError):
+            RetryWithFullJitter(total=3).increment(error=ProtocolError())
+
+        reset_retry_count()
+
+
+class TestRetryBudget(TestCase):
+    def test_refills_at_min_rate(self):
+        clock = mock.Mock(return_value=0)
+        budget = RetryBudget(ratio=0.1, min_per_second=1, capacity=1, clock=clock)
+
+        assert budget.withdraw()
+        assert not budget.withdraw()
+
+        clock.return_value = 1
+        assert budget.withdraw()
+
+    def test_successes_add_tokens(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0, capacity=10)
+
+        for _ in range(10):
+            budget.withdraw()
+        assert not budget.withdraw()
+
+        budget.deposit()
+        budget.deposit()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+
+    def test_reset_fills_bucket(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0, capacity=2)
+        budget.withdraw()
+        budget.withdraw()
+
+        budget.reset()
+        assert budget.withdraw()
+        assert budget.withdraw()
+        assert not budget.withdraw()
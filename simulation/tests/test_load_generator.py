@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import aiohttp
+import pytest
+
+from simulation.load_generator import (
+    CLOSED_LOOP,
+    OPEN_LOOP,
+    LoadGenerator,
+    LoadResult,
+    main,
+    run_load_test,
+    summarize
+)
+
+
+def fake_send(delay=0, status=200, error=None):
+    calls = {'count': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    async def send(session):
+        calls['count'] += 1
+        calls['in_flight'] += 1
+        calls['max_in_flight'] = max(calls['max_in_flight'], calls['in_flight'])
+
+        try:
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return status
+        finally:
+            calls['in_flight'] -= 1
+
+    return send, calls
+
+
+class TestLoadGenerator(TestCase):
+    def run_test(self, send, **kwargs):
+        generator = LoadGenerator('http://example.com/', **kwargs)
+
+        with mock.patch.object(generator, '_send', side_effect=send):
+            return run_load_test(generator)
+
+    def test_closed_loop(self):
+        send, calls = fake_send(delay=0.01)
+        results = self.run_test(send, mode=CLOSED_LOOP, concurrency=3, duration=0.1)
+
+        assert calls['max_in_flight'] == 3
+        assert results['requests'] == calls['count']
+        assert results['statuses'] == {'200': calls['count']}
+        assert results['latency_ms']['p50'] >= 10
+
+    def test_open_loop_sends_at_rate(self):
+        send, calls = fake_send()
+        results = self.run_test(send, mode=OPEN_LOOP, rate=100, duration=0.2)
+
+        assert calls['count'] == 20
+        assert results['requests'] == 20
+
+    def test_open_loop_does_not_wait_for_slow_responses(self):
+        send, calls = fake_send(delay=0.2)
+        results = self.run_test(send, mode=OPEN_LOOP, rate=50, concurrency=2, duration=0.1)
+
+        assert calls['count'] == 5
+        assert calls['max_in_flight'] == 5
+        assert results['latency_ms']['p50'] >= 200
+
+    def test_open_loop_needs_rate(self):
+        with pytest.raises(ValueError):
+            LoadGenerator('http://example.com/', mode=OPEN_LOOP)
+
+    def test_warmup_is_not_recorded(self):
+        send, calls = fake_send()
+        results = self.run_test(send, mode=OPEN_LOOP, rate=100, warmup=0.1, duration=0.1)
+
+        assert calls['count'] == 20
+        assert results['requests'] == 10
+
+    def test_counts_errors(self):
+        send, _ = fake_send(error=asyncio.TimeoutError())
+        results = self.run_test(send, mode=OPEN_LOOP, rate=100, duration=0.05)
+        assert results['errors'] == {'timeout': 5}
+
+        send, _ = fake_send(error=aiohttp.ClientConnectionError())
+        results = self.run_test(send, mode=OPEN_LOOP, rate=100, duration=0.05)
+        assert results['errors'] == {'ClientConnectionError': 5}
+        assert results['statuses'] == {}
+
+    def test_sends_as_random_users(self):
+        generator = LoadGenerator('http://example.com/', users=3)
+        tokens = {generator._headers()['Authorization'] for _ in range(100)}
+
+        assert tokens == {'Token 0x0', 'Token 0x1', 'Token 0x2'}
+        assert LoadGenerator('http://example.com/')._headers() is None
+
+
+class TestLoadResult(TestCase):
+    def test_to_dict(self):
+        result = LoadResult()
+        result.duration = 2
+        result.record(0.010, status=200)
+        result.record(0.030, status=503)
+        result.record(1, error='timeout')
+        results = result.to_dict()
+
+        assert results['requests'] == 3
+        assert results['throughput'] == 1.5
+        assert results['statuses'] == {'200': 1, '503': 1}
+        assert results['errors'] == {'timeout': 1}
+        assert results['latency_ms']['p50'] == pytest.approx(30, rel=0.01)
+        assert results['latency_ms']['max'] == pytest.approx(1000, rel=0.01)
+        assert 'p999 1000.0' in summarize(results)
+
+
+class TestMain(TestCase):
+    @mock.patch('builtins.print')
+    def test_writes_results(self, mock_print):
+        send, _ = fake_send()
+        path = os.path.join(tempfile.mkdtemp(), 'results.json')
+
+        with mock.patch.object(LoadGenerator, '_send', side_effect=send):
+            main(['http://example.com/', '--mode', 'open', '--rate', '100', '--duration', '0.05',
+                  '--header', 'Authorization: Token 0x123', '--output', path])
+
+        with open(path) as output:
+            results = json.load(output)
+        assert results['mode'] == 'open'
+        assert results['statuses'] == {'200': 5}
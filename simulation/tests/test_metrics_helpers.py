@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+from unittest import TestCase, mock
+
+from simulation.metrics_helpers import MAX_PACKET_SIZE, MAX_TIMER_SAMPLES, StatsClient
+
+
+class TestStatsClient(TestCase):
+    def setUp(self):
+        self.client = StatsClient(testing=True)
+
+    def test_sums_counters(self):
+        self.client.incr('homepage.get')
+        self.client.incr('homepage.get', 2)
+        assert self.client._drain() == ['homepage.get:3|c']
+
+    def test_keeps_last_gauge_value(self):
+        self.client.gauge('pool.in_use', 1)
+        self.client.gauge('pool.in_use', 4)
+        assert self.client._drain() == ['pool.in_use:4|g']
+
+    def test_keeps_every_timer_sample(self):
+        self.client.timing('recommendations.latency', 12)
+        self.client.timing('recommendations.latency', 1.5)
+        assert self.client._drain() == ['recommendations.latency:12|ms',
+                                        'recommendations.latency:1.5|ms']
+
+    def test_limits_timer_samples(self):
+        for _ in range(MAX_TIMER_SAMPLES + 1):
+            self.client.timing('recommendations.latency', 12)
+        assert len(self.client._drain()) == MAX_TIMER_SAMPLES
+
+    def test_reports_histogram_percentiles(self):
+        for milliseconds in range(1, 101):
+            self.client.histogram('api_latency', milliseconds, tags={'path': '/recommendations'})
+
+        values = {}
+        for line in self.client._drain():
+            name, value = line.split(':')
+            values[name] = float(value.split('|')[0])
+
+        tags = ',path=/recommendations,pid={}'.format(os.getpid())
+        assert values['api_latency.count' + tags] == 100
+        assert values['api_latency.max' + tags] == 100
+        assert abs(values['api_latency.p50' + tags] - 50) < 0.5
+        assert abs(values['api_latency.p99' + tags] - 99) < 1
+
+    def test_reports_histograms_by_tags(self):
+        self.client.histogram('api_latency', 1, tags={'outcome': 'success'})
+        self.client.histogram('api_latency', 1000, tags={'outcome': 'timeout'})
+        lines = self.client._drain()
+
+        assert 'api_latency.max,outcome=success,pid={}:1|g'.format(os.getpid()) in lines
+        assert 'api_latency.max,outcome=timeout,pid={}:1000|g'.format(os.getpid()) in lines
+
+    @mock.patch('os.getpid')
+    def test_reports_histograms_by_process(self, mock_getpid):
+        for pid in (7, 8):
+            mock_getpid.return_value = pid
+            self.client.histogram('api_latency', pid)
+        lines = self.client._drain()
+
+        assert 'api_latency.max,pid=7:7|g' in lines
+        assert 'api_latency.max,pid=8:8|g' in lines
+
+    def test_drain_empties_buffer(self):
+        self.client.incr('homepage.get')
+        self.client._drain()
+        assert self.client._drain() == []
+
+    def test_packs_lines_into_packets(self):
+        lines = ['homepage.get.{}:1|c'.format(i) for i in range(500)]
+        packets = list(self.client._packets(lines))
+
+        assert len(packets) > 1
+        assert all(len(packet) <= MAX_PACKET_SIZE for packet in packets)
+        assert b'\n'.join(packets).decode().split('\n') == lines
+
+    @mock.patch('socket.socket')
+    def test_flush_does_not_send_when_testing(self, mock_socket):
+        self.client.incr('homepage.get')
+        self.client.flush()
+        assert not mock_socket.called
+
+    @mock.patch('socket.socket')
+    @mock.patch.object(StatsClient, '_ensure_flusher')
+    def test_flush_sends_buffered_metrics(self, mock_ensure_flusher, mock_socket):
+        client = StatsClient(testing=False, host='localhost')
+        client.incr('homepage.get')
+        client.gauge('pool.in_use', 2)
+        client.flush()
+
+        sock = mock_socket.return_value
+        sock.connect.assert_called_with(('localhost', 8125))
+        sock.send.assert_called_once_with(b'homepage.get:1|c\npool.in_use:2|g')
@@ -1,16 +1,25 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import asyncio
+import json
+import time
 from unittest import mock
 import falcon
 
 from falcon.testing import TestCase, SimpleTestResource
 from requests.exceptions import Timeout
 
-from simulation.middleware import FuzzingMiddleware, PermissionsMiddleware, auth_client
+from simulation.asgi import AsyncApp
+from simulation.async_api_client import AsyncResponse
+from simulation.deadlines import DEADLINE_HEADER, DeadlineMiddleware
+from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.middleware import (AsyncFuzzingMiddleware, AsyncPermissionsMiddleware,
+                                   FuzzingMiddleware, PermissionsMiddleware, async_auth_client,
+                                   auth_client)
 from simulation.redis_helpers import redis_client
-from simulation.settings import PERFORMANCE_PROBLEMS_KEY
+from simulation.settings import FAULT_PROFILES_KEY, PERFORMANCE_PROBLEMS_KEY
 
-from . import MockResponse
+from . import MockResponse, run, simulate_asgi_request
 
 
 redis = redis_client()
@@ -37,6 +46,99 @@ class TestFuzzingMiddleware(TestCase):
         self.simulate_get(self.url)
         assert mock_sleep.called
 
+    def test_delay_stops_at_deadline(self):
+        self.api = falcon.API(middleware=[DeadlineMiddleware(), FuzzingMiddleware()])
+        self.api.add_route(self.url, SimpleTestResource())
+        redis.sadd(PERFORMANCE_PROBLEMS_KEY, '/recommendations')
+
+        start = time.monotonic()
+        resp = self.simulate_get(self.url, headers={DEADLINE_HEADER: '50'})
+
+        assert time.monotonic() - start < 1
+        assert resp.status_code == 504
+
+    @mock.patch('time.sleep')
+    def test_non_blocking_latency_is_left_to_clients(self, mock_sleep):
+        settings = DEFAULT_SETTINGS.copy()
+        settings['latency_injection'] = 'non_blocking'
+        self.api = falcon.API(middleware=[FuzzingMiddleware(settings)])
+        self.api.add_route(self.url, SimpleTestResource())
+        redis.sadd(PERFORMANCE_PROBLEMS_KEY, '/recommendations')
+
+        resp = self.simulate_get(self.url)
+
+        assert resp.status_code == 200
+        assert not mock_sleep.called
+
+    @mock.patch('time.sleep')
+    def test_fault_profile_latency(self, mock_sleep):
+        set_fault_profile('/recommendations', {'latency': {'distribution': 'fixed', 'seconds': 2}})
+        resp = self.simulate_get(self.url)
+
+        assert resp.status_code == 200
+        mock_sleep.assert_called_once_with(2)
+
+    def test_fault_profile_latency_stops_at_deadline(self):
+        self.api = falcon.API(middleware=[DeadlineMiddleware(), FuzzingMiddleware()])
+        self.api.add_route(self.url, SimpleTestResource())
+        set_fault_profile('/recommendations', {'latency': {'distribution': 'fixed', 'seconds': 5}})
+
+        start = time.monotonic()
+        resp = self.simulate_get(self.url, headers={DEADLINE_HEADER: '50'})
+
+        assert time.monotonic() - start < 1
+        assert resp.status_code == 504
+
+    def test_fault_profile_errors(self):
+        set_fault_profile('/recommendations', {'error_rate': 1, 'error_statuses': [503]})
+        resp = self.simulate_get(self.url)
+        assert resp.status_code == 503
+
+    @mock.patch('time.sleep')
+    def test_fault_profile_slow_body(self, mock_sleep):
+        self.api.add_route('/popular_items', SimpleTestResource(body='0123456789'))
+        set_fault_profile('/popular_items', {'slow_body': {'chunk_size': 4, 'interval': 0.1}})
+        resp = self.simulate_get('/popular_items')
+
+        assert resp.content == b'0123456789'
+        assert resp.headers['content-length'] == '10'
+        assert mock_sleep.call_count == 3
+
+
+def set_fault_profile(path, profile):
+    redis.hset(FAULT_PROFILES_KEY, path, json.dumps(profile))
+
+
+class SlowEchoResource:
+    async def on_get(self, req, resp):
+        resp.data = b'0123456789'
+
+
+class TestAsyncFuzzingMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = AsyncApp(middleware=[AsyncFuzzingMiddleware()])
+        self.app.add_route('/recommendations', SlowEchoResource())
+        redis.flushdb()
+
+    def test_fault_profile_errors(self):
+        set_fault_profile('/recommendations', {'error_rate': 1, 'error_statuses': [502]})
+        status, _, _ = simulate_asgi_request(self.app, 'GET', '/recommendations')
+        assert status == 502
+
+    def test_fault_profile_slow_body(self):
+        set_fault_profile('/recommendations', {
+            'latency': {'distribution': 'fixed', 'seconds': 0.01},
+            'slow_body': {'chunk_size': 4, 'interval': 0.01}
+        })
+        start = time.monotonic()
+        status, headers, body = simulate_asgi_request(self.app, 'GET', '/recommendations')
+
+        assert time.monotonic() - start >= 0.04
+        assert status == 200
+        assert headers['content-length'] == '10'
+        assert body == b'0123456789'
+
 
 def mock_timeout_response(*args, **kwargs):
     raise Timeout()
@@ -93,3 +195,126 @@ class TestPermissionMiddleware(TestCase):
         resp = self.simulate_get('/', headers={'Authorization': '1234'})
         expected_status_code = 200
         assert resp.status_code == expected_status_code
+
+    @mock.patch('requests.Session.post', side_effect=mock_correct_permission_response)
+    def test_caches_user_details(self, mock_post):
+        self.simulate_get('/', headers={'Authorization': '1234'})
+        resp = self.simulate_get('/', headers={'Authorization': '1234'})
+        assert resp.status_code == 200
+        assert mock_post.call_count == 1
+
+    @mock.patch('requests.Session.post', side_effect=mock_401_response)
+    def test_does_not_cache_401_by_default(self, mock_post):
+        self.simulate_get('/', headers={'Authorization': '1234'})
+        resp = self.simulate_get('/', headers={'Authorization': '1234'})
+        assert resp.status_code == 401
+        assert mock_post.call_count == 2
+
+    @mock.patch('requests.Session.post', side_effect=mock_timeout_response)
+    def test_does_not_cache_failed_auth_request(self, mock_post):
+        self.simulate_get('/', headers={'Authorization': '1234'})
+        self.simulate_get('/', headers={'Authorization': '1234'})
+        assert mock_post.call_count == 2
+
+
+class TestPermissionMiddlewareNegativeCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.api = falcon.API(middleware=[
+            PermissionsMiddleware('can_have_pancakes', negative_cache_ttl=10)
+        ])
+        self.api.add_route('/', SimpleTestResource())
+
+    def tearDown(self):
+        auth_client.circuit_breaker.close()
+
+    @mock.patch('requests.Session.post', side_effect=mock_401_response)
+    def test_caches_401(self, mock_post):
+        self.simulate_get('/', headers={'Authorization': '1234'})
+        resp = self.simulate_get('/', headers={'Authorization': '1234'})
+        assert resp.status_code == 401
+        assert mock_post.call_count == 1
+
+
+def mock_can_do_stuff_response(*args, **kwargs):
+    return MockResponse({'permissions': ['can_do_stuff']}, 200)
+
+
+def async_response(mock_response):
+    async def post(*args, **kwargs):
+        return mock_response(*args, **kwargs)
+    return post
+
+
+class AsyncTestResource:
+    async def on_get(self, req, resp):
+        resp.body = '{}'
+
+
+class TestAsyncPermissionMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = AsyncApp(middleware=[
+            AsyncPermissionsMiddleware('can_do_stuff')
+        ])
+        self.url = '/stuff'
+        self.app.add_route(self.url, AsyncTestResource())
+
+    def get(self):
+        status, _, _ = simulate_asgi_request(self.app, 'GET', self.url,
+                                             headers={'Authorization': 'Token 1234'})
+        return status
+
+    def test_requires_auth_token(self):
+        status, _, _ = simulate_asgi_request(self.app, 'GET', self.url)
+        assert status == 401
+
+    @mock.patch.object(async_auth_client, 'post', side_effect=async_response(mock_401_response))
+    def test_auth_returned_401(self, mock_post):
+        assert self.get() == 401
+
+    @mock.patch.object(async_auth_client, 'post', side_effect=async_response(
+        lambda **kwargs: AsyncResponse(401, {}, b'{"title": "Auth token required"}')))
+    def test_auth_returned_real_401(self, mock_post):
+        assert self.get() == 401
+
+    @mock.patch.object(async_auth_client, 'post', side_effect=async_response(
+        lambda **kwargs: AsyncResponse(500, {}, b'{"title": "Server error"}')))
+    def test_auth_server_error(self, mock_post):
+        assert self.get() == 500
+        assert self.get() == 500
+        assert mock_post.call_count == 2
+
+    @mock.patch.object(async_auth_client, 'post', side_effect=async_response(mock_can_do_stuff_response))
+    def test_has_correct_permission(self, mock_post):
+        assert self.get() == 200
+
+    @mock.patch.object(async_auth_client, 'post', side_effect=async_response(mock_can_do_stuff_response))
+    def test_caches_user_details(self, mock_post):
+        assert self.get() == 200
+        assert self.get() == 200
+        assert mock_post.call_count == 1
+
+    def test_concurrent_requests_share_auth_request(self):
+        calls = []
+        middleware = self.app._middleware[0]
+
+        async def slow_post(**kwargs):
+            calls.append(kwargs)
+            await asyncio.sleep(0.01)
+            return mock_can_do_stuff_response()
+
+        async def authorize():
+            req = mock.Mock(context={})
+            req.get_header.return_value = 'Token 1234'
+            await middleware.process_request(req, None)
+            return req.context['user_details']
+
+        async def authorize_concurrently():
+            return await asyncio.gather(*[authorize() for _ in range(5)])
+
+        with mock.patch.object(async_auth_client, 'post', new=slow_post):
+            results = run(authorize_concurrently())
+
+        assert len(calls) == 1
+        assert len(results) == 5
@@ -1,21 +1,60 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import json
 from unittest import mock
 
 from falcon.testing import TestCase
+from redis.exceptions import ConnectionError
 
-from simulation.popular_items import PopularItemsResource
-from simulation.tests import mock_200_response
+from simulation.popular_items import POPULAR_ITEMS_KEY, PopularItemsResource
+from simulation.redis_helpers import redis_client
+from simulation.tests import FakeClock, mock_200_response
 
 
 class TestPopularItems(TestCase):
 
     def setUp(self):
         super().setUp()
-        self.api.add_route('/popular_items', PopularItemsResource())
+        redis_client().flushdb()
+        self.clock = FakeClock()
+        self.resource = PopularItemsResource(refresh_interval=60, clock=self.clock)
+        self.api.add_route('/popular_items', self.resource)
 
     @mock.patch('requests.Session.post', side_effect=mock_200_response)
     def test_get_returns_expected_data(self, mock_post):
         resp = self.simulate_get('/popular_items')
         assert 200 == resp.status_code
         assert [1, 2, 3, 4, 5, 6, 7, 8 , 9, 10] == resp.json
+
+    def test_can_be_cached(self):
+        resp = self.simulate_get('/popular_items')
+        assert resp.headers['etag'].startswith('"')
+        assert resp.headers['cache-control'] == 'public, max-age=60'
+
+    def test_not_modified(self):
+        etag = self.simulate_get('/popular_items').headers['etag']
+        resp = self.simulate_get('/popular_items', headers={'If-None-Match': etag})
+
+        assert resp.status_code == 304
+        assert resp.content == b''
+        assert resp.headers['etag'] == etag
+
+    def test_reads_items_once_per_refresh_interval(self):
+        etag = self.simulate_get('/popular_items').headers['etag']
+        redis_client().set(POPULAR_ITEMS_KEY, json.dumps([3, 2, 1]))
+        assert self.simulate_get('/popular_items').headers['etag'] == etag
+
+        self.clock.now = 60
+        resp = self.simulate_get('/popular_items', headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.json == [3, 2, 1]
+        assert resp.headers['etag'] != etag
+
+    def test_keeps_items_without_redis(self):
+        redis_client().set(POPULAR_ITEMS_KEY, json.dumps([3, 2, 1]))
+        self.simulate_get('/popular_items')
+        self.clock.now = 60
+
+        with mock.patch.object(self.resource._redis, 'get', side_effect=ConnectionError):
+            resp = self.simulate_get('/popular_items')
+        assert resp.json == [3, 2, 1]
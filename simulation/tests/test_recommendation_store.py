@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import io
+import threading
+from unittest import TestCase, mock
+
+from redis.exceptions import ConnectionError
+
+from simulation.users import user_token, user_uuid
+from simulation.recommendation_store import (
+    DEFAULT_RECOMMENDATIONS,
+    RECOMMENDATIONS_KEY,
+    RecommendationStore,
+    main,
+    pack,
+    read_recommendations,
+    unpack
+)
+from simulation.redis_helpers import redis_client
+from . import run
+
+
+class TestRecommendationStore(TestCase):
+    def setUp(self):
+        self.redis = redis_client(decode_responses=False)
+        self.redis.flushdb()
+        self.store = RecommendationStore(self.redis, cache_size=10)
+
+    def test_pack_round_trip(self):
+        data = pack([1, 2, 3000000])
+        assert len(data) == 12
+        assert unpack(data) == [1, 2, 3000000]
+
+    def test_load_and_get(self):
+        count = self.store.load([('a', [1, 2]), ('b', [3, 4]), ('c', [5])], batch_size=2)
+
+        assert count == 3
+        assert self.redis.get(RECOMMENDATIONS_KEY.format('b')) == pack([3, 4])
+        assert self.store.get('a') == [1, 2]
+        assert self.store.get_many(['b', 'c']) == {'b': [3, 4], 'c': [5]}
+
+    def test_unknown_users_get_defaults(self):
+        assert self.store.get('unknown') == DEFAULT_RECOMMENDATIONS
+
+    def test_get_many_uses_one_round_trip(self):
+        self.store.load([('a', [1]), ('b', [2])])
+        self.store.get('a')
+
+        with mock.patch.object(self.redis, 'mget', wraps=self.redis.mget) as mock_mget:
+            assert self.store.get_many(['a', 'b', 'c']) == {
+                'a': [1], 'b': [2], 'c': DEFAULT_RECOMMENDATIONS}
+
+        mock_mget.assert_called_once_with([RECOMMENDATIONS_KEY.format('b'),
+                                           RECOMMENDATIONS_KEY.format('c')])
+
+    def test_get_many_async_reads_redis_off_the_event_loop(self):
+        self.store.load([('a', [1]), ('b', [2])])
+        self.store.get('a')
+        threads = []
+
+        def fetch(user_uuids):
+            threads.append(threading.current_thread())
+            return {user_uuid: [2] for user_uuid in user_uuids}
+
+        with mock.patch.object(self.store, '_fetch', side_effect=fetch) as mock_fetch:
+            assert run(self.store.get_many_async(['a', 'b'])) == {'a': [1], 'b': [2]}
+            assert run(self.store.get_async('a')) == [1]
+
+        mock_fetch.assert_called_once_with(['b'])
+        assert threads[0] is not threading.current_thread()
+
+    def test_caches_lookups(self):
+        self.store.load([('a', [1])])
+        self.store.get('a')
+
+        with mock.patch.object(self.redis, 'mget') as mock_mget:
+            assert self.store.get('a') == [1]
+        assert not mock_mget.called
+
+    def test_load_clears_cache(self):
+        self.store.get('a')
+        self.store.load([('a', [1])])
+        assert self.store.get('a') == [1]
+
+    def test_defaults_without_redis(self):
+        with mock.patch.object(self.redis, 'mget', side_effect=ConnectionError):
+            assert self.store.get('a') == DEFAULT_RECOMMENDATIONS
+
+        self.store.load([('a', [1])])
+        assert self.store.get('a') == [1]
+
+    def test_read_recommendations(self):
+        lines = io.StringIO('{"uuid": "a", "items": [1, 2]}\n\n{"uuid": "b", "items": [3]}\n')
+        assert list(read_recommendations(lines)) == [('a', [1, 2]), ('b', [3])]
+
+    @mock.patch('builtins.print')
+    def test_main_loads_random_users(self, mock_print):
+        main(['--users', '5'])
+        assert len(self.redis.keys(RECOMMENDATIONS_KEY.format('*'))) == 5
+
+    @mock.patch('builtins.print')
+    def test_random_users_have_tokens(self, mock_print):
+        main(['--users', '5'])
+        assert self.store.get(user_uuid(user_token(4))) != DEFAULT_RECOMMENDATIONS
@@ -1,14 +1,25 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import json
 import uuid
 from unittest import mock
 
 import falcon
 from falcon.testing import TestCase
 
-from simulation.recommendations import RecommendationsResource
+from simulation.asgi import AsyncApp
+from simulation.recommendation_store import DEFAULT_RECOMMENDATIONS, RecommendationStore
+from simulation.recommendations import (
+    MAX_BATCH_SIZE,
+    AsyncRecommendationsBatchResource,
+    AsyncRecommendationsResource,
+    RecommendationsBatchResource,
+    RecommendationsResource
+)
+from simulation.redis_helpers import redis_client
 from simulation.tests import (
-    mock_200_response
+    mock_200_response,
+    simulate_asgi_request
 )
 
 
@@ -32,10 +43,56 @@ class TestRecommendations(TestCase):
         self.api = falcon.API(middleware=[
             MockPermissionsMiddleware()
         ])
-        self.api.add_route('/recommendations', RecommendationsResource())
+        redis_client().flushdb()
+        self.store = RecommendationStore()
+        self.api.add_route('/recommendations', RecommendationsResource(self.store))
+        self.api.add_route('/recommendations/batch', RecommendationsBatchResource(self.store))
 
     @mock.patch('requests.Session.post', side_effect=mock_200_response)
     def test_get_returns_expected_data(self, mock_post):
         resp = self.simulate_get('/recommendations')
         assert resp.status_code == 200
         assert resp.json == [12, 23, 100, 122, 220, 333, 340, 400, 555, 654]
+
+    def test_batch_returns_recommendations_for_each_user(self):
+        self.store.load([('a', [1, 2])])
+        resp = self.simulate_post('/recommendations/batch', body=json.dumps({'uuids': ['a', 'b']}))
+
+        assert resp.status_code == 200
+        assert resp.json == {'a': [1, 2], 'b': DEFAULT_RECOMMENDATIONS}
+
+    def test_batch_rejects_invalid_body(self):
+        for body in ('not json', '{}', '{"uuids": "a"}', '{"uuids": [1]}'):
+            assert self.simulate_post('/recommendations/batch', body=body).status_code == 400
+
+    def test_batch_size_is_limited(self):
+        uuids = [str(n) for n in range(MAX_BATCH_SIZE + 1)]
+        resp = self.simulate_post('/recommendations/batch', body=json.dumps({'uuids': uuids}))
+        assert resp.status_code == 400
+
+
+class AsyncMockPermissionsMiddleware(MockPermissionsMiddleware):
+    async def process_request(self, req, resp):
+        super().process_request(req, resp)
+
+
+class TestAsyncRecommendations(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = AsyncApp(middleware=[AsyncMockPermissionsMiddleware()])
+        redis_client().flushdb()
+        self.store = RecommendationStore()
+        self.store.load([('a', [1, 2])])
+        self.app.add_route('/recommendations', AsyncRecommendationsResource(self.store))
+        self.app.add_route('/recommendations/batch', AsyncRecommendationsBatchResource(self.store))
+
+    def test_get_returns_recommendations(self):
+        status, _, body = simulate_asgi_request(self.app, 'GET', '/recommendations')
+        assert status == 200
+        assert json.loads(body.decode()) == DEFAULT_RECOMMENDATIONS
+
+    def test_batch_returns_recommendations_for_each_user(self):
+        status, _, body = simulate_asgi_request(self.app, 'POST', '/recommendations/batch',
+                                                body=json.dumps({'uuids': ['a', 'b']}).encode())
+        assert status == 200
+        assert json.loads(body.decode()) == {'a': [1, 2], 'b': DEFAULT_RECOMMENDATIONS}
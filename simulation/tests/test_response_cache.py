@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from unittest import TestCase
+
+from simulation.response_cache import FRESH, STALE, ResponseCache, is_stale, mark_stale, max_age
+from . import FakeClock, MockResponse
+
+
+class TestResponseCache(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResponseCache(fresh_ttl=10, stale_ttl=20, vary=('Authorization',),
+                                   maxsize=2, clock=self.clock)
+        self.response = MockResponse([1, 2, 3], 200)
+
+    def test_fresh_then_stale_then_gone(self):
+        self.cache.store('key', self.response)
+        assert self.cache.lookup('key') == (self.response, FRESH)
+
+        self.clock.now = 10
+        assert self.cache.lookup('key') == (self.response, STALE)
+
+        self.clock.now = 30
+        assert self.cache.lookup('key') == (None, None)
+
+    def test_key_varies_on_headers(self):
+        key = self.cache.key('http://example.com', {'authorization': '1'})
+
+        assert key == self.cache.key('http://example.com', {'Authorization': '1', 'X-Other': '1'})
+        assert key != self.cache.key('http://example.com', {'Authorization': '2'})
+        assert key != self.cache.key('http://example.com')
+
+    def test_bounded_size(self):
+        for key in range(3):
+            self.cache.store(key, self.response)
+
+        assert self.cache.lookup(0) == (None, None)
+        assert self.cache.lookup(2) == (self.response, FRESH)
+
+    def test_one_revalidation_at_a_time(self):
+        assert self.cache.start_revalidation('key')
+        assert not self.cache.start_revalidation('key')
+
+        self.cache.finish_revalidation('key')
+        assert self.cache.start_revalidation('key')
+
+    def test_mark_stale_copies_response(self):
+        stale = mark_stale(self.response)
+
+        assert is_stale(stale)
+        assert stale.json() == [1, 2, 3]
+        assert not is_stale(self.response)
+
+    def test_store_with_fresh_ttl(self):
+        self.cache.store('key', self.response, fresh_ttl=60)
+
+        self.clock.now = 59
+        assert self.cache.lookup('key') == (self.response, FRESH)
+        self.clock.now = 79
+        assert self.cache.lookup('key') == (self.response, STALE)
+
+    def test_max_age(self):
+        assert max_age(MockResponse([], 200, {'Cache-Control': 'public, max-age=60'})) == 60
+        assert max_age(MockResponse([], 200, {'Cache-Control': 'max-age=soon'})) is None
+        assert max_age(self.response) is None
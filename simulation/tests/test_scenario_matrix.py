@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from simulation import scenario_matrix
+from simulation.scenario_matrix import (
+    RESILIENCE,
+    cells,
+    compare,
+    error_rate,
+    format_table,
+    load_results,
+    save_results,
+    summarize_cell
+)
+
+
+def load_results_dict(p99=100, statuses=None, errors=None):
+    statuses = {'200': 100} if statuses is None else statuses
+    errors = errors or {}
+    return {
+        'requests': sum(statuses.values()) + sum(errors.values()),
+        'throughput': 10.0,
+        'latency_ms': {'p50': 10, 'p95': 50, 'p99': p99, 'p999': p99, 'mean': 20, 'max': p99},
+        'statuses': statuses,
+        'errors': errors
+    }
+
+
+class TestCells(TestCase):
+    def test_every_combination(self):
+        matrix = list(cells())
+
+        assert len(matrix) == len(scenario_matrix.SCENARIOS) * len(RESILIENCE)
+        assert matrix[0] == ('ideal/none', 'ideal', {})
+        assert ('outage/retries', 'outage', RESILIENCE['retries']) in matrix
+
+    def test_selected(self):
+        assert [name for name, _, _ in cells(['outage'], ['timeouts', 'retries'])] == [
+            'outage/timeouts', 'outage/retries']
+
+    def test_options_are_copies(self):
+        _, _, options = next(cells(['outage'], ['timeouts']))
+        options['timeout'] = 5
+        assert RESILIENCE['timeouts'] == {'timeout': 1}
+
+    def test_unknown_resilience(self):
+        with pytest.raises(ValueError):
+            list(cells(['outage'], ['magic']))
+
+
+class TestErrorRate(TestCase):
+    def test_counts_server_errors_and_failed_requests(self):
+        results = load_results_dict(statuses={'200': 7, '404': 1, '503': 1}, errors={'timeout': 1})
+        assert error_rate(results) == 0.2
+
+    def test_no_requests(self):
+        assert error_rate(load_results_dict(statuses={})) == 0
+
+
+class TestCompare(TestCase):
+    def setUp(self):
+        self.baseline = {'outage/none': summarize_cell(load_results_dict(p99=100))}
+
+    def test_no_regressions(self):
+        results = {'outage/none': summarize_cell(load_results_dict(p99=110))}
+        assert compare(results, self.baseline) == []
+
+    def test_p99_regression(self):
+        results = {'outage/none': summarize_cell(load_results_dict(p99=150))}
+        assert compare(results, self.baseline) == [
+            'outage/none: p99 rose from 100.0ms to 150.0ms']
+        assert compare(results, self.baseline, max_p99_regression=0.5) == []
+
+    def test_error_rate_regression(self):
+        results = {'outage/none': summarize_cell(
+            load_results_dict(statuses={'200': 95, '500': 5}))}
+        assert compare(results, self.baseline) == [
+            'outage/none: error rate rose from 0.00% to 5.00%']
+        assert compare(results, self.baseline, max_error_rate_regression=0.05) == []
+
+    def test_ignores_cells_missing_from_the_baseline(self):
+        results = {'outage/retries': summarize_cell(load_results_dict(p99=1000))}
+        assert compare(results, self.baseline) == []
+
+
+class TestResultsFile(TestCase):
+    def test_save_and_load(self):
+        path = os.path.join(tempfile.mkdtemp(), 'results.json')
+        results = {'ideal/none': summarize_cell(load_results_dict())}
+        save_results(path, results, {'duration': 10})
+
+        assert load_results(path) == results
+
+    def test_format_table(self):
+        table = format_table({'ideal/none': summarize_cell(load_results_dict())})
+        header, row = table.split('\n')
+
+        assert header.split() == ['cell', 'req/s', 'p50', 'p95', 'p99', 'p999', 'errors']
+        assert row.split() == ['ideal/none', '10.0', '10.0', '50.0', '100.0', '100.0', '0.00%']
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+from unittest import TestCase, mock
+
+import pytest
+
+from simulation import serializers
+
+
+class TestSerializers(TestCase):
+    def setUp(self):
+        self.backend = serializers.backend
+
+    def tearDown(self):
+        serializers.use_backend(self.backend)
+
+    def test_round_trip(self):
+        for backend in serializers.BACKENDS:
+            serializers.use_backend(backend)
+            data = serializers.dumps({'items': [1, 2, 3]})
+
+            assert isinstance(data, bytes)
+            assert serializers.loads(data) == {'items': [1, 2, 3]}
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            serializers.use_backend('pickle')
+
+    def test_write_json(self):
+        resp = mock.Mock()
+        serializers.write_json(resp, [1, 2, 3])
+        assert json.loads(resp.data.decode('utf-8')) == [1, 2, 3]
+
+    def test_splice(self):
+        data = serializers.splice({'recommendations': b'[1, 2]', 'popular_items': b'[]'})
+        assert json.loads(data.decode('utf-8')) == {'recommendations': [1, 2], 'popular_items': []}
@@ -5,7 +5,12 @@ from unittest import mock
 import json
 from falcon.testing import TestCase
 
-from simulation.settings import SettingsResource
+from simulation.settings import (
+    FAULT_PROFILES_KEY,
+    SETTINGS_VERSION_KEY,
+    FaultsResource,
+    SettingsResource
+)
 from simulation.redis_helpers import redis_client
 from simulation.default_settings import DEFAULT_SETTINGS
 
@@ -28,6 +33,13 @@ class TestPutSettingsResource(TestCase):
         resp = self.simulate_put('/settings', body=json.dumps(data))
         assert resp.status_code == 400
 
+    def test_sending_invalid_values(self):
+        for data in ({'timeout': 'abc'}, {'pool_maxsize': '2.5'}, {'retries': 'yes'},
+                     {'failure_rate_threshold': None}, {'latency_injection': 'sometimes'}):
+            resp = self.simulate_put('/settings', body=json.dumps(data))
+            assert resp.status_code == 400
+        assert redis.hgetall('settings') == {}
+
     def test_adds_outages(self):
         data = {'outages': ['recommendations']}
         resp = self.simulate_put('/settings', body=json.dumps(data))
@@ -89,6 +101,73 @@ class TestPutSettingsResource(TestCase):
         assert resp.json == expected_settings
 
 
+PROFILE = {
+    'latency': {'distribution': 'fixed', 'seconds': 0.1},
+    'error_rate': 0.1,
+    'error_statuses': [503],
+    'reset_rate': 0
+}
+
+
+class TestFaultProfileSettings(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.api.add_route('/settings', SettingsResource())
+        redis.flushdb()
+
+    def test_put_replaces_fault_profiles(self):
+        redis.hset(FAULT_PROFILES_KEY, '/popular_items', json.dumps(PROFILE))
+        data = {'fault_profiles': {'/recommendations': PROFILE}}
+        resp = self.simulate_put('/settings', body=json.dumps(data))
+
+        assert resp.json == data
+        assert set(redis.hgetall(FAULT_PROFILES_KEY)) == {'/recommendations'}
+        assert json.loads(redis.hget(FAULT_PROFILES_KEY, '/recommendations')) == PROFILE
+
+    def test_put_fills_in_defaults(self):
+        data = {'fault_profiles': {'/recommendations': {'error_rate': 0.5}}}
+        resp = self.simulate_put('/settings', body=json.dumps(data))
+
+        assert resp.json['fault_profiles']['/recommendations'] == {
+            'error_rate': 0.5, 'error_statuses': [500], 'reset_rate': 0}
+
+    def test_put_clears_fault_profiles(self):
+        redis.hset(FAULT_PROFILES_KEY, '/popular_items', json.dumps(PROFILE))
+        self.simulate_put('/settings', body=json.dumps({'fault_profiles': {}}))
+        assert redis.hgetall(FAULT_PROFILES_KEY) == {}
+
+    def test_rejects_invalid_profiles(self):
+        version = redis.get(SETTINGS_VERSION_KEY)
+
+        for profiles in ([], {'/recommendations': {'error_rate': 2}}):
+            resp = self.simulate_put('/settings', body=json.dumps({'fault_profiles': profiles}))
+            assert resp.status_code == 400
+
+        assert redis.get(SETTINGS_VERSION_KEY) == version
+        assert redis.hgetall(FAULT_PROFILES_KEY) == {}
+
+    def test_patch_changes_and_removes_profiles(self):
+        redis.hset(FAULT_PROFILES_KEY, '/popular_items', json.dumps(PROFILE))
+        redis.hset(FAULT_PROFILES_KEY, '/authenticate', json.dumps(PROFILE))
+        data = {'fault_profiles': {'/popular_items': None, '/recommendations': PROFILE}}
+        resp = self.simulate_patch('/settings', body=json.dumps(data))
+
+        assert resp.json == {'fault_profiles': {'/authenticate': PROFILE,
+                                                '/recommendations': PROFILE}}
+        assert set(redis.hgetall(FAULT_PROFILES_KEY)) == {'/authenticate', '/recommendations'}
+
+    def test_patch_with_other_settings(self):
+        data = {'timeout': 1, 'fault_profiles': {'/recommendations': PROFILE}}
+        resp = self.simulate_patch('/settings', body=json.dumps(data))
+        assert resp.json == data
+
+    def test_get_includes_fault_profiles(self):
+        data = {'fault_profiles': {'/recommendations': PROFILE}}
+        self.simulate_put('/settings', body=json.dumps(data))
+        resp = self.simulate_get('/settings')
+        assert resp.json == {'fault_profiles': {'/recommendations': PROFILE}}
+
+
 class TestPatchSettingsResource(TestCase):
     def setUp(self):
         super().setUp()
@@ -104,6 +183,12 @@ class TestPatchSettingsResource(TestCase):
         resp = self.simulate_patch('/settings', body=json.dumps(data))
         assert resp.status_code == 400
 
+    def test_sending_invalid_values(self):
+        data = {'retries': True, 'bulkhead_max_concurrent': 'abc'}
+        resp = self.simulate_patch('/settings', body=json.dumps(data))
+        assert resp.status_code == 400
+        assert redis.hgetall('settings') == {}
+
     def test_adds_outages(self):
         data = {'outages': ['recommendations']}
         resp = self.simulate_patch('/settings', body=json.dumps(data))
@@ -165,3 +250,66 @@ class TestPatchSettingsResource(TestCase):
         resp = self.simulate_get('/settings')
         assert resp.json == expected_settings
 
+    def test_sets_none_value(self):
+        expected_settings = {
+            'deadline': None
+        }
+
+        data = {'deadline': None}
+        self.simulate_patch('/settings', body=json.dumps(data))
+
+        resp = self.simulate_get('/settings')
+        assert resp.json == expected_settings
+
+    def test_patch_keeps_fault_paths(self):
+        resp = self.simulate_patch('/settings', body=json.dumps({
+            'timeout': 5,
+            'outages': ['/recommendations']
+        }))
+
+        assert resp.json == {'timeout': 5, 'outages': ['/recommendations']}
+        assert redis.smembers('outages') == {'/recommendations'}
+
+
+class TestSettingsVersion(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.api.add_route('/settings', SettingsResource())
+        self.api.add_route('/settings/faults', FaultsResource())
+        redis.flushdb()
+
+    def test_changes_increment_version(self):
+        self.simulate_put('/settings', body=json.dumps({'timeout': 1}))
+        self.simulate_patch('/settings', body=json.dumps({'timeout': 2}))
+        self.simulate_post('/settings/faults', body=json.dumps({'outages': {'add': ['/a']}}))
+        assert redis.get(SETTINGS_VERSION_KEY) == '3'
+
+    def test_rejected_changes_keep_version(self):
+        self.simulate_put('/settings', body='boo')
+        assert redis.get(SETTINGS_VERSION_KEY) is None
+
+
+class TestFaultsResource(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.api.add_route('/settings/faults', FaultsResource())
+        redis.flushdb()
+        redis.sadd('outages', '/popular_items', '/authenticate')
+
+    def test_adds_and_removes_faults(self):
+        resp = self.simulate_post('/settings/faults', body=json.dumps({
+            'outages': {'add': ['/recommendations', '/home'], 'remove': ['/popular_items']},
+            'performance_problems': {'add': ['/recommendations']}
+        }))
+
+        assert resp.status_code == 200
+        assert set(resp.json['outages']) == {'/recommendations', '/home', '/authenticate'}
+        assert resp.json['performance_problems'] == ['/recommendations']
+        assert redis.smembers('outages') == {'/recommendations', '/home', '/authenticate'}
+
+    def test_rejects_invalid_faults(self):
+        for body in ('boo', '{}', '{"timeout": {}}', '{"outages": ["/a"]}',
+                     '{"outages": {"clear": []}}', '{"outages": {"add": [1]}}'):
+            assert self.simulate_post('/settings/faults', body=body).status_code == 400
+
+        assert redis.smembers('outages') == {'/popular_items', '/authenticate'}
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+from unittest import mock
+
+import redis as redis_lib
+from falcon.testing import TestCase
+
+from simulation import settings
+from simulation.default_settings import DEFAULT_SETTINGS
+from simulation.redis_helpers import redis_client
+from simulation.faults import FaultProfile
+from simulation.settings import (
+    FAULT_PROFILES_KEY,
+    OUTAGES_KEY,
+    PERFORMANCE_PROBLEMS_KEY,
+    SETTINGS_CHANNEL,
+    SETTINGS_KEY,
+    SETTINGS_VERSION_KEY,
+    SettingsResource
+)
+from simulation.settings_snapshot import SettingsSnapshot
+
+
+redis = redis_client()
+
+
+class TestSettingsSnapshot(TestCase):
+    def setUp(self):
+        super().setUp()
+        redis.flushdb()
+        self.snapshot = SettingsSnapshot(redis, poll_interval=60, subscribe=False)
+
+    def test_reads_outages(self):
+        redis.sadd(OUTAGES_KEY, '/recommendations')
+        assert self.snapshot.is_outage('/recommendations')
+        assert not self.snapshot.is_outage('/popular_items')
+
+    def test_reads_performance_problems(self):
+        redis.sadd(PERFORMANCE_PROBLEMS_KEY, '/recommendations')
+        assert self.snapshot.has_performance_problem('/recommendations')
+        assert not self.snapshot.has_performance_problem('/popular_items')
+
+    def test_reads_fault_profiles(self):
+        redis.hset(FAULT_PROFILES_KEY, '/recommendations', json.dumps({'error_rate': 0.5}))
+        redis.hset(FAULT_PROFILES_KEY, '/popular_items', json.dumps({'error_rate': 5}))
+
+        assert self.snapshot.fault_profile('/recommendations') == FaultProfile(error_rate=0.5)
+        # Invalid profiles are ignored.
+        assert self.snapshot.fault_profile('/popular_items') is None
+        assert self.snapshot.fault_profile('/authenticate') is None
+
+    def test_does_not_read_redis_until_poll_interval(self):
+        assert not self.snapshot.is_outage('/recommendations')
+        redis.sadd(OUTAGES_KEY, '/recommendations')
+        assert not self.snapshot.is_outage('/recommendations')
+
+    @mock.patch('time.monotonic')
+    def test_reads_redis_after_poll_interval(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        assert not self.snapshot.is_outage('/recommendations')
+        redis.sadd(OUTAGES_KEY, '/recommendations')
+        mock_monotonic.return_value = 160
+        assert self.snapshot.is_outage('/recommendations')
+
+    def test_refresh_reads_redis(self):
+        assert not self.snapshot.is_outage('/recommendations')
+        redis.sadd(OUTAGES_KEY, '/recommendations')
+        self.snapshot.refresh()
+        assert self.snapshot.is_outage('/recommendations')
+
+    def test_keeps_last_settings_when_redis_fails(self):
+        redis.sadd(OUTAGES_KEY, '/recommendations')
+        self.snapshot.refresh()
+
+        with mock.patch.object(redis, 'smembers', side_effect=redis_lib.ConnectionError):
+            self.snapshot.refresh()
+
+        assert self.snapshot.is_outage('/recommendations')
+
+
+    def test_skips_reading_unchanged_version(self):
+        redis.set(SETTINGS_VERSION_KEY, 1)
+        self.snapshot.refresh()
+        redis.sadd(OUTAGES_KEY, '/recommendations')
+
+        with mock.patch.object(redis, 'pipeline', wraps=redis.pipeline) as mock_pipeline:
+            self.snapshot.refresh()
+        assert not mock_pipeline.called
+        assert not self.snapshot.is_outage('/recommendations')
+
+        redis.incr(SETTINGS_VERSION_KEY)
+        self.snapshot.refresh()
+        assert self.snapshot.is_outage('/recommendations')
+
+class TestSettingsNotifications(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.api.add_route('/settings', SettingsResource())
+        redis.flushdb()
+        self.pubsub = settings.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(SETTINGS_CHANNEL)
+
+    def tearDown(self):
+        self.pubsub.unsubscribe()
+
+    def _messages(self):
+        # The first message is the (ignored) subscribe confirmation.
+        messages = (self.pubsub.get_message() for _ in range(3))
+        return [m for m in messages if m]
+
+    def test_put_publishes_change(self):
+        self.simulate_put('/settings', body=json.dumps({'outages': []}))
+        assert [m['channel'] for m in self._messages()] == [SETTINGS_CHANNEL]
+
+    def test_patch_publishes_change(self):
+        self.simulate_patch('/settings', body=json.dumps({'outages': []}))
+        assert [m['channel'] for m in self._messages()] == [SETTINGS_CHANNEL]
+
+
+class Watcher:
+    def __init__(self):
+        self.settings = []
+        self.resets = 0
+
+    def settings_changed(self, settings):
+        self.settings.append(settings)
+
+    def reset(self):
+        self.resets += 1
+
+
+class TestSettingsSnapshotWatchers(TestCase):
+    def setUp(self):
+        super().setUp()
+        redis.flushdb()
+        self.snapshot = SettingsSnapshot(redis, poll_interval=60, subscribe=False)
+        self.snapshot.refresh()
+        self.api.add_route('/settings', SettingsResource())
+
+    def test_notifies_watchers_of_changes(self):
+        watcher = Watcher()
+        self.snapshot.watch(watcher.settings_changed)
+        redis.hmset(SETTINGS_KEY, {'timeout': 5})
+        self.snapshot.refresh()
+        assert len(watcher.settings) == 1
+        assert watcher.settings[0]['timeout'] == '5'
+        assert watcher.settings[0]['retries'] == DEFAULT_SETTINGS['retries']
+
+    def test_does_not_notify_watchers_without_changes(self):
+        watcher = Watcher()
+        self.snapshot.watch(watcher.settings_changed)
+        self.snapshot.refresh()
+        assert watcher.settings == []
+
+    def test_does_not_keep_watchers_alive(self):
+        watcher = Watcher()
+        self.snapshot.watch(watcher.settings_changed)
+        del watcher
+        redis.hmset(SETTINGS_KEY, {'timeout': 5})
+        self.snapshot.refresh()
+        assert self.snapshot._watchers == []
+
+    def test_resets_watchers_when_simulation_starts(self):
+        watcher = Watcher()
+        self.snapshot.watch_reset(watcher.reset)
+
+        # Even with the same settings, a PUT starts a new simulation.
+        for _ in range(2):
+            self.simulate_put('/settings', body=json.dumps({'timeout': 5}))
+            self.snapshot.refresh()
+        assert watcher.resets == 2
+
+        self.simulate_patch('/settings', body=json.dumps({'timeout': 1}))
+        self.snapshot.refresh()
+        assert watcher.resets == 2
+
+    def test_new_process_does_not_reset(self):
+        self.simulate_put('/settings', body=json.dumps({'timeout': 5}))
+        snapshot = SettingsSnapshot(redis, poll_interval=60, subscribe=False)
+        watcher = Watcher()
+        snapshot.watch_reset(watcher.reset)
+        snapshot.refresh()
+        assert watcher.resets == 0
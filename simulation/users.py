@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import uuid
+
+
+# Users' UUIDs are derived from their tokens, so that a token always belongs
+# to the same user, whose recommendations can be loaded ahead of time.
+USER_NAMESPACE = uuid.UUID('5d1b7c3e-6a0f-4b8e-9c2d-7f4a1e0b3c6d')
+
+
+def user_uuid(token):
+    """Return the UUID of the user that ``token`` belongs to."""
+    return str(uuid.uuid5(USER_NAMESPACE, token))
+
+
+def user_token(user):
+    """Return the token of simulated user number ``user``, e.g. ``Token 0x123``."""
+    return 'Token {:#x}'.format(user)
+
+
+def simulated_user_uuids(users):
+    """Yield the UUIDs of simulated users 0 to ``users - 1``."""
+    for user in range(users):
+        yield user_uuid(user_token(user))